@@ -0,0 +1,105 @@
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import resource
+import time
+from common.utils import logo
+
+
+def peak_rss():
+    # peak resident set size of this process in MB (ru_maxrss is in KB on linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_design(path, queue):
+    # runs in a fresh process so the peak rss belongs to this design only
+    from file.bench import bench2circuit
+    base_rss = peak_rss()
+    start = time.time()
+    circuit = bench2circuit(path)
+    wires = circuit.wire_objs
+    load_time = time.time() - start
+    start = time.time()
+    circuit.create_ce_circuit()
+    level_time = time.time() - start
+    queue.put((len(wires), load_time, level_time, base_rss, peak_rss()))
+
+
+def measure(path):
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=load_design, args=(path, queue))
+    p.start()
+    p.join()
+    if p.exitcode != 0 or queue.empty():
+        logging.critical('loading {} failed'.format(path))
+        return None
+    return queue.get()
+
+
+def read_results(path):
+    results = {}
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            results[row['design']] = row
+    return results
+
+
+if __name__ == "__main__":
+    logo()
+    parser = argparse.ArgumentParser(description='Peak memory and load time of every benchmark')
+    parser.add_argument("-p", action="store", default=0, type=int, help="print info=1 and debug=2, default warning=0")
+    parser.add_argument("-b", action="store", default='benchmarks/bench', type=str, help="benchmark folder, default=benchmarks/bench")
+    parser.add_argument("-o", action="store", default=None, type=str, help="write results to this csv file")
+    parser.add_argument("-c", action="store", default=None, type=str, help="compare with the results of a previous csv file")
+    parser.add_argument("-t", action="store", default=10, type=float, help="allowed memory increase in percent when comparing, default=10")
+    args = parser.parse_args()
+
+    if args.p == 0:
+        logging.getLogger().setLevel(level=logging.ERROR)
+    elif args.p == 1:
+        logging.getLogger().setLevel(level=logging.INFO)
+    elif args.p == 2:
+        logging.getLogger().setLevel(level=logging.DEBUG)
+
+    paths = []
+    for root, dirs, files in os.walk(args.b):
+        for f in files:
+            if f.endswith('.bench'):
+                paths.append(os.path.join(root, f))
+    paths.sort()
+
+    previous = read_results(args.c) if args.c else {}
+    fields = ['design', 'wires', 'load_s', 'levelize_s', 'rss_mb', 'delta_mb']
+    rows = []
+    regressions = 0
+    print('{:<48}{:>10}{:>10}{:>12}{:>10}{:>10}'.format(*fields))
+    for path in paths:
+        r = measure(path)
+        if r is None:
+            continue
+        n_wires, load_time, level_time, base_rss, rss = r
+        row = {'design': os.path.relpath(path, args.b), 'wires': n_wires, 'load_s': '{:.3f}'.format(load_time),
+               'levelize_s': '{:.3f}'.format(level_time), 'rss_mb': '{:.1f}'.format(rss),
+               'delta_mb': '{:.1f}'.format(rss - base_rss)}
+        rows.append(row)
+        line = '{:<48}{:>10}{:>10}{:>12}{:>10}{:>10}'.format(*[row[k] for k in fields])
+
+        old = previous.get(row['design'])
+        # compare the memory used by the design itself, differences below 1 MB are noise
+        growth = float(row['delta_mb']) - float(old['delta_mb']) if old else 0
+        if growth > 1 and growth > float(old['delta_mb']) * args.t / 100:
+            line += '  regression (was {} MB)'.format(old['delta_mb'])
+            regressions += 1
+        print(line)
+
+    if args.o:
+        with open(args.o, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    if regressions:
+        logging.critical('{} designs use more memory than before'.format(regressions))
+        exit(1)
@@ -1,5 +1,6 @@
 import logging
 import random
+from collections import deque
 
 
 class Wire:
@@ -8,6 +9,10 @@ class Wire:
     DFF = "dff"
     LAT = 'lat'
 
+    # rarely used analysis values (prob0, prob1, absprob, delay, slack, ...) live in Circuit.side_table
+    __slots__ = ('name', 'type', 'operands', 'index', 'instance', 'mark', 'logic_level', 'fanout', 'tag', 'fanouts',
+                 'lit', 'formula')
+
     def __init__(self, cell_name, cell_type, operands):
         self.name = cell_name
         self.type = cell_type
@@ -17,14 +22,9 @@ class Wire:
 
         self.mark = 0
         self.logic_level = -1
-        self.prob0 = 0.5  # initial value should be 0.5 for inputs
-        self.prob1 = 0.5  # initial value should be 0.5 for inputs
-        self.absprob = 0
         self.fanout = 0
         self.tag = 0
-        self.delay = 0
-        self.slack = 0
-        self.fanouts = []
+        self.fanouts = ()
         self.lit = 0
         self.formula = None
 
@@ -50,6 +50,9 @@ class Circuit:
         self.max_level = None
         self.b2b = True
         self.mainout = False
+        self.fanout_index = None
+        self.side_tables = {}
+        self.netlist = None
         self.wire_objs = None
         self.state_wires = None
         self.sorted_wires = None
@@ -58,20 +61,110 @@ class Circuit:
         self.key_value = ""
         self.clk = 'CK'
 
+    def side_table(self, name):
+        # optional per-wire values keyed by wire name, e.g. side_table('prob1')[w]
+        return self.side_tables.setdefault(name, {})
+
     def get_random_wire(self):
         return list(self.wire_objs.keys())[random.randint(0, len(self.wire_objs) - 1)]
 
     def get_random_input(self):
         return list(self.input_wires.keys())[random.randint(0, len(self.input_wires) - 1)]
 
+    @property
+    def wire_objs(self):
+        # wire objects of parsed netlists are created on first use, with their fanouts
+        if self._wire_objs is None and self.netlist is not None:
+            self._wire_objs = self.netlist.to_wires()
+            self.build_fanout_index()
+        return self._wire_objs
+
+    @wire_objs.setter
+    def wire_objs(self, wires):
+        # a new set of wires gets a new fanout index and drops the parsed netlist
+        # the fanouts of the wire objects are those of this circuit, circuits should not share wire objects
+        self._wire_objs = wires
+        self.fanout_index = None
+        self.cone_index = None
+        self.sorted_wires = None
+        self.side_tables = {}
+        self.netlist = None
+        if wires is not None:
+            self.build_fanout_index()
+
+    def build_fanout_index(self):
+        # maps every driver name (wire or input) to the wires reading it
+        wires = self.wire_objs
+        self.fanout_index = {}
+        for w in wires:
+            wires[w].fanouts = self.fanout_index.setdefault(w, [])
+        for w in wires:
+            for o in dict.fromkeys(wires[w].operands):
+                self.fanout_index.setdefault(o, []).append(w)
+        for w in wires:
+            wires[w].fanout = len(wires[w].fanouts)
+
     def fan_outs(self, wire):
-        fan_out = []
-        for w in self.wire_objs:
-            if wire in self.wire_objs[w].operands:
-                fan_out.append(w)
-        return fan_out
+        if self.fanout_index is None:
+            self.build_fanout_index()
+        return list(self.fanout_index.get(wire, []))
+
+    def update_fanout(self, name):
+        if name in self.wire_objs:
+            self.wire_objs[name].fanout = len(self.wire_objs[name].fanouts)
+
+    def add_wire(self, wire):
+        # adds a wire or replaces the wire with the same name
+        if wire.name in self.wire_objs:
+            self.remove_wire(wire.name)
+        self.wire_objs[wire.name] = wire
+        self.netlist = None
+        self.cone_index = None
+        self.sorted_wires = None
+        if self.fanout_index is not None:
+            wire.fanouts = self.fanout_index.setdefault(wire.name, [])
+            wire.fanout = len(wire.fanouts)
+            for o in dict.fromkeys(wire.operands):
+                self.fanout_index.setdefault(o, []).append(wire.name)
+                self.update_fanout(o)
+
+    def remove_wire(self, name):
+        wire = self.wire_objs.pop(name)
+        self.netlist = None
+        self.cone_index = None
+        self.sorted_wires = None
+        if self.fanout_index is not None:
+            for o in dict.fromkeys(wire.operands):
+                self.fanout_index[o].remove(name)
+                self.update_fanout(o)
+        return wire
+
+    def rename_wire(self, name, new_name):
+        # renames a signal, its driver (if any) and all of its readers
+        if self.fanout_index is None:
+            self.build_fanout_index()
+        self.netlist = None
+        self.cone_index = None
+        self.sorted_wires = None
+        readers = self.fanout_index.pop(name, [])
+        for w in readers:
+            wire = self.wire_objs[w]
+            wire.operands = [new_name if o == name else o for o in wire.operands]
+        fanouts = self.fanout_index.setdefault(new_name, [])
+        fanouts.extend(readers)
+        if name in self.wire_objs:
+            wire = self.wire_objs.pop(name)
+            wire.name = new_name
+            for o in dict.fromkeys(wire.operands):
+                readers = self.fanout_index[o]
+                readers[readers.index(name)] = new_name
+            wire.fanouts = fanouts
+            wire.fanout = len(fanouts)
+            self.wire_objs[new_name] = wire
 
     def create_ce_circuit(self):
+        # levelized first, the order of a levelized netlist is only used before its wires are handed out
+        self.levelize()
         self.state_wires = []
         self.next_state_wires = []
         wires = self.wire_objs
@@ -79,55 +172,122 @@ class Circuit:
             if wires[w].type == Wire.DFF:
                 self.state_wires.append(w)
                 self.next_state_wires.append(wires[w].operands[0])
-        # sort wires so the gate outputs are before gate inputs
-        self.sorted_wires = []
-        while len(wires) != len(self.sorted_wires):
-            for w in wires:
-                if wires[w].logic_level != -1:
-                    continue
-                elif wires[w].type == Wire.DFF:
-                    wires[w].logic_level = 0
-                    self.sorted_wires.append(w)
-                else:
-                    available = True
-                    level = 0
-                    for o in wires[w].operands:
-                        if (o not in self.sorted_wires) and (o not in self.input_wires) and (o not in self.key_wires):
-                            available = False
-                            break
-                        else:
-                            if (o in self.input_wires) or (o in self.key_wires):
-                                level = max(level, 0)
-                            else:
-                                level = max(level, wires[o].logic_level)
-                    if available:
-                        wires[w].logic_level = level + 1
-                        self.sorted_wires.append(w)
+
+    def levelize(self):
+        # sort wires so the gate outputs are before gate inputs (kahn's algorithm on integer wire ids)
+        # primary inputs, key inputs and dffs are the sources of the combinational logic
+        if self._wire_objs is None and self.netlist is not None and self.netlist.order is not None:
+            # netlists from the cache are levelized already, the wires are created here in the order of its gates
+            # and nobody could have changed them yet
+            wires = self.wire_objs
+            names = self.netlist.names
+            for i, w in enumerate(wires):
+                wires[w].index = i
+            gate_out = self.netlist.gate_out
+            level = self.netlist.level
+            self.sorted_wires = [names[gate_out[g]] for g in self.netlist.order]
+            for g in range(len(gate_out)):
+                wires[names[gate_out[g]]].logic_level = level[g]
+            self.max_level = max(level) if len(level) else 0
+            return
+        wires = self.wire_objs
+        names = list(wires)
+        for i, w in enumerate(names):
+            wires[w].index = i
+            wires[w].logic_level = -1
+        n = len(names)
+        sources = set(self.input_wires) | set(self.key_wires)
+
+        # fanout adjacency in compressed sparse row form and number of unresolved operands of each wire
+        in_degree = [0] * n
+        fanout_count = [0] * (n + 1)
+        for i, w in enumerate(names):
+            if wires[w].type == Wire.DFF:
+                continue
+            for o in wires[w].operands:
+                if o in wires:
+                    in_degree[i] += 1
+                    fanout_count[wires[o].index + 1] += 1
+                elif o not in sources:
+                    logging.critical('wire {} is used by {} but is not driven'.format(o, w))
+                    exit()
+        fanout_ptr = fanout_count
+        for i in range(n):
+            fanout_ptr[i + 1] += fanout_ptr[i]
+        fanout_idx = [0] * fanout_ptr[n]
+        fill = fanout_ptr[:n]
+        for i, w in enumerate(names):
+            if wires[w].type == Wire.DFF:
+                continue
+            for o in wires[w].operands:
+                if o in wires:
+                    j = wires[o].index
+                    fanout_idx[fill[j]] = i
+                    fill[j] += 1
+
+        level = [0] * n
+        order = [i for i in range(n) if in_degree[i] == 0]
+        head = 0
+        while head < len(order):
+            i = order[head]
+            head += 1
+            if wires[names[i]].type != Wire.DFF:
+                level[i] += 1
+            for k in range(fanout_ptr[i], fanout_ptr[i + 1]):
+                j = fanout_idx[k]
+                if level[i] > level[j]:
+                    level[j] = level[i]
+                in_degree[j] -= 1
+                if in_degree[j] == 0:
+                    order.append(j)
+
+        if len(order) != n:
+            logging.critical('combinational loop found: {}'.format(' -> '.join(self.find_loop(in_degree, names))))
+            exit()
+
+        self.sorted_wires = [names[i] for i in order]
+        for i in order:
+            wires[names[i]].logic_level = level[i]
+        self.max_level = max(level) if n else 0
+
+    def find_loop(self, in_degree, names):
+        # follow unresolved operands until a wire repeats
+        wires = self.wire_objs
+        w = names[next(i for i in range(len(names)) if in_degree[i] > 0)]
+        path = []
+        visited = {}
+        while w not in visited:
+            visited[w] = len(path)
+            path.append(w)
+            w = next(o for o in wires[w].operands if o in wires and in_degree[wires[o].index] > 0)
+        return path[visited[w]:] + [w]
+
+    def cones(self):
+        # fanin/fanout cones, supports and depths of the current netlist (see common.cone)
+        # changes to the wires drop the index and the order, the circuit is levelized again if needed
+        if self.cone_index is None:
+            from common.cone import ConeIndex
+            if self.sorted_wires is None:
+                self.levelize()
+            self.cone_index = ConeIndex(self)
+        return self.cone_index
 
     def max_dep(self, wire):
         # calculates depth of a wire object (logic level)
-        if self.wire_objs[wire].type == "inp":
-            return 0
-        elif self.wire_objs[wire].logic_level != 0:
-            return wire.logic_level
-        else:
-            max = 0
-            for i in range(len(self.wire_objs[wire].operands)):
-                curr = self.max_dep(self.wire_objs[wire].operands[i])
-                if curr > max:
-                    max = curr
-        return max+1
+        return self.cones().depth(wire)
 
     def get_fanin_cone(self, wire):
-        visited, queue = [], [wire]
+        # wires reachable backwards from wire (including it) in breadth first order, also through dffs
+        # inputs end the search
+        visited = {wire: None}
+        queue = deque([wire])
         while queue:
-            vertex = queue.pop(0)
-            if vertex not in visited:
-                visited.append(vertex)
-                for v in self.wire_objs[vertex].operands:
-                    # if (v.type != Wire.DFF) and (v.type != Wire.INPUT):
+            w = queue.popleft()
+            for v in self.wire_objs[w].operands if w in self.wire_objs else ():
+                if v not in visited:
+                    visited[v] = None
                     queue.append(v)
-        return visited
+        return list(visited)
 
 
 def sort_circuits(ora_cir, obf_cir):
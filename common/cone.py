@@ -0,0 +1,154 @@
+from common.circuit import Wire
+
+
+def bit_ids(bits):
+    # positions of the set bits of an int
+    ids = []
+    while bits:
+        low = bits & -bits
+        ids.append(low.bit_length() - 1)
+        bits ^= low
+    return ids
+
+
+class ConeIndex:
+    # fanin/fanout cones and support sets of the combinational logic as python int bitsets (bit i is wire i)
+    # sources (inputs, keys, dffs) come first, then the gates in topological order, so the bitsets of
+    # supports stay as small as the number of sources; dffs end the cones like in levelize
+    # every query is memoized for all wires in its cone, queries are iterative
+    # the circuit should be levelized after its last change
+    def __init__(self, circuit):
+        self.circuit = circuit
+        wires = circuit.wire_objs
+        if circuit.sorted_wires is None or len(circuit.sorted_wires) != len(wires) or \
+                any(w not in wires for w in circuit.sorted_wires):
+            raise ValueError('circuit {} is not levelized'.format(circuit.name))
+
+        sources = dict.fromkeys(list(circuit.input_wires) + list(circuit.key_wires))
+        for w in circuit.sorted_wires:
+            if wires[w].type in (Wire.DFF, Wire.INPUT):
+                sources[w] = None
+        for w in circuit.sorted_wires:
+            for o in wires[w].operands:
+                if o not in wires and o not in sources:
+                    # undriven signals, e.g. clocks of verilog netlists
+                    sources[o] = None
+        self.names = list(sources)
+        self.n_sources = len(self.names)
+        self.names += [w for w in circuit.sorted_wires if w not in sources]
+        self.ids = dict((w, i) for i, w in enumerate(self.names))
+
+        n = len(self.names)
+        self.operands = [()] * n
+        self.fanouts = [[] for i in range(n)]
+        self.state_input = {}
+        for w in circuit.sorted_wires:
+            i = self.ids[w]
+            ops = [self.ids[o] for o in dict.fromkeys(wires[w].operands)]
+            if wires[w].type == Wire.DFF:
+                self.state_input[i] = ops
+            else:
+                self.operands[i] = ops
+            for j in ops:
+                self.fanouts[j].append(i)
+        # fanouts that do not go through a dff
+        self.comb_fanouts = [() if j in self.state_input else f for j, f in enumerate(self.fanouts)]
+
+        self.input_mask = sum(1 << self.ids[w] for w in circuit.input_wires)
+        self.key_mask = sum(1 << self.ids[w] for w in circuit.key_wires)
+        self.state_mask = sum(1 << i for i in self.state_input)
+        self.fanin_memo = [None] * n
+        self.fanout_memo = [None] * n
+        self.support_memo = [None] * n
+        self.depth_memo = [None] * n
+        self.key_fanout_memo = None
+
+    def cone(self, i, edges, memo, leaf):
+        # memo[j] = bit j | memo of all edges[j], leaf(j) is the value of wires without edges
+        stack = [i]
+        while stack:
+            j = stack[-1]
+            if memo[j] is not None:
+                stack.pop()
+                continue
+            pending = [k for k in edges[j] if memo[k] is None]
+            if pending:
+                stack.extend(pending)
+                continue
+            bits = leaf(j)
+            for k in edges[j]:
+                bits |= memo[k]
+            memo[j] = bits
+            stack.pop()
+        return memo[i]
+
+    def fanin(self, w):
+        # wires of the fanin cone of w (including w), a dff includes the cone of its input
+        i = self.ids[w]
+        bits = self.cone(i, self.operands, self.fanin_memo, lambda j: 1 << j)
+        for j in self.state_input.get(i, ()):
+            bits |= self.cone(j, self.operands, self.fanin_memo, lambda k: 1 << k)
+        return bits
+
+    def fanout(self, w):
+        # wires of the fanout cone of w (including w), dffs end the cone
+        i = self.ids[w]
+        bits = self.cone(i, self.comb_fanouts, self.fanout_memo, lambda j: 1 << j)
+        if i in self.state_input:
+            for j in self.fanouts[i]:
+                bits |= self.cone(j, self.comb_fanouts, self.fanout_memo, lambda k: 1 << k)
+        return bits
+
+    def key_fanout(self):
+        # wires that depend on a key input, also through dffs: the key dependent region of the circuit
+        # the other wires are equal for any two keys as long as the states start equal
+        if self.key_fanout_memo is None:
+            bits = 0
+            for w in self.circuit.key_wires:
+                bits |= self.fanout(w)
+            expanded = 0
+            pending = bits & self.state_mask
+            while pending:
+                expanded |= pending
+                for i in bit_ids(pending):
+                    bits |= self.fanout(self.names[i])
+                pending = bits & self.state_mask & ~expanded
+            self.key_fanout_memo = bits
+        return self.key_fanout_memo
+
+    def support(self, w):
+        # sources (inputs, keys and dffs) that w depends on
+        i = self.ids[w]
+        if i < self.n_sources:
+            return 1 << i
+        return self.cone(i, self.operands, self.support_memo, lambda j: 1 << j if j < self.n_sources else 0)
+
+    def input_support(self, w):
+        return self.wire_names(self.support(w) & self.input_mask)
+
+    def key_support(self, w):
+        return self.wire_names(self.support(w) & self.key_mask)
+
+    def state_support(self, w):
+        return self.wire_names(self.support(w) & self.state_mask)
+
+    def depth(self, w):
+        # logic level of w, sources are at level 0
+        i = self.ids[w]
+        memo = self.depth_memo
+        stack = [i]
+        while stack:
+            j = stack[-1]
+            if memo[j] is not None:
+                stack.pop()
+                continue
+            pending = [k for k in self.operands[j] if memo[k] is None]
+            if pending:
+                stack.extend(pending)
+                continue
+            memo[j] = 1 + max(memo[k] for k in self.operands[j]) if self.operands[j] else 0
+            stack.pop()
+        return memo[i]
+
+    def wire_names(self, bits):
+        return [self.names[i] for i in bit_ids(bits)]
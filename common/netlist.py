@@ -0,0 +1,171 @@
+import logging
+from array import array
+from common.circuit import Wire, Circuit
+
+# gate type codes, the index of a type is its code
+GATE_TYPES = ['inp', 'dff', 'not', 'buf', 'and', 'nand', 'or', 'nor', 'xor', 'xnor', 'mux', 'lat']
+GATE_CODES = {t: c for c, t in enumerate(GATE_TYPES)}
+
+# checked in this order since the cell names of some netlists only contain the type (e.g. NAND2X1)
+GATE_MATCH = ['dff', 'nand', 'and', 'xnor', 'xor', 'nor', 'or', 'not', 'buf', 'mux']
+gate_code_cache = {}
+
+
+def gate_code(gate_type):
+    code = gate_code_cache.get(gate_type)
+    if code is None:
+        name = gate_type.lower()
+        for t in GATE_MATCH:
+            if t in name:
+                code = GATE_CODES[t]
+                break
+        else:
+            logging.critical('undefined gate type: {}'.format(gate_type))
+            exit()
+        gate_code_cache[gate_type] = code
+    return code
+
+
+def check_arity(code, n_operands):
+    gate_type = GATE_TYPES[code]
+    if gate_type in ('dff', 'not', 'buf'):
+        return n_operands == 1
+    elif gate_type == 'mux':
+        return n_operands == 3
+    else:
+        return n_operands > 1
+
+
+class NameTable(dict):
+    # interns names to consecutive ids on first lookup
+    def __init__(self, names):
+        super().__init__()
+        self.names = names
+
+    def __missing__(self, name):
+        i = self[name] = len(self.names)
+        self.names.append(name)
+        return i
+
+
+class Netlist:
+    # struct-of-arrays netlist, wire names are interned to integer ids
+    # gate g drives wire gate_out[g] and reads fanin[fanin_ptr[g]:fanin_ptr[g+1]]
+    def __init__(self):
+        self.names = []
+        self.ids = NameTable(self.names)
+        self.gate_out = array('i')
+        self.gate_type = array('b')
+        self.fanin_ptr = array('i', [0])
+        self.fanin = array('i')
+        self.inputs = array('i')
+        self.outputs = array('i')
+        self.keys = array('i')
+        # verilog instance names of the gates (or None), and the result of levelize if it is known
+        self.tags = None
+        self.order = None
+        self.level = None
+
+    def intern(self, name):
+        return self.ids[name]
+
+    def add_gate(self, out, code, operands):
+        self.gate_out.append(out)
+        self.gate_type.append(code)
+        self.fanin.extend(operands)
+        self.fanin_ptr.append(len(self.fanin))
+
+    def n_gates(self):
+        return len(self.gate_out)
+
+    def check_drivers(self):
+        # every operand should be driven by a gate or be a primary input
+        driven = bytearray(len(self.names))
+        for i in self.inputs:
+            driven[i] = 1
+        for i in self.keys:
+            driven[i] = 1
+        for i in self.gate_out:
+            driven[i] = 1
+        for i in self.fanin:
+            if not driven[i]:
+                logging.critical('wire {} is used but is not connected to anywhere'.format(self.names[i]))
+                exit()
+
+    def levelize(self):
+        # the gate order and logic levels of Circuit.levelize on gate indices, dffs are sources
+        # keeps them in order and level, returns False if there is a combinational loop
+        n = len(self.gate_out)
+        dff = GATE_CODES['dff']
+        driver = array('i', [-1]) * len(self.names)
+        for g in range(n):
+            driver[self.gate_out[g]] = g
+        in_degree = [0] * n
+        fanouts = [[] for g in range(n)]
+        for g in range(n):
+            if self.gate_type[g] == dff:
+                continue
+            for o in self.fanin[self.fanin_ptr[g]:self.fanin_ptr[g + 1]]:
+                d = driver[o]
+                if d != -1:
+                    in_degree[g] += 1
+                    fanouts[d].append(g)
+
+        level = [0] * n
+        order = [g for g in range(n) if in_degree[g] == 0]
+        head = 0
+        while head < len(order):
+            g = order[head]
+            head += 1
+            if self.gate_type[g] != dff:
+                level[g] += 1
+            for h in fanouts[g]:
+                if level[g] > level[h]:
+                    level[h] = level[g]
+                in_degree[h] -= 1
+                if in_degree[h] == 0:
+                    order.append(h)
+        if len(order) != n:
+            return False
+        self.order = array('i', order)
+        self.level = array('i', level)
+        return True
+
+    def to_wires(self):
+        names = self.names
+        wires = {}
+        for g in range(len(self.gate_out)):
+            out = names[self.gate_out[g]]
+            operands = [names[i] for i in self.fanin[self.fanin_ptr[g]:self.fanin_ptr[g + 1]]]
+            wires[out] = Wire(out, GATE_TYPES[self.gate_type[g]], operands)
+            if self.tags is not None and self.tags[g]:
+                wires[out].tag = self.tags[g]
+        return wires
+
+
+def wires2netlist(wires):
+    # netlist of a dict of wire objects (e.g. read from verilog), gates keep their order and instance names
+    netlist = Netlist()
+    ids = netlist.ids
+    netlist.tags = []
+    for w in wires.values():
+        netlist.add_gate(ids[w.name], GATE_CODES[w.type], [ids[o] for o in w.operands])
+        netlist.tags.append(w.tag or '')
+    return netlist
+
+
+def netlist2circuit(netlist, path):
+    # circuit of a parsed or loaded netlist, its wire objects are created on first use
+    names = netlist.names
+    circuit = Circuit(path[path.rfind("/")+1:path.rfind(".")])
+    circuit.folder_path = path[:path.rfind("/")+1]
+    circuit.file_name = path[path.rfind("/")+1:]
+    circuit.input_wires = [names[i] for i in netlist.inputs]
+    circuit.output_wires = [names[i] for i in netlist.outputs]
+    circuit.key_wires = [names[i] for i in netlist.keys]
+    circuit.netlist = netlist
+
+    logging.warning(
+        'circuit: {}, inputs: {}, outputs: {}, keyinputs: {}'.format(circuit.name, len(circuit.input_wires), len(circuit.output_wires),
+                                                                     len(circuit.key_wires)))
+    return circuit
@@ -0,0 +1,108 @@
+import csv
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+
+def rounded(values):
+    return {k: round(v, 6) if isinstance(v, float) else v for k, v in values.items()}
+
+
+class Profiler:
+    # named time spans and counters of an attack run, kept per iteration and in total
+    # spans should not be nested, counters can be any number (e.g. clauses or subprocess seconds)
+    def __init__(self):
+        self.path = None
+        self.start = time.time()
+        self.last_dump = self.start
+        self.totals = {}
+        self.counters = {}
+        self.current = {}
+        self.iterations = []
+
+    def open(self, path):
+        # the trace is written to path as json, or as csv if path ends with .csv
+        self.path = path
+
+    @contextmanager
+    def span(self, name):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t)
+
+    def add(self, name, seconds):
+        total = self.totals.setdefault(name, [0, 0.0])
+        total[0] += 1
+        total[1] += seconds
+        self.current[name] = self.current.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+        self.current[name] = self.current.get(name, 0) + n
+
+    def next_iteration(self, **fields):
+        # closes the current iteration, fields (e.g. depth) are stored next to its spans and counters
+        row = {'iteration': len(self.iterations) + 1, 'elapsed': round(time.time() - self.start, 6)}
+        row.update(fields)
+        row.update(rounded(self.current))
+        self.iterations.append(row)
+        self.current = {}
+
+        # keep the trace on disk in case the run is killed by a timeout
+        if time.time() - self.last_dump > 10:
+            self.dump()
+
+    def summary(self):
+        elapsed = time.time() - self.start
+        logging.info('{:<16}{:>10}{:>12}{:>8}'.format('span', 'calls', 'seconds', '%'))
+        for name, (calls, seconds) in sorted(self.totals.items(), key=lambda x: -x[1][1]):
+            logging.info('{:<16}{:>10}{:>12.3f}{:>8.1f}'.format(name, calls, seconds, 100 * seconds / elapsed))
+        for name, value in self.counters.items():
+            logging.info('{:<16}{:>22}'.format(name, round(value, 3) if isinstance(value, float) else value))
+
+    def dump(self):
+        if not self.path:
+            return
+        self.last_dump = time.time()
+        elapsed = round(self.last_dump - self.start, 6)
+        rows = list(self.iterations)
+        if self.current:
+            # spans after the last iteration, e.g. key extraction
+            rows.append(dict({'iteration': 'end', 'elapsed': elapsed}, **rounded(self.current)))
+
+        if self.path.endswith('.csv'):
+            total = {'iteration': 'total', 'elapsed': elapsed}
+            total.update(rounded({name: seconds for name, (calls, seconds) in self.totals.items()}))
+            total.update(rounded(self.counters))
+            fields = []
+            for row in rows + [total]:
+                fields.extend(k for k in row if k not in fields)
+            with open(self.path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(rows + [total])
+        else:
+            trace = {'elapsed': elapsed,
+                     'spans': {name: {'calls': calls, 'seconds': round(seconds, 6)}
+                               for name, (calls, seconds) in self.totals.items()},
+                     'counters': rounded(self.counters),
+                     'iterations': rows}
+            with open(self.path, 'w') as f:
+                json.dump(trace, f, indent=1)
+
+
+def solver_conflicts(solver):
+    # conflicts so far of a pysmt z3 solver or a pysat solver, None for other solvers
+    if hasattr(solver, 'accum_stats'):
+        return solver.accum_stats().get('conflicts')
+    z3 = getattr(solver, 'z3', None)
+    if z3 is not None:
+        stats = z3.statistics()
+        return dict((k, stats.get_key_value(k)) for k in stats.keys()).get('conflicts', 0)
+    return None
+
+
+profiler = Profiler()
@@ -0,0 +1,216 @@
+import logging
+from common.circuit import Wire
+
+
+# gates that are hashed by their operand set, with the function of the inverted gate
+COMMUTATIVE = {'and': ('and', False), 'nand': ('and', True), 'or': ('or', False), 'nor': ('or', True),
+               'xor': ('xor', False), 'xnor': ('xor', True)}
+CONSTANTS = {"1'b0": False, "1'b1": True}
+
+
+def topological_order(wires):
+    # gates after their operands, operands that are not wires (inputs, keys, constants) and dffs/lats are sources
+    # returns None if there is a combinational loop
+    def operands(w):
+        if wires[w].type in (Wire.DFF, Wire.LAT, Wire.INPUT):
+            return iter(())
+        return iter(wires[w].operands)
+
+    order = []
+    state = {}
+    for root in wires:
+        if root in state:
+            continue
+        state[root] = 1
+        stack = [(root, operands(root))]
+        while stack:
+            w, it = stack[-1]
+            for o in it:
+                if o not in wires:
+                    continue
+                if o not in state:
+                    state[o] = 1
+                    stack.append((o, operands(o)))
+                    break
+                elif state[o] == 1:
+                    return None
+            else:
+                state[w] = 2
+                order.append(w)
+                stack.pop()
+    return order
+
+
+class Strash:
+    # structural hashing, constant propagation and buffer/inverter collapsing of circuit.wire_objs
+    # every wire is mapped to a representative: a wire name or True/False, equal gates share one representative
+    # port names stay: outputs and the inputs of dffs/lats keep their wire, as a buffer of the representative
+    # if needed, inputs and keys are never touched, gates that do not reach an output or a dff are removed
+    # muxes and unknown cells are hashed by their type and operands as they are, without constant propagation
+    def __init__(self, circuit):
+        self.circuit = circuit
+        self.wires = circuit.wire_objs
+        self.rep = {}
+        self.inv = {}
+        self.table = {}
+        self.new_wires = {}
+        # verilog netlists have constant literals, bench netlists get constant gates
+        self.verilog = circuit.port_defs is not None
+
+    def value(self, o):
+        if o in CONSTANTS:
+            return CONSTANTS[o]
+        return self.rep.get(o, o)
+
+    def run(self):
+        wires = self.wires
+        n_gates = len(wires)
+        protected = set()
+        for w in wires:
+            if wires[w].type in (Wire.DFF, Wire.LAT):
+                protected.update(o for o in wires[w].operands if o in wires)
+        outputs = self.circuit.output_wires
+        for w in wires:
+            if w in outputs or ('[' in w and w[:w.rfind('[')] in outputs):
+                protected.add(w)
+
+        order = topological_order(wires)
+        if order is None:
+            # cyclic netlists (e.g. cyclic locking) are left as they are
+            logging.warning('strash is skipped, {} has combinational loops'.format(self.circuit.name))
+            return self.circuit
+        for w in order:
+            wire = wires[w]
+            if wire.type in (Wire.DFF, Wire.LAT, Wire.INPUT):
+                self.rep[w] = w
+                continue
+            self.gate(w, wire.type, [self.value(o) for o in wire.operands])
+
+        # ports keep their names
+        for w in protected:
+            r = self.rep[w]
+            if r != w:
+                self.new_wires[w] = Wire(w, 'buf', [self.constant(r) if r is True or r is False else r])
+
+        for w in wires:
+            if wires[w].type in (Wire.DFF, Wire.LAT, Wire.INPUT):
+                self.new_wires[w] = wires[w]
+
+        # gates in the fanin of outputs and sequential elements
+        keep = set()
+        stack = [w for w in self.new_wires if w in protected]
+        stack += [w for w in wires if wires[w].type in (Wire.DFF, Wire.LAT, Wire.INPUT)]
+        while stack:
+            w = stack.pop()
+            if w in keep:
+                continue
+            keep.add(w)
+            stack.extend(o for o in self.new_wires[w].operands if o in self.new_wires)
+
+        result = {}
+        for w in list(wires) + list(self.new_wires):
+            if w in keep and w not in result:
+                result[w] = self.new_wires[w]
+        self.circuit.wire_objs = result
+        logging.warning('strash: {} -> {} wires'.format(n_gates, len(result)))
+        return self.circuit
+
+    def constant(self, v):
+        # a wire (or literal) with the constant value v
+        if self.verilog:
+            return "1'b1" if v else "1'b0"
+        name = 'strash_one' if v else 'strash_zero'
+        if name not in self.new_wires:
+            sources = list(self.circuit.input_wires) + list(self.circuit.key_wires)
+            if not sources:
+                logging.critical('strash needs an input to build constants')
+                exit()
+            if 'strash_inv' not in self.new_wires:
+                self.new_wires['strash_inv'] = Wire('strash_inv', 'not', [sources[0]])
+            self.new_wires[name] = Wire(name, 'or' if v else 'and', [sources[0], 'strash_inv'])
+        return name
+
+    def add(self, w, gate_type, ops, key, inverted=False):
+        # w becomes gate_type(ops) unless an equal gate exists, key is the hash of the function of gate_type(ops)
+        # inverted if the gate is the inverse of the function
+        hit = self.table.get(key)
+        if hit is None:
+            self.table[key] = (w, inverted)
+            ops = [self.constant(o) if o is True or o is False else o for o in ops]
+            self.new_wires[w] = Wire(w, gate_type, ops)
+            if w in self.wires and self.wires[w].type == gate_type:
+                # verilog instance name, gates of another type (e.g. a nand that became an inverter) get a new one
+                self.new_wires[w].tag = self.wires[w].tag
+            self.rep[w] = w
+            if gate_type == 'not':
+                self.inv[w] = ops[0]
+        elif hit[1] == inverted:
+            self.rep[w] = hit[0]
+        else:
+            self.invert(w, hit[0])
+
+    def invert(self, w, x):
+        # w = not(x)
+        if x is True or x is False:
+            self.rep[w] = not x
+        elif x in self.inv:
+            self.rep[w] = self.inv[x]
+        else:
+            self.add(w, 'not', [x], ('not', x))
+
+    def gate(self, w, gate_type, ops):
+        if gate_type == 'buf':
+            self.rep[w] = ops[0]
+        elif gate_type == 'not':
+            self.invert(w, ops[0])
+        elif gate_type in ('and', 'nand', 'or', 'nor'):
+            base, inverted = COMMUTATIVE[gate_type]
+            # False dominates and, True dominates or
+            dominant = base == 'or'
+            rest = []
+            for o in dict.fromkeys(ops):
+                if o is dominant or (o is not (not dominant) and self.inv.get(o) in ops):
+                    rest = None
+                    break
+                elif o is not (not dominant):
+                    rest.append(o)
+            if rest is None:
+                self.rep[w] = dominant != inverted
+            elif not rest:
+                self.rep[w] = (not dominant) != inverted
+            elif len(rest) == 1:
+                if inverted:
+                    self.invert(w, rest[0])
+                else:
+                    self.rep[w] = rest[0]
+            else:
+                self.add(w, gate_type, rest, (base, tuple(sorted(rest))), inverted)
+        elif gate_type in ('xor', 'xnor'):
+            # constants and inverted operands go to the parity, pairs of equal operands cancel
+            parity = gate_type == 'xnor'
+            count = {}
+            for o in ops:
+                if o is True or o is False:
+                    parity ^= o
+                    continue
+                if o in self.inv:
+                    parity = not parity
+                    o = self.inv[o]
+                count[o] = count.get(o, 0) + 1
+            rest = [o for o in count if count[o] % 2]
+            if not rest:
+                self.rep[w] = parity
+            elif len(rest) == 1:
+                if parity:
+                    self.invert(w, rest[0])
+                else:
+                    self.rep[w] = rest[0]
+            else:
+                self.add(w, 'xnor' if parity else 'xor', rest, ('xor', tuple(sorted(rest))), parity)
+        else:
+            key = (gate_type, tuple(o if isinstance(o, str) else self.constant(o) for o in ops))
+            self.add(w, gate_type, list(key[1]), key)
+
+
+def strash(circuit):
+    return Strash(circuit).run()
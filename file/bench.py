@@ -1,86 +1,75 @@
-import re
-from common.circuit import Wire, Circuit
+from common.netlist import Netlist, gate_code, check_arity, netlist2circuit, GATE_TYPES
+from file.binary import binary2circuit, EXTENSION
+from file.cache import cached_netlist
 import logging
 
+BENCH_TYPES = {'buf': 'BUFF'}
 
-def bench2circuit(path):
+
+def bench2netlist(path):
+    # single pass over the file, one statement per line
+    netlist = Netlist()
+    ids = netlist.ids
+    inputs = []
     try:
-        with open(path, "r") as f:
-            bench_file = f.read()
+        f = open(path, "r")
     except EnvironmentError:
         logging.critical('{} not found'.format(path))
         exit()
 
-    inputs = re.findall(r'INPUT\((.*?)\)', bench_file)
-    outputs = re.findall(r'OUTPUT\((.*?)\)', bench_file)
-    gates_match = re.findall(r'(.*?) = (.*?)\((.*?)\)', bench_file)
-
-    wires = {}
-    for g in gates_match:
-        in_port = g[2].replace(' ', '').replace('\n', '').split(',')
-        out_port = g[0]
-        gate_type = g[1].lower()
-
-        if 'dff' in gate_type:
-            assert len(in_port) == 1
-            wires[out_port] = Wire(out_port, 'dff', in_port)
-        elif 'nand' in gate_type:
-            assert len(in_port) > 1
-            wires[out_port] = Wire(out_port, 'nand', in_port)
-        elif 'and' in gate_type:
-            assert len(in_port) > 1
-            wires[out_port] = Wire(out_port, 'and', in_port)
-        elif 'xnor' in gate_type:
-            assert len(in_port) > 1
-            wires[out_port] = Wire(out_port, 'xnor', in_port)
-        elif 'xor' in gate_type:
-            assert len(in_port) > 1
-            wires[out_port] = Wire(out_port, 'xor', in_port)
-        elif 'nor' in gate_type:
-            assert len(in_port) > 1
-            wires[out_port] = Wire(out_port, 'nor', in_port)
-        elif 'or' in gate_type:
-            assert len(in_port) > 1
-            wires[out_port] = Wire(out_port, 'or', in_port)
-        elif 'not' in gate_type:
-            assert len(in_port) == 1
-            wires[out_port] = Wire(out_port, 'not', in_port)
-        elif 'buf' in gate_type:
-            assert len(in_port) == 1
-            wires[out_port] = Wire(out_port, 'buf', in_port)
-        elif 'mux' in gate_type:
-            assert len(in_port) == 3
-            wires[out_port] = Wire(out_port, 'mux', in_port)
-        else:
-            logging.critical('undefined gate type: {}'.format(gate_type))
-            exit()
-        wires[out_port].operands = in_port
-
-    for w in wires:
-        for o in wires[w].operands:
-            if (o in wires) or (o in inputs):
+    with f:
+        for n, line in enumerate(f, 1):
+            lp = line.find('(')
+            if lp == -1 or line.lstrip().startswith('#'):
                 continue
+            rp = line.find(')', lp)
+            eq = line.find('=', 0, lp)
+            if eq == -1:
+                port = line[:lp].strip()
+                name = line[lp + 1:rp].strip()
+                if port == 'INPUT':
+                    inputs.append(name)
+                elif port == 'OUTPUT':
+                    netlist.outputs.append(ids[name])
+                else:
+                    logging.critical('line {}: cannot parse {}'.format(n, line.strip()))
+                    exit()
             else:
-                logging.critical('wire {} is used but is not connected to anywhere'.format(o))
-                exit()
+                code = gate_code(line[eq + 1:lp].strip())
+                operands = [ids[o.strip()] for o in line[lp + 1:rp].split(',')]
+                if not check_arity(code, len(operands)):
+                    logging.critical('line {}: wrong number of operands for {}'.format(n, GATE_TYPES[code]))
+                    exit()
+                netlist.add_gate(ids[line[:eq].strip()], code, operands)
 
-    keys = []
     for i in inputs:
         if 'keyinput' in i:
-            keys.append(i)
+            netlist.keys.append(ids[i])
+        else:
+            netlist.inputs.append(ids[i])
+    netlist.check_drivers()
+    return netlist
+
+
+def bench2circuit(path):
+    return netlist2circuit(cached_netlist(path, 'bench', bench2netlist), path)
+
 
-    for k in keys:
-        inputs.remove(k)
+def load_circuit(path):
+    # bench files, or binary netlists (see file.binary) that are mapped instead of parsed
+    if path.endswith(EXTENSION):
+        return binary2circuit(path)
+    return bench2circuit(path)
 
-    circuit = Circuit(path[path.rfind("/")+1:path.rfind(".")])
-    circuit.folder_path = path[:path.rfind("/")+1]
-    circuit.file_name = path[path.rfind("/")+1:]
-    circuit.input_wires = inputs
-    circuit.output_wires = outputs
-    circuit.wire_objs = wires
-    circuit.key_wires = keys
 
-    logging.warning(
-        'circuit: {}, inputs: {}, outputs: {}, keyinputs: {}'.format(circuit.name, len(circuit.input_wires), len(circuit.output_wires),
-                                                                     len(keys)))
-    return circuit
\ No newline at end of file
+def netlist2bench(netlist):
+    # bench text of a netlist, keys are written as inputs
+    names = netlist.names
+    lines = ['INPUT({})'.format(names[i]) for i in list(netlist.inputs) + list(netlist.keys)]
+    lines += ['OUTPUT({})'.format(names[i]) for i in netlist.outputs]
+    for g in range(len(netlist.gate_out)):
+        gate_type = GATE_TYPES[netlist.gate_type[g]]
+        operands = ', '.join(names[i] for i in netlist.fanin[netlist.fanin_ptr[g]:netlist.fanin_ptr[g + 1]])
+        lines.append('{} = {}({})'.format(names[netlist.gate_out[g]], BENCH_TYPES.get(gate_type, gate_type.upper()),
+                                          operands))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,141 @@
+import logging
+import mmap
+import operator
+import os
+import struct
+from common.netlist import GATE_TYPES, Netlist, netlist2circuit
+
+# binary netlist, little endian, every section starts at a multiple of 8 bytes:
+#   header: magic, version, flags, #names, #gates, #fanins, #inputs, #outputs, #keys, name bytes, tag bytes
+#   gate_out (int32 x gates), gate_type (int8 x gates), fanin_ptr (int32 x gates+1), fanin (int32 x fanins),
+#   inputs, outputs, keys (int32 name ids), order and level (int32 x gates, if LEVELS),
+#   names ('\n' separated utf-8), tags ('\n' separated utf-8, one per gate, if TAGS)
+MAGIC = b'RANENET\0'
+VERSION = 1
+LEVELS = 1
+TAGS = 2
+HEADER = struct.Struct('<8sIIIIIIIIII')
+EXTENSION = '.rnl'
+ARRAYS = [('gate_out', 'int32'), ('gate_type', 'int8'), ('fanin_ptr', 'int32'), ('fanin', 'int32'),
+          ('inputs', 'int32'), ('outputs', 'int32'), ('keys', 'int32'), ('order', 'int32'), ('level', 'int32')]
+
+
+def pad(n):
+    return (n + 7) & ~7
+
+
+def in_range(data, n):
+    return not len(data) or (min(data) >= 0 and max(data) < n)
+
+
+def check_arrays(netlist, n_names):
+    # the ids and indices of a read netlist point into its names and gates, raises ValueError otherwise
+    n_gates = len(netlist.gate_out)
+    if len(netlist.names) != n_names:
+        raise ValueError('{} names instead of {}'.format(len(netlist.names), n_names))
+    if netlist.tags is not None and len(netlist.tags) != n_gates:
+        raise ValueError('{} tags instead of {}'.format(len(netlist.tags), n_gates))
+    for name in ('gate_out', 'fanin', 'inputs', 'outputs', 'keys'):
+        if not in_range(getattr(netlist, name), n_names):
+            raise ValueError('{} has an id out of range'.format(name))
+    if not in_range(netlist.gate_type, len(GATE_TYPES)):
+        raise ValueError('unknown gate type')
+    ptr = netlist.fanin_ptr
+    if ptr[0] != 0 or ptr[-1] != len(netlist.fanin) or any(map(operator.gt, ptr[:-1], ptr[1:])):
+        raise ValueError('fanin_ptr is not a range of the fanins')
+    if netlist.order is not None and not (in_range(netlist.order, n_gates) and in_range(netlist.level, n_gates + 1)):
+        raise ValueError('order or level out of range')
+
+
+def write_binary(path, netlist):
+    # the file is replaced atomically, readers never see a partial netlist
+    flags = (LEVELS if netlist.order is not None else 0) | (TAGS if netlist.tags is not None else 0)
+    names = '\n'.join(netlist.names).encode()
+    tags = '\n'.join(netlist.tags).encode() if netlist.tags is not None else b''
+    sections = [bytes(netlist.gate_out), bytes(netlist.gate_type), bytes(netlist.fanin_ptr), bytes(netlist.fanin),
+                bytes(netlist.inputs), bytes(netlist.outputs), bytes(netlist.keys)]
+    if flags & LEVELS:
+        sections += [bytes(netlist.order), bytes(netlist.level)]
+    sections += [names, tags]
+
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, flags, len(netlist.names), len(netlist.gate_out), len(netlist.fanin),
+                            len(netlist.inputs), len(netlist.outputs), len(netlist.keys), len(names), len(tags)))
+        f.write(bytes(pad(HEADER.size) - HEADER.size))
+        for data in sections:
+            f.write(data)
+            f.write(bytes(pad(len(data)) - len(data)))
+    os.replace(tmp, path)
+
+
+def read_binary(path):
+    # the arrays of the netlist are read-only views of the mapped file, nothing is copied but the names
+    # returns None if the file is not a binary netlist of this version or if it is damaged
+    try:
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError):
+        return None
+    if len(buf) < HEADER.size:
+        return None
+    magic, version, flags, n_names, n_gates, n_fanin, n_inputs, n_outputs, n_keys, names_size, tags_size = \
+        HEADER.unpack_from(buf)
+    if magic != MAGIC or version != VERSION:
+        logging.warning('{} is not a binary netlist of version {}'.format(path, VERSION))
+        return None
+
+    view = memoryview(buf)
+    pos = pad(HEADER.size)
+
+    def section(size, fmt):
+        nonlocal pos
+        if pos + size > len(buf):
+            raise ValueError('section at {} ends after the end of the file'.format(pos))
+        data = view[pos:pos + size]
+        pos += pad(size)
+        return data.cast(fmt)
+
+    # a truncated or damaged file, e.g. a cache file that was not written completely, is no netlist
+    netlist = Netlist()
+    try:
+        netlist.gate_out = section(4 * n_gates, 'i')
+        netlist.gate_type = section(n_gates, 'b')
+        netlist.fanin_ptr = section(4 * (n_gates + 1), 'i')
+        netlist.fanin = section(4 * n_fanin, 'i')
+        netlist.inputs = section(4 * n_inputs, 'i')
+        netlist.outputs = section(4 * n_outputs, 'i')
+        netlist.keys = section(4 * n_keys, 'i')
+        if flags & LEVELS:
+            netlist.order = section(4 * n_gates, 'i')
+            netlist.level = section(4 * n_gates, 'i')
+        names = bytes(section(names_size, 'B')).decode()
+        tags = bytes(section(tags_size, 'B')).decode() if flags & TAGS else None
+        netlist.names[:] = names.split('\n') if names else []
+        if tags is not None:
+            netlist.tags = tags.split('\n') if n_gates else []
+        check_arrays(netlist, n_names)
+    except ValueError as e:
+        logging.warning('{} is damaged: {}'.format(path, e))
+        return None
+    netlist.ids.update((name, i) for i, name in enumerate(netlist.names))
+    return netlist
+
+
+def binary2circuit(path):
+    netlist = read_binary(path)
+    if netlist is None:
+        logging.critical('cannot read {}'.format(path))
+        exit()
+    return netlist2circuit(netlist, path)
+
+
+def netlist_arrays(netlist):
+    # numpy views of the arrays of a netlist, they share the memory of the mapped file (or of the arrays)
+    import numpy as np
+    arrays = {}
+    for name, dtype in ARRAYS:
+        data = getattr(netlist, name)
+        if data is not None:
+            arrays[name] = np.frombuffer(data, dtype=dtype)
+    return arrays
@@ -0,0 +1,43 @@
+import hashlib
+import logging
+import os
+from file.binary import read_binary, write_binary
+
+# parsed netlists are kept as binary netlists named by the hash of the source file and the parser version
+# the cache is off unless RANE_CACHE names its folder (e.g. ~/.cache/rane)
+# the version should be increased whenever a parser changes what it reads
+PARSER_VERSION = 1
+CACHE_PATH = os.environ.get('RANE_CACHE') or None
+
+
+def cache_file(path, parser):
+    h = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    except EnvironmentError:
+        return None
+    h.update('{}:{}'.format(parser, PARSER_VERSION).encode())
+    return os.path.join(CACHE_PATH, h.hexdigest() + '.rnl')
+
+
+def cached_netlist(path, parser, parse):
+    # the netlist of parse(path), from the cache if the file was parsed before
+    # parser names the parser in the cache key, misses are levelized before they are stored
+    cached = cache_file(path, parser) if CACHE_PATH else None
+    if cached and os.path.isfile(cached):
+        netlist = read_binary(cached)
+        if netlist is not None:
+            logging.info('{} is loaded from {}'.format(path, cached))
+            return netlist
+
+    netlist = parse(path)
+    if cached:
+        netlist.levelize()
+        try:
+            os.makedirs(CACHE_PATH, exist_ok=True)
+            write_binary(cached, netlist)
+        except EnvironmentError as e:
+            logging.warning('cannot write the netlist cache: {}'.format(e))
+    return netlist
@@ -1,8 +1,11 @@
 import re
 import argparse
 import logging
+from common.netlist import wires2netlist
 from common.utils import logo
-from file.verilog import verilog2circuit, read_verilog_wires
+from file.bench import bench2netlist, netlist2bench
+from file.binary import read_binary, write_binary, EXTENSION
+from file.verilog import verilog2circuit, read_verilog_wires, port_bits
 
 
 def insert_char2list(my_list, my_char):
@@ -155,11 +158,41 @@ def keyinput2vector(args):
     exit()
 
 
+def bench2binary(args):
+    netlist = bench2netlist(args.b)
+    netlist.levelize()
+    write_binary(args.b.replace('.bench', EXTENSION), netlist)
+
+
+def verilog2binary(args):
+    # port bits are named p[i] as in the formal flow, keyinput bits become keys
+    tmp_circuit = verilog2circuit(args.b)
+    netlist = wires2netlist(read_verilog_wires(args.b, 'generic'))
+    for p in port_bits(tmp_circuit.input_wires):
+        if 'keyinput' in p:
+            netlist.keys.append(netlist.intern(p))
+        else:
+            netlist.inputs.append(netlist.intern(p))
+    for p in port_bits(tmp_circuit.output_wires):
+        netlist.outputs.append(netlist.intern(p))
+    netlist.levelize()
+    write_binary(args.b.replace('.v', EXTENSION), netlist)
+
+
+def binary2bench(args):
+    netlist = read_binary(args.b)
+    if netlist is None:
+        logging.critical('cannot read {}'.format(args.b))
+        exit()
+    with open(args.b.replace(EXTENSION, '.bench'), 'w') as f:
+        f.write(netlist2bench(netlist))
+
+
 if __name__ == "__main__":
     logo()
-    parser = argparse.ArgumentParser(description='Convert Bench and Verilog to each other')
+    parser = argparse.ArgumentParser(description='Convert Bench, Verilog and binary netlists to each other')
     parser.add_argument("-p", action="store", default=0, type=int, help="print wire details")
-    parser.add_argument("-m", action="store", required=True, type=str, help="operation")
+    parser.add_argument("-m", action="store", required=True, type=str, help="operation: key, v2b, b2v, b2n, v2n, n2b (n is the binary netlist)")
     parser.add_argument("-b", action="store", required=True, type=str, help="file path")
     args = parser.parse_args()
 
@@ -176,6 +209,12 @@ if __name__ == "__main__":
         verilog2bench(args)
     elif args.m == 'b2v':
         bench2verilog(args)
+    elif args.m == 'b2n':
+        bench2binary(args)
+    elif args.m == 'v2n':
+        verilog2binary(args)
+    elif args.m == 'n2b':
+        binary2bench(args)
     else:
         logging.critical('invalid operation')
 
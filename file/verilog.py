@@ -1,5 +1,7 @@
 import logging
 from common.circuit import Wire, Circuit
+from common.netlist import wires2netlist
+from file.cache import cached_netlist
 import re
 
 
@@ -121,6 +123,10 @@ def create_wire(type, in_port, out_port):
 
 
 def read_generic_verilog_wires(path):
+    return cached_netlist(path, 'generic', lambda p: wires2netlist(parse_generic_verilog_wires(p))).to_wires()
+
+
+def parse_generic_verilog_wires(path):
     try:
         with open(path, "r") as f:
             design = f.read()
@@ -280,6 +286,19 @@ def verilog2circuit(path):
     return circuit
 
 
+def port_bits(ports):
+    # bit names of the ports read by verilog2circuit, msb first as in verilog constants, the clock is dropped
+    bits = []
+    for p, width in ports.items():
+        if ('clk' in p) or ('CK' in p):
+            continue
+        if width == 1:
+            bits.append(p)
+        else:
+            bits.extend('{}[{}]'.format(p, i) for i in reversed(range(width)))
+    return bits
+
+
 def circuit2verilog(cir, cir_name):
     # write out a circuit to a verilog file
     verilog_text = 'module {}('.format(cir_name)
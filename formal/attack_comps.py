@@ -23,7 +23,7 @@ def create_ports(prefix1, prefix2, circuit):
 
 
 class AttackComponents:
-    def __init__(self, orcl_cir, obf_cir, enable_async, key_constraints):
+    def __init__(self, orcl_cir, obf_cir, enable_async, key_constraints, key_definitions=""):
         self.dip_gen = None
         self.dis_gen = None
         self.dip_chk = None
@@ -34,6 +34,7 @@ class AttackComponents:
         self.main = None
         self.enable_async = enable_async
         self.key_constraints = key_constraints
+        self.key_definitions = key_definitions
         self.orcl_cir = orcl_cir
 
         # create common components module
@@ -196,6 +197,8 @@ class AttackComponents:
         sens = vast.Sens(vast.Identifier('clk'), type='posedge')
         inst_list.append(vast.Always(vast.SensList([sens]), statement))
 
+        if self.key_definitions:
+            inst_list.append(vast.Identifier(self.key_definitions))
         statement = vast.Block([vast.Identifier(self.key_constraints)])
         sens = vast.Sens(None, type='all')
         inst_list.append(vast.Always(vast.SensList([sens]), statement))
@@ -295,6 +298,8 @@ class AttackComponents:
         sens = vast.Sens(vast.Identifier('clk'), type='posedge')
         inst_list.append(vast.Always(vast.SensList([sens]), statement))
 
+        if self.key_definitions:
+            inst_list.append(vast.Identifier(self.key_definitions))
         statement = vast.Block([vast.Identifier(self.key_constraints)])
         sens = vast.Sens(None, type='all')
         inst_list.append(vast.Always(vast.SensList([sens]), statement))
@@ -461,6 +466,8 @@ class AttackComponents:
         sens = vast.Sens(vast.Identifier('clk'), type='posedge')
         inst_list.append(vast.Always(vast.SensList([sens]), statement))
 
+        if self.key_definitions:
+            inst_list.append(vast.Identifier(self.key_definitions))
         statement = vast.Block([vast.Identifier(self.key_constraints)])
         sens = vast.Sens(None, type='all')
         inst_list.append(vast.Always(vast.SensList([sens]), statement))
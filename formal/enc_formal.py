@@ -57,9 +57,9 @@ def rnd_obf(args):
 
     # old wire names should be replaced in their instances (e.g., G13 to G13_obf)
     for w in rep_instances:
-        del wires[w]
+        circuit.remove_wire(w)
     for w in obf_gates:
-        wires[w] = obf_gates[w]
+        circuit.add_wire(obf_gates[w])
 
     circuit.input_wires['keyinput'] = i
     circuit.port_defs.append('keyinput')
@@ -132,9 +132,9 @@ def lbll_obf(args):
                     break
 
     for w in rep_instances:
-        del wires[w]
+        circuit.remove_wire(w)
     for w in obf_gates:
-        wires[w] = obf_gates[w]
+        circuit.add_wire(obf_gates[w])
 
     circuit.input_wires['keyinput'] = i
     circuit.port_defs.append('keyinput')
@@ -0,0 +1,32 @@
+from common.circuit import Circuit
+from file.verilog import read_generic_verilog_wires, port_bits
+from main_sat import Config as SatConfig
+from sat.seq_attack import PyAttack
+
+
+def gate_circuit(cir):
+    # gate level copy of a circuit read by verilog2circuit
+    gates = Circuit(cir.name)
+    gates.folder_path = cir.folder_path
+    gates.file_name = cir.file_name
+    gates.wire_objs = read_generic_verilog_wires(cir.folder_path + cir.file_name)
+    bits = port_bits(cir.input_wires)
+    gates.input_wires = [b for b in bits if 'keyinput' not in b]
+    gates.key_wires = [b for b in bits if 'keyinput' in b]
+    gates.output_wires = port_bits(cir.output_wires)
+    return gates
+
+
+class GateBMCAttack(PyAttack):
+    # the formal flow without sby: the verilog designs are read as gate level netlists and attacked by PyAttack,
+    # one solver keeps the unrolled dip generator and all dip checkers between iterations
+    def __init__(self, args, config, org_cir, obf_cir):
+        engine = ','.join(config.engine) if isinstance(config.engine, list) else config.engine
+        # settings that the formal flow does not have keep the defaults of the sequential attack
+        bmc_config = type('BMCConfig', (SatConfig,), {'depth': config.depth, 'step': config.step,
+                                                      'stop': config.stop, 'solver': engine,
+                                                      'portfolio_db': config.portfolio_db,
+                                                      'strash': config.strash, 'batch': config.batch})
+        PyAttack.__init__(self, args, bmc_config)
+        self.oracle_cir = gate_circuit(org_cir)
+        self.obf_cir = gate_circuit(obf_cir)
@@ -1,7 +1,9 @@
 import logging
 from os import devnull
 import subprocess
+import time
 from re import findall
+from common.profiler import profiler
 
 
 class Results:
@@ -79,8 +81,12 @@ class JGInterface:
     def exe_jg(self):
         logfile = open(self.config.exe_path + 'out.log', 'w')
         # execute jaspergold
-        command = ["-acquire_proj", "-no_gui", "-tcl", self.config.exe_path + self.cir_name + ".tcl"]
+        command = ["-acquire_proj", "-proj", self.config.exe_path + "jgproject", "-no_gui", "-tcl",
+                   self.config.exe_path + self.cir_name + ".tcl"]
+        start = time.time()
         subprocess.call(["jaspergold"] + command, stdout=logfile)
+        profiler.count('subprocess_s', time.time() - start)
+        profiler.count('subprocesses')
         with open(self.config.exe_path + 'out.log', 'r') as file:
             logfile = file.read().replace('\n', '')
         return logfile
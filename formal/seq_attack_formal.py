@@ -2,7 +2,10 @@ import multiprocessing
 import time
 import argparse
 import logging
-from os import path, makedirs
+import shutil
+import signal
+from os import path, makedirs, replace
+from tempfile import mkdtemp
 from copy import deepcopy
 from formal.utils import write_verilog, build_ce
 from file.verilog import verilog2circuit, read_verilog_wires
@@ -10,6 +13,8 @@ from common.circuit import Wire
 from formal import symbiyosys
 from formal.attack_comps import AttackComponents
 from common.utils import logo, execution_time
+from common.profiler import profiler
+from sat.portfolio import Portfolio, best_solver, record_winner
 from formal import jaspergold
 
 
@@ -21,6 +26,9 @@ def main(config):
     parser.add_argument("-o", action="store", required=True, type=str, help="obfuscated benchmark path")
     parser.add_argument("-l", action="store_true", default=False, required=False, help="load dis from file")
     parser.add_argument("-t", action="store", default=7200, type=int, help="timeout in seconds, default=7200")
+    parser.add_argument("-f", action="store", required=False, type=str, help="write a timing trace to this json/csv file")
+    parser.add_argument("-x", action="store_true",
+                        help="structural hashing and constant propagation of both circuits before they are encoded")
     args = parser.parse_args()
 
     if args.p == 0:
@@ -29,6 +37,8 @@ def main(config):
         logging.getLogger().setLevel(level=logging.INFO)
     elif args.p == 2:
         logging.getLogger().setLevel(level=logging.DEBUG)
+    if args.x:
+        config.strash = True
 
     timeout = args.t
     start = time.time()
@@ -53,6 +63,7 @@ class SeqAttack:
         # internal parameters
         self.keys = []
         self.key_constraints = ""
+        self.key_definitions = ""
         self.skip = 0
         self.iteration = 0
         self.args = args
@@ -60,14 +71,70 @@ class SeqAttack:
         self.obf_cir = None
         self.dip_list = []
         self.banned_states = []
+        self.workspace = None
 
     def perform(self):
-        self.org_cir = verilog2circuit(self.args.b)
-        self.obf_cir = verilog2circuit(self.args.o)
+        if self.args.f:
+            profiler.open(self.args.f)
+        # a timeout terminates the attack, the workspace is still handled
+        signal.signal(signal.SIGTERM, lambda signum, frame: exit())
+        failed = True
+        try:
+            self.attack()
+            failed = not self.keys
+        finally:
+            if isinstance(self.solver, symbiyosys.SymbiInterface) and len(self.solver.engines) > 1:
+                record_winner(self.config.portfolio_db, self.portfolio_key(), self.solver.wins)
+            if self.workspace:
+                self.remove_workspace(failed)
+            profiler.summary()
+            profiler.dump()
+
+    def create_workspace(self):
+        # exe_path is the root of all runs, <root>/<design>/ keeps what outlives a run (dips, elaborated designs)
+        # and every run works in its own new directory, under scratch_path/<design>/ (e.g. tmpfs) if it is set
+        self.config.design_path = self.config.exe_path + self.obf_cir.name + '/'
+        if not path.exists(self.config.design_path):
+            makedirs(self.config.design_path)
+        if self.config.scratch_path:
+            root = path.join(self.config.scratch_path, self.obf_cir.name)
+        else:
+            root = self.config.design_path
+        if not path.exists(root):
+            makedirs(root)
+        self.workspace = mkdtemp(prefix=self.obf_cir.name + '_', dir=root) + '/'
+        self.config.exe_path = self.workspace
+        logging.info('workspace: ' + self.workspace)
+
+    def remove_workspace(self, failed):
+        if failed and self.config.keep_failed:
+            # scratch space is not kept, the run is moved next to the dips of the design
+            kept = self.config.design_path + path.basename(self.workspace.rstrip('/')) + '/'
+            if kept != self.workspace:
+                shutil.move(self.workspace, kept)
+            logging.warning('workspace of the failed run is kept in ' + kept)
+        else:
+            shutil.rmtree(self.workspace, ignore_errors=True)
+
+    def attack(self):
+        with profiler.span('parse'):
+            self.org_cir = verilog2circuit(self.args.b)
+            self.obf_cir = verilog2circuit(self.args.o)
 
         if self.config.cycsat:
             self.preprocess_cycles()
 
+        if not isinstance(self.config.engine, list):
+            # engine that won the last portfolio run on this circuit
+            best = best_solver(self.config.portfolio_db, self.portfolio_key())
+            if best:
+                logging.warning('using {}, the winner of the last portfolio run'.format(best))
+                self.config.engine = best
+
+        if self.config.solver == 'pysmt':
+            self.bmc_attack()
+            return
+
         # add design modules to verilog modules list
         self.config.module_paths.append(self.args.b)
         self.config.module_paths.append(self.args.o)
@@ -75,15 +142,12 @@ class SeqAttack:
         logging.warning('initial values for boundary={}, step={}'.format(self.config.depth, self.config.step))
         logging.warning('timeout={}s'.format(self.args.t))
 
+        self.create_workspace()
         if self.config.solver == 'jaspergold':
             self.solver = jaspergold.JGInterface(self.config, self.org_cir.name)
         else:
             self.solver = symbiyosys.SymbiInterface(self.config, self.org_cir.name)
 
-        self.config.exe_path += self.obf_cir.name + '/'
-        if not path.exists(self.config.exe_path):
-            makedirs(self.config.exe_path)
-
         if self.args.l:
             self.load_dips()
 
@@ -106,21 +170,49 @@ class SeqAttack:
             self.config.depth = self.config.depth + self.config.step
             logging.warning('increase depth to {}'.format(self.config.depth))
 
+    def portfolio_key(self):
+        # sby engines and pysmt solvers have different names, so they are kept apart in the winners file
+        if self.config.solver == 'pysmt':
+            return self.obf_cir.name + ':pysmt'
+        return self.obf_cir.name
+
+    def bmc_attack(self):
+        # in-process incremental bmc instead of one sby/jaspergold run per check
+        from formal.gate_bmc import GateBMCAttack
+
+        if self.config.enable_async:
+            logging.critical('the pysmt solver reads gate level netlists and does not support latches')
+            exit()
+        self.create_workspace()
+
+        attacker = GateBMCAttack(self.args, self.config, self.org_cir, self.obf_cir)
+        try:
+            attacker.attack()
+        finally:
+            if isinstance(attacker.solver_obf, Portfolio):
+                record_winner(self.config.portfolio_db, self.portfolio_key(), attacker.solver_obf.wins)
+                attacker.solver_obf.close()
+        self.iteration = attacker.iteration
+        if attacker.key is not None:
+            self.keys = [attacker.key]
+
     def save_dips(self):
-        file_path = self.config.exe_path + self.org_cir.name + ".txt"
-        with open(file_path, 'w') as filehandle:
+        # the file is shared by all runs on the design, so it is replaced at once
+        file_path = self.config.design_path + self.org_cir.name + ".txt"
+        with open(self.config.exe_path + "dips.txt", 'w') as filehandle:
             for dip in self.dip_list:
                 tmp = ''
                 for d in dip:
                     tmp += d + ' '
                 filehandle.writelines(tmp + "\n")
+        replace(self.config.exe_path + "dips.txt", file_path)
 
         logging.debug("dis(es) are written to: " + file_path)
 
     def load_dips(self):
-        # load dips from exec directory (from previous run) to continue execution
+        # load dips of a previous run on this design to continue execution
         logging.warning('loading dips from file')
-        file_path = self.config.exe_path + self.org_cir.name + ".txt"
+        file_path = self.config.design_path + self.org_cir.name + ".txt"
         with open(file_path, 'r') as filehandle:
             filecontents = filehandle.readlines()
             for line in filecontents:
@@ -135,7 +227,12 @@ class SeqAttack:
         self.skip = max_dip_size
 
     def find_keys(self, equal_keys=False):
-        attack_comps = AttackComponents(self.org_cir, self.obf_cir, self.config.enable_async, self.key_constraints)
+        with profiler.span('key'):
+            return self.solve_keys(equal_keys)
+
+    def solve_keys(self, equal_keys):
+        attack_comps = AttackComponents(self.org_cir, self.obf_cir, self.config.enable_async, self.key_constraints,
+                                        self.key_definitions)
         dips = self.compile_dis_list()
 
         if self.config.solver == 'symbiyosys':
@@ -162,9 +259,14 @@ class SeqAttack:
             exit()
 
     def check_umc(self):
+        with profiler.span('umc_check'):
+            return self.solve_umc()
+
+    def solve_umc(self):
         dips = self.compile_dis_list()
         self.solver.gen_config('umc', depth=0, skip=0)
-        attack_comps = AttackComponents(self.org_cir, self.obf_cir, self.config.enable_async, self.key_constraints)
+        attack_comps = AttackComponents(self.org_cir, self.obf_cir, self.config.enable_async, self.key_constraints,
+                                        self.key_definitions)
 
         if self.config.solver == 'symbiyosys':
             attack_comps.get_umc(dips)
@@ -189,10 +291,15 @@ class SeqAttack:
             exit()
 
     def check_ce(self):
+        with profiler.span('ce_check'):
+            return self.solve_ce()
+
+    def solve_ce(self):
         # check for combinational equivalency
-        attack_comps = AttackComponents(self.org_cir, self.obf_cir, self.config.enable_async, self.key_constraints)
+        attack_comps = AttackComponents(self.org_cir, self.obf_cir, self.config.enable_async, self.key_constraints,
+                                        self.key_definitions)
 
-        ce, state_count = build_ce(self.obf_cir)
+        ce, state_count = build_ce(self.obf_cir, self.config.strash)
         logging.warning('found {} DFFs and LATs'.format(state_count))
         f = open(self.config.exe_path + 'obf_ce.v', "w")
         f.write(ce)
@@ -216,9 +323,14 @@ class SeqAttack:
             return False
 
     def check_uc(self):
+        with profiler.span('uc_check'):
+            return self.solve_uc()
+
+    def solve_uc(self):
         dips = self.compile_dis_list()
         self.solver.gen_config('uc', depth=self.config.depth, skip=self.config.depth-1)
-        attack_comps = AttackComponents(self.org_cir, self.obf_cir, self.config.enable_async, self.key_constraints)
+        attack_comps = AttackComponents(self.org_cir, self.obf_cir, self.config.enable_async, self.key_constraints,
+                                        self.key_definitions)
         if self.config.solver == 'symbiyosys':
             attack_comps.get_unique_completion(dips)
         else:
@@ -263,18 +375,20 @@ class SeqAttack:
 
     def dis_gen(self):
         # dis gen with hd, it decreases hd at the boundary
-        attack_comps = AttackComponents(self.org_cir, self.obf_cir, self.config.enable_async, self.key_constraints)
+        attack_comps = AttackComponents(self.org_cir, self.obf_cir, self.config.enable_async, self.key_constraints,
+                                        self.key_definitions)
 
         while 1:
-            dips = self.compile_dis_list()
-            # update ast and generate Verilog file again
-            if self.config.solver == 'symbiyosys':
-                attack_comps.get_dip_gen(dips)
-            else:
-                attack_comps.get_dip_gen_formal(dips)
-            write_verilog(attack_comps.main, "main.sv", self.config.exe_path)
-            self.solver.gen_config('dis', depth=self.config.depth, skip=self.skip - 1)
-            results = self.solver.execute_dis()
+            with profiler.span('dip_solve'):
+                dips = self.compile_dis_list()
+                # update ast and generate Verilog file again
+                if self.config.solver == 'symbiyosys':
+                    attack_comps.get_dip_gen(dips)
+                else:
+                    attack_comps.get_dip_gen_formal(dips)
+                write_verilog(attack_comps.main, "main.sv", self.config.exe_path)
+                self.solver.gen_config('dis', depth=self.config.depth, skip=self.skip - 1)
+                results = self.solver.execute_dis()
 
             # if self.iteration == 1:
             #     exit()
@@ -304,45 +418,52 @@ class SeqAttack:
                 logging.info("dip: {}".format(self.dip_list[-1]))
                 self.iteration = self.iteration + 1
                 logging.warning("iteration: {}, dip seq length: {}".format(self.iteration, len(self.dip_list[-1])))
+                profiler.next_iteration(depth=len(self.dip_list[-1]))
                 logging.info("keys: {}".format(keys))
 
     def preprocess_cycles(self):
         from graph import cycle
 
         self.obf_cir.wire_objs = read_verilog_wires(self.args.o, 'generic')
-        cycles_list = cycle.find_cycles(self.args, self.obf_cir.wire_objs)
         wires = self.obf_cir.wire_objs
-        constraints = ""
+        G = cycle.build_graph(wires)
+        sccs = cycle.cyclic_components(G)
+        logging.warning('found {} cyclic components, the largest has {} wires'.format(len(sccs), len(sccs[0]) if sccs else 0))
 
-        # for lat based circuits
         if self.config.enable_async:
-            lats_list = []
-            for cycle in cycles_list:
-                has_ff = False
-                for w in cycle:
-                    if wires[w].type == Wire.DFF:
-                        has_ff = True
-                        break
-                if not has_ff:
-                    tmp = []
-                    for w in cycle:
-                        if wires[w].type == Wire.LAT:
-                            tmp.append(w)
-                    lats_list.append(tmp)
-
-            for lats in lats_list:
-                tmp = []
-                for l in lats:
-                    tmp.append("({{{}, {}}} == 2'b00)".format(wires[l].operands[0], wires[l].operands[1]))
-                tmp = ' || '.join(tmp)
-                constraints += 'assume(({}) || (({}) && ({})) );\n'.format(tmp, tmp.replace('00', '01'), tmp.replace('00', '10'))
-            self.key_constraints = constraints
-            self.key_constraints = self.key_constraints.replace('keyinput', 'k1') + self.key_constraints.replace('keyinput', 'k2')
+            # for lat based circuits, a cycle is broken by a latch with keys 00 or by latches with keys 01 and 10,
+            # so there should be no cycle when only latches with k0=1 (or with k1=1) pass their input
+            def lat_enable(k):
+                def enable(u, w):
+                    if wires[w].type == Wire.LAT:
+                        return wires[w].operands[k]
+                    return None
+                return enable
+            views = [lat_enable(0), lat_enable(1)]
         else:
-            # for mux based cycles (original cycsat)
-            # TODO: to be implemented
-            for cycle in cycles_list:
-                for w in cycle:
-                    if w.type == 'MUX2x1':
-                        continue
-            self.key_constraints = constraints
+            # for mux based cycles (original cycsat), a key controlled mux passes one of its data inputs
+            def enable(u, w):
+                ops = wires[w].operands
+                if wires[w].type == 'mux' and 'keyinput' in ops[0] and ops[1] != ops[2]:
+                    if u == ops[1]:
+                        return '!' + ops[0]
+                    elif u == ops[2]:
+                        return ops[0]
+                return None
+            views = [enable]
+
+        definitions = []
+        conditions = []
+        for i, scc in enumerate(sccs):
+            for j, enable in enumerate(views):
+                d, c = cycle.acyclic_constraints(G, scc, enable, 'cyc_keyinput_{}_{}'.format(i, j))
+                definitions.extend(d)
+                conditions.extend(c)
+        logging.warning('{} acyclic constraints with {} path wires'.format(len(conditions), len(definitions)))
+
+        # one copy for each key of the miter
+        definitions = '\n'.join(definitions)
+        constraints = ''.join('assume({});\n'.format(c) for c in conditions)
+        if definitions:
+            self.key_definitions = definitions.replace('keyinput', 'k1') + '\n' + definitions.replace('keyinput', 'k2')
+        self.key_constraints = constraints.replace('keyinput', 'k1') + constraints.replace('keyinput', 'k2')
@@ -1,7 +1,16 @@
+import hashlib
 import logging
-from os import devnull
+from os import devnull, path, replace
 import subprocess
+import time
 from re import findall
+from common.profiler import profiler
+
+# the passes of yosys prep after hierarchy, the design modules go through them once when they are elaborated
+# (cache_rtlil) and are marked with PREPARED, later runs only prepare the modules that are not marked
+PREP_PASSES = ['proc', 'opt_expr -keepdc', 'opt_clean', 'check', 'opt -noff -keepdc', 'wreduce -keepdc',
+               'memory -nomap', 'opt_clean']
+PREPARED = 'rane_prepared'
 
 
 class Results:
@@ -17,9 +26,62 @@ class SymbiInterface:
     def __init__(self, config, cir_name):
         self.config = config
         self.cir_name = cir_name
+        self.rtlil = None
+
+        # with a list of engines sby runs all of them and takes the first result
+        self.engines = config.engine if isinstance(config.engine, list) else [config.engine]
+        self.wins = dict((e, 0) for e in self.engines)
+        self.engine_path = None
+        self.mode = None
+
+    def elaborate(self):
+        # reads and prepares the design modules once and keeps them as rtlil next to the dips of the design, so
+        # every sby run only parses and prepares the generated main.sv, the cache is rebuilt when any module file
+        # or the elaboration script changes
+        script = ""
+        for p in self.config.module_paths:
+            script += "read_verilog {}; ".format(p)
+        script += "prep; setattr -mod -set {} 1; ".format(PREPARED)
+        digest = hashlib.sha256(script.encode())
+        for p in self.config.module_paths:
+            digest.update(p.encode())
+            with open(p, 'rb') as f:
+                digest.update(f.read())
+        digest = digest.hexdigest()
+
+        rtlil = self.config.design_path + "designs.il"
+        stamp = self.config.design_path + "designs.sha256"
+        if path.exists(rtlil) and path.exists(stamp):
+            with open(stamp) as f:
+                if f.read().strip() == digest:
+                    logging.info("using elaborated designs from " + rtlil)
+                    return rtlil
+
+        # written in the workspace first, other runs on the same design may read the cache meanwhile
+        script += "write_rtlil {}".format(self.config.exe_path + "designs.il")
+        FNULL = open(devnull, 'w')
+        start = time.time()
+        try:
+            status = subprocess.call(["yosys", "-q", "-p", script], stdout=FNULL)
+        except OSError:
+            logging.critical("yosys is not found")
+            exit()
+        profiler.count('subprocess_s', time.time() - start)
+        profiler.count('subprocesses')
+        if status != 0:
+            logging.critical("yosys could not elaborate the designs")
+            exit()
+
+        replace(self.config.exe_path + "designs.il", rtlil)
+        with open(self.config.exe_path + "designs.sha256", 'w') as f:
+            f.write(digest)
+        replace(self.config.exe_path + "designs.sha256", stamp)
+        logging.info("designs are elaborated to " + rtlil)
+        return rtlil
 
     def gen_config(self, mode, depth, skip=0):
         # generate sby file
+        self.mode = mode
         sby_txt = "[options]\n"
         if mode == 'cover':
             sby_txt += "mode cover\n"
@@ -42,23 +104,23 @@ class SymbiInterface:
             sby_txt += "multiclock on\n"
 
         sby_txt += "\n[engines]\n"
-        if (mode == 'dis') or (mode == 'fk'):
-            # sby_txt += "smtbmc --syn --nounroll --nopresat " + self.engine
-            sby_txt += "smtbmc --syn --nounroll " + self.config.engine
-            # sby_txt += "smtbmc"
-        elif mode == 'uc':
-            sby_txt += "smtbmc --syn --nounroll " + self.config.engine
-            # sby_txt += "smtbmc"
-        elif mode == 'umc':
+        if mode == 'umc':
             sby_txt += "aiger suprove"
-        elif mode == 'ce':
-            sby_txt += "smtbmc --syn --nounroll " + self.config.engine
+            if len(self.engines) > 1:
+                sby_txt += "\nabc pdr"
         else:
-            sby_txt += "smtbmc --syn --nounroll " + self.config.engine
+            # sby_txt += "smtbmc --syn --nounroll --nopresat " + self.engine
+            sby_txt += "\n".join("smtbmc --syn --nounroll " + e for e in self.engines)
+
+        if self.config.cache_rtlil and self.rtlil is None:
+            self.rtlil = self.elaborate()
 
         sby_txt += "\n\n[script]\n"
-        for path in self.config.module_paths:
-            sby_txt += "read_verilog {}\n".format(path[path.rfind('/') + 1:])
+        if self.config.cache_rtlil:
+            sby_txt += "read_rtlil designs.il\n"
+        else:
+            for p in self.config.module_paths:
+                sby_txt += "read_verilog {}\n".format(p[p.rfind('/') + 1:])
         if mode == 'ce':
             sby_txt += "read_verilog obf_ce.v\n"
         # if mode == 'se':
@@ -67,17 +129,26 @@ class SymbiInterface:
 
         # TODO: change mode from uc to dis
         if mode == 'dis':
-            sby_txt += 'prep -top uc\n'
+            top = 'uc'
         elif mode == 'umc':
-            sby_txt += 'prep -top umc\n'
+            top = 'umc'
         elif mode == 'fk':
-            sby_txt += 'prep -top ce\n'
+            top = 'ce'
         else:
-            sby_txt += "prep -top {}\n".format(mode)
+            top = mode
+        if self.config.cache_rtlil:
+            sby_txt += "hierarchy -check -top {}\n".format(top)
+            for p in PREP_PASSES:
+                sby_txt += "{} A:{} %n\n".format(p, PREPARED)
+        else:
+            sby_txt += "prep -top {}\n".format(top)
 
         sby_txt += "\n[files]\n"
-        for f in self.config.module_paths:
-            sby_txt += f + '\n'
+        if self.config.cache_rtlil:
+            sby_txt += self.rtlil + '\n'
+        else:
+            for f in self.config.module_paths:
+                sby_txt += f + '\n'
         sby_txt += self.config.exe_path + "main.sv\n"
         if mode == 'ce':
             sby_txt += self.config.exe_path + "obf_ce.v\n"
@@ -102,12 +173,28 @@ class SymbiInterface:
     def execute_fk(self):
         return self.execute()
 
-    def execute(self):
+    def run_sby(self):
         FNULL = open(devnull, 'w')
         # execute symbiyosis
         command = ["-f", "-d", self.config.exe_path + "exec", self.config.exe_path + self.cir_name + ".sby"]
+        start = time.time()
         subprocess.call(["sby"] + command, stdout=FNULL)
-        with open(self.config.exe_path + 'exec/engine_0/logfile.txt', 'r') as file:
+        profiler.count('subprocess_s', time.time() - start)
+        profiler.count('subprocesses')
+
+        # the engine that decided the status, its logs and traces are used
+        with open(self.config.exe_path + 'exec/logfile.txt', 'r') as file:
+            winner = findall(r'summary: engine_(\d+) ', file.read())
+        winner = int(winner[0]) if winner else 0
+        self.engine_path = self.config.exe_path + 'exec/engine_{}/'.format(winner)
+        if self.mode != 'umc' and winner < len(self.engines):
+            self.wins[self.engines[winner]] += 1
+            if len(self.engines) > 1:
+                logging.debug('{} answered first'.format(self.engines[winner]))
+
+    def execute(self):
+        self.run_sby()
+        with open(self.engine_path + 'logfile.txt', 'r') as file:
             logfile = file.read().replace('\n', '')
         rslt = Results(logfile)
         rslt.passed = findall(r'passed', logfile)
@@ -115,7 +202,7 @@ class SymbiInterface:
         return rslt
 
     def get_keys(self):
-        with open(self.config.exe_path + 'exec/engine_0/trace0_tb.v', 'r') as file:
+        with open(self.engine_path + 'trace0_tb.v', 'r') as file:
             trace = file.read().replace('\n', '')
 
         assumed_keys = findall(r'UUT.k1 = (.*?);', trace)
@@ -123,9 +210,7 @@ class SymbiInterface:
         return assumed_keys
 
     def execute_umc(self):
-        FNULL = open(devnull, 'w')
-        command = ["-f", "-d", self.config.exe_path + "exec", self.config.exe_path + self.cir_name + ".sby"]
-        subprocess.call(["sby"] + command, stdout=FNULL)
+        self.run_sby()
         with open(self.config.exe_path + 'exec/logfile.txt', 'r') as file:
             logfile = file.read().replace('\n', '')
         rslt = Results(logfile)
@@ -137,7 +222,7 @@ class SymbiInterface:
     def get_dis(self):
         # read trace_tb.v
         try:
-            file = open(self.config.exe_path + 'exec/engine_0/trace_tb.v', 'r')
+            file = open(self.engine_path + 'trace_tb.v', 'r')
             trace = file.read().replace('\n', '')
         except IOError:
             logging.critical('trace file is not generated')
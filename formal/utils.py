@@ -2,6 +2,7 @@ import logging
 from pyverilog.ast_code_generator.codegen import ASTCodeGenerator
 import pyverilog.vparser.ast as vast
 from common.circuit import Wire
+from common.strash import strash
 from file.verilog import read_verilog_wires, circuit2verilog
 
 
@@ -13,13 +14,15 @@ def write_verilog(ast, filename, path):
     logging.debug("bench is written to: " + path + filename)
 
 
-def build_ce(cir):
+def build_ce(cir, simplify=False):
     # ce_netlist = copy.copy(obf_cir.raw_netlist)
     rep_wire_names = {}
     seq_elements = []
     count = 0
     # cir = obf_cir
     cir.wire_objs = read_verilog_wires(cir.folder_path + cir.file_name, 'generic')
+    if simplify:
+        strash(cir)
 
     added_wires = {}
     for w in cir.wire_objs:
@@ -50,25 +53,20 @@ def build_ce(cir):
 
     # remove dffs/lats
     for w in seq_elements:
-        cir.wire_objs.pop(w)
+        cir.remove_wire(w)
 
     # change dff input/output wires to next_state/state
     for r in rep_wire_names:
-        if r in cir.wire_objs:
-            cir.wire_objs[rep_wire_names[r]] = cir.wire_objs[r]
-            cir.wire_objs.pop(r)
-        for w in cir.wire_objs:
-            if r in cir.wire_objs[w].operands:
-                cir.wire_objs[w].operands[cir.wire_objs[w].operands.index(r)] = rep_wire_names[r]
+        cir.rename_wire(r, rep_wire_names[r])
 
     # add new buf gates for replaced outputs
     for r in rep_wire_names:
         if r in cir.output_wires:
-            cir.wire_objs[r] = Wire(r, 'buf', [rep_wire_names[r]])
+            cir.add_wire(Wire(r, 'buf', [rep_wire_names[r]]))
     # for vectorized wires
     for r in rep_wire_names:
         if r[:r.rfind('[')] in cir.output_wires:
-            cir.wire_objs[r] = Wire(r, 'buf', [rep_wire_names[r]])
+            cir.add_wire(Wire(r, 'buf', [rep_wire_names[r]]))
 
     # add ports
     cir.port_defs = cir.port_defs + ['state', 'next_state']
@@ -1,81 +1,70 @@
-from datetime import datetime
 import logging
+import networkx as nx
+from common.circuit import Wire
 
-from networkx.utils import *
-from graph_tool import Graph, topology
-from dateutil.relativedelta import relativedelta
 
-
-cnt = 0
-
-
-def diff(t_a, t_b):
-    t_diff = relativedelta(t_b, t_a)  # later/end time comes first!
-    return '{h}h {m}m {s}s'.format(h=t_diff.hours, m=t_diff.minutes, s=t_diff.seconds)
-
-
-def get_cyclic_cone(wire_in, fanin_cone):
-    if wire_in.type != "inp":
-        if wire_in not in fanin_cone:
-            fanin_cone.add(wire_in)
-            for i in range(len(wire_in.operands)):
-                get_cyclic_cone(wire_in.operands[i], fanin_cone)
-
-
-def find_cycles(args, wires):
-    # implemented with networkx
+def build_graph(wires):
+    # edges from operands to gates, dffs are not followed since they do not close combinational cycles
     G = nx.DiGraph()
-    lst = []
-    # for i in range(0, len(wires)):
-    #     lst.append(i)
-    # G.add_nodes_from(lst)
-
     for w in wires:
-        if wires[w].type != "inp":
-            for j in range(len(wires[w].operands)):
-                G.add_edges_from(zip([wires[w].operands[j]], [w]))
-
-    cycles = list(nx.simple_cycles(G))
-    logging.warning("there are {} cycles".format(len(cycles)))
-    if args.p > 0:
-        logging.info("list of cycles:")
-        for cycle in cycles:
-            tmp = ""
-            for c in cycle:
-                tmp += c + " "
-            print(tmp)
-    return cycles
-
-
-def find_cycles2(args, wires):
-    # implemented with graph-tools
-    g = Graph()
-    t_a = datetime.now()
-    lst = []
-    for i in range(0, len(wires)):
-        lst.append(g.add_vertex())
-
-    for i in range(0, len(wires)):
-        if wires[i].type != "inp":
-            for j in range(len(wires[i].operands)):
-                g.add_edge(lst[wires[i].operands[j].index], lst[wires[i].index])
-
-    cycles = []
-    for c in all_circuits(g):
-        if len(cycles) > 100000:
-            logging.info("number of cycles is limited.")
-            break
-        cycles.append(c.tolist())
-
-    t_b = datetime.now()
-    logging.info("time of finding cycles: " + diff(t_a, t_b))
-    logging.info("there are" + str(len(cycles)) + "cycles")
-    if args.p:
-        logging.info("list of cycles:")
-        for cycle in cycles:
-            tmp = ""
-            for i in range(len(cycle)):
-                tmp += wires[cycle[i]].name + " "
-            logging.info(tmp)
-        print()
-    return cycles
+        if wires[w].type not in (Wire.INPUT, Wire.DFF):
+            for o in wires[w].operands:
+                G.add_edge(o, w)
+    return G
+
+
+def cyclic_components(G):
+    # strongly connected components that have at least one cycle, largest first
+    sccs = [c for c in nx.strongly_connected_components(G) if len(c) > 1 or G.has_edge(next(iter(c)), next(iter(c)))]
+    sccs.sort(key=len, reverse=True)
+    return sccs
+
+
+def acyclic_constraints(G, scc, enable, prefix):
+    # cycsat no-structural-path condition of a component without listing its cycles
+    # enable(u, w) is the verilog condition of the edge u -> w, None if it is always active
+    # the wires of the component are eliminated one by one, an edge p -> s is added for every path p -> k -> s
+    # through the eliminated wire k, so the edges keep the condition of an active path through eliminated wires;
+    # a self loop of k when it is eliminated is the condition of the cycles through k and the wires before it
+    # returns wire definitions for the path functions and the conditions to assume
+    succ = dict((w, {}) for w in scc)
+    pred = dict((w, {}) for w in scc)
+    for u, w in G.edges(scc):
+        if w in scc:
+            e = enable(u, w)
+            succ[u][w] = pred[w][u] = True if e is None else e
+
+    definitions = []
+    conditions = []
+
+    def define(terms):
+        # condition of the disjunction of terms, a new wire unless it is a single name or always true
+        if True in terms:
+            return True
+        if len(terms) == 1 and ' ' not in terms[0]:
+            return terms[0]
+        name = '{}_{}'.format(prefix, len(definitions))
+        definitions.append('wire {} = ({});'.format(name, ') || ('.join(terms)))
+        return name
+
+    remaining = set(scc)
+    while remaining:
+        # fewest new edges first
+        k = min(remaining, key=lambda w: (len(pred[w]) * len(succ[w]), w))
+        remaining.remove(k)
+        loop = succ[k].pop(k, None)
+        pred[k].pop(k, None)
+        if loop is True:
+            logging.warning('cycle through {} does not depend on the key'.format(k))
+        elif loop is not None:
+            conditions.append('!({})'.format(loop))
+        for p in pred[k]:
+            del succ[p][k]
+        for s in succ[k]:
+            del pred[s][k]
+        for p, a in pred[k].items():
+            for s, b in succ[k].items():
+                term = b if a is True else a if b is True else '{} && {}'.format(a, b)
+                old = succ[p].get(s)
+                succ[p][s] = pred[s][p] = define([old, term] if old is not None else [term])
+    return definitions, conditions
@@ -0,0 +1,243 @@
+import argparse
+import csv
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import signal
+import sys
+import time
+from argparse import Namespace
+from queue import Empty
+from common.utils import logo
+from main_sat import Config
+
+
+def expand_jobs(manifest):
+    # every group of the manifest is circuits x keys x solvers, circuits are glob patterns on the original path
+    # the file name of the original path should be {circuit} with an extension
+    jobs = []
+    for group in manifest['jobs']:
+        circuits = []
+        for pattern in group['circuits']:
+            for path in sorted(glob.glob(group['original'].format(circuit=pattern))):
+                circuits.append((os.path.splitext(os.path.basename(path))[0], path))
+
+        for circuit, original in circuits:
+            for key in group.get('keys', [None]):
+                obfuscated = group['obfuscated'].format(circuit=circuit, key=key)
+                if not os.path.isfile(obfuscated):
+                    logging.warning('skipping {}, file not found'.format(obfuscated))
+                    continue
+                for solver in group.get('solvers', [None]):
+                    jobs.append({'mode': group.get('mode', 'seq'), 'engine': group.get('engine', 'cnf'),
+                                 'oracle': group.get('oracle', Config.oracle), 'circuit': circuit, 'key_size': key,
+                                 'solver': solver, 'original': original, 'obfuscated': obfuscated,
+                                 'timeout': group.get('timeout', 7200), 'memory': group.get('memory', 2),
+                                 'batch': group.get('batch', Config.batch), 'checkpoint': group.get('checkpoint'),
+                                 'validate': group.get('validate', Config.validate),
+                                 'approximate': group.get('approximate', 0),
+                                 'error_threshold': group.get('error_threshold', 0.01),
+                                 'estimate_patterns': group.get('estimate_patterns', 1024)})
+    return jobs
+
+
+def run_job(job, queue, log_path):
+    # runs in its own process group with the solver and partition processes it starts, so a timeout can stop all
+    # of them; the attack output goes to the log file of the job
+    os.setpgid(0, 0)
+    log = open(log_path, 'w')
+    sys.stdout = log
+    root = logging.getLogger()
+    for h in root.handlers:
+        root.removeHandler(h)
+    handler = logging.StreamHandler(log)
+    handler.setFormatter(logging.Formatter("[%(asctime)s.%(msecs)04d %(funcName)s %(levelname)s] %(message)s",
+                                           datefmt="%H:%M:%S"))
+    root.addHandler(handler)
+    root.setLevel(logging.WARNING)
+
+    args = Namespace(p=0, b=job['original'], o=job['obfuscated'], t=job['timeout'], s=job['solver'],
+                     q=job['oracle'], e=job['engine'], f=None, j=None, n=job['batch'], v=job['validate'],
+                     a=job['approximate'], r=job['error_threshold'], m=job['estimate_patterns'], x=False)
+    if job['mode'] == 'seq':
+        from sat.seq_attack import PyAttack
+        # checkpoints of sequential jobs go to the checkpoint directory of the group, if any
+        checkpoint = None
+        if job['checkpoint']:
+            os.makedirs(job['checkpoint'], exist_ok=True)
+            checkpoint = os.path.join(job['checkpoint'], '{}_{}_{}.ckpt'.format(job['circuit'], job['key_size'],
+                                                                               job['solver'] or Config.solver))
+        config = type('Config', (Config,), {'solver': job['solver'] or Config.solver, 'oracle': job['oracle'],
+                                            'batch': job['batch'], 'checkpoint': checkpoint,
+                                            'validate': job['validate']})
+        attacker = PyAttack(args, config)
+        attacker.perform()
+        depth = attacker.highest_depth
+    elif job['mode'] == 'comb':
+        from sat.comb_attack import CombAttack
+        attacker = CombAttack(args)
+        attacker.perform()
+        depth = 1
+    else:
+        logging.critical('unknown attack mode: {}'.format(job['mode']))
+        exit()
+    log.flush()
+    # the portfolio and partition processes are joined by now, their peaks are in RUSAGE_CHILDREN
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    queue.put({'key': attacker.key, 'iterations': attacker.iteration, 'depth': depth,
+               'error_rate': attacker.error_rate, 'peak_rss_mb': rss / 1024})
+
+
+def peak_rss(pgid):
+    # sum of the high water marks of the resident sets of the running processes of a group in MB
+    total = 0
+    found = False
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(pid)) as f:
+                # the fields after the command name, which may contain spaces, start with state, ppid, pgrp
+                if int(f.read().rsplit(')', 1)[1].split()[2]) != pgid:
+                    continue
+            with open('/proc/{}/status'.format(pid)) as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total += int(line.split()[1])
+                        found = True
+        except (EnvironmentError, ValueError, IndexError):
+            pass
+    return total / 1024 if found else None
+
+
+def kill_group(pgid):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def available_memory():
+    # available memory of the node in GB
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) / 1024 / 1024
+    return 0
+
+
+class BatchRunner:
+    def __init__(self, jobs, workers, memory, log_dir):
+        self.jobs = jobs
+        self.workers = workers
+        self.memory = memory
+        self.log_dir = log_dir
+        self.results = []
+
+    def run(self):
+        pending = list(enumerate(self.jobs))
+        running = {}
+        reserved = 0
+        while pending or running:
+            # start jobs while cores and memory are left, one job always runs
+            while pending and len(running) < self.workers:
+                i, job = pending[0]
+                if running and reserved + job['memory'] > self.memory:
+                    break
+                pending.pop(0)
+                queue = multiprocessing.Queue()
+                log_path = os.path.join(self.log_dir, '{}_{}_{}_{}.log'.format(i, job['circuit'], job['key_size'],
+                                                                              job['solver']))
+                p = multiprocessing.Process(target=run_job, args=(job, queue, log_path))
+                p.start()
+                try:
+                    # also set here, the job may be stopped before it gets to it
+                    os.setpgid(p.pid, p.pid)
+                except (PermissionError, ProcessLookupError):
+                    pass
+                running[i] = (p, queue, time.time())
+                reserved += job['memory']
+                logging.info('started job {}: {} {}'.format(i, job['obfuscated'], job['solver']))
+
+            time.sleep(0.2)
+            for i in list(running):
+                p, queue, start = running[i]
+                job = self.jobs[i]
+                result = {'status': 'done'}
+                if p.is_alive():
+                    if time.time() - start < job['timeout']:
+                        continue
+                    result = {'status': 'timeout', 'peak_rss_mb': peak_rss(p.pid)}
+                    kill_group(p.pid)
+                else:
+                    try:
+                        result.update(queue.get(timeout=5))
+                    except Empty:
+                        result['status'] = 'error'
+                p.join()
+                # solver processes left behind by a failed job
+                kill_group(p.pid)
+                result['time'] = time.time() - start
+                del running[i]
+                reserved -= job['memory']
+                self.add_result(job, result)
+
+    def add_result(self, job, result):
+        row = {'circuit': job['circuit'], 'key_size': job['key_size'], 'solver': job['solver'], 'mode': job['mode'],
+               'status': result['status'], 'key': result.get('key'), 'iterations': result.get('iterations'),
+               'depth': result.get('depth'), 'error_rate': result.get('error_rate'),
+               'time': '{:.2f}'.format(result['time']),
+               'peak_rss_mb': '{:.1f}'.format(result['peak_rss_mb']) if result.get('peak_rss_mb') else None}
+        self.results.append(row)
+        logging.warning('{} {} {}: {} in {}s'.format(row['circuit'], row['key_size'], row['solver'], row['status'],
+                                                     row['time']))
+
+    def write(self, path):
+        fields = ['circuit', 'key_size', 'solver', 'mode', 'status', 'key', 'iterations', 'depth', 'error_rate',
+                  'time', 'peak_rss_mb']
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.results)
+        logging.warning('results are written to {}'.format(path))
+
+
+if __name__ == "__main__":
+    logo()
+    parser = argparse.ArgumentParser(description='Run attacks over the benchmarks of a manifest in parallel')
+    parser.add_argument("-p", action="store", default=0, type=int, help="print info=1 and debug=2, default warning=0")
+    parser.add_argument("-m", action="store", required=True, type=str, help="json manifest path")
+    parser.add_argument("-j", action="store", default=None, type=int, help="number of parallel jobs, default=cores")
+    parser.add_argument("-g", action="store", default=None, type=float,
+                        help="memory for all jobs in GB, default=available memory")
+    parser.add_argument("-r", action="store", default=None, type=str, help="results csv path, default from manifest")
+    args = parser.parse_args()
+
+    if args.p == 0:
+        logging.getLogger().setLevel(level=logging.WARNING)
+    elif args.p == 1:
+        logging.getLogger().setLevel(level=logging.INFO)
+    elif args.p == 2:
+        logging.getLogger().setLevel(level=logging.DEBUG)
+
+    try:
+        with open(args.m) as f:
+            manifest = json.load(f)
+    except (EnvironmentError, ValueError) as e:
+        logging.critical('cannot read manifest {}: {}'.format(args.m, e))
+        exit()
+
+    jobs = expand_jobs(manifest)
+    workers = args.j or len(os.sched_getaffinity(0))
+    memory = args.g or available_memory()
+    results = args.r or manifest.get('output', 'results.csv')
+    log_dir = os.path.splitext(results)[0] + '_logs'
+    os.makedirs(log_dir, exist_ok=True)
+    logging.warning('{} jobs, {} workers, {:.1f} GB memory'.format(len(jobs), workers, memory))
+
+    runner = BatchRunner(jobs, workers, memory, log_dir)
+    runner.run()
+    runner.write(results)
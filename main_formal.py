@@ -23,9 +23,28 @@ class Config:
     depth = 20
     step = 10
     # solver = 'jaspergold'
+    # solver = 'pysmt'
     solver = 'symbiyosys'
+    # smt solver of sby, or the pysmt solver of the pysmt flow
+    # a list (e.g. ['yices', 'boolector', 'z3']) races them and adds abc pdr to the umc check
     engine = 'yices'
+    # winners of portfolio runs are recorded in this file and used when engine is not a list, None turns it off
+    portfolio_db = None
+    # unroll limit of the pysmt flow
+    stop = 100
+    # dis per solver round of the pysmt flow
+    batch = 1
+    # elaborate and prepare the design modules once and pass them to every sby run as rtlil, False reads the verilog
+    # modules in every run
+    cache_rtlil = True
+    # structural hashing and constant propagation of the netlists before they are encoded (-x)
+    strash = False
+    # root of the runs, the dips and elaborated designs of each design are kept in exe_path/<design>/
     exe_path = os.path.expanduser('~') + "/lockbox/"
+    # every run works in a new directory under scratch_path/<design>/ (tmpfs if available), or under exe_path/<design>/
+    scratch_path = '/dev/shm/lockbox/' if os.path.isdir('/dev/shm') else None
+    # keep the directory of runs that did not find a key, in exe_path/<design>/ even if it was under scratch_path
+    keep_failed = False
 
 
 if __name__ == "__main__":
@@ -6,6 +6,20 @@ class Config:
     depth = 20
     step = 10
     solver = 'btor'
+    oracle = 'sim'
+    # winners of portfolio runs (-s with several solvers) are recorded in this file (-w) and used when no solver
+    # is given, None turns it off
+    portfolio_db = None
+    # structural hashing and constant propagation of both circuits before the formulas are built (-x)
+    strash = False
+    # dis drawn per solver round, they are answered by one oracle query before the next round
+    batch = 1
+    # the sequential attack state is written to this file (-c) every checkpoint_interval seconds
+    # and the attack resumes from it if it exists
+    checkpoint = None
+    checkpoint_interval = 300
+    # random sequences the final key is checked on against the oracle (-v), 0 turns the check off
+    validate = 0
 
 
 if __name__ == "__main__":
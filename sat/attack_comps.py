@@ -1,6 +1,6 @@
 from pysmt.shortcuts import *
 import logging
-from common.circuit import Wire
+from sat.cnf import CircuitTemplate
 
 
 def get_formulas(wire_list, bool_list, tag):
@@ -18,81 +18,187 @@ def get_formulas(wire_list, bool_list, tag):
     return formula_list
 
 
+def constant(x):
+    if x is True:
+        return TRUE()
+    elif x is False:
+        return FALSE()
+    return x
+
+
+def gate_formula(gate_type, ops):
+    # formula of a gate over operand formulas, operands can be True/False and constants are folded
+    invert = gate_type in ('nand', 'nor', 'xnor')
+    if invert:
+        gate_type = gate_type[1:] if gate_type != 'xnor' else 'xor'
+
+    if gate_type in ('buf', 'not'):
+        r = ops[0]
+        invert ^= gate_type == 'not'
+    elif gate_type in ('and', 'or'):
+        # False dominates and, True dominates or
+        dominant = gate_type == 'or'
+        rest = []
+        for o in ops:
+            if o is dominant:
+                rest = None
+                break
+            elif o is not (not dominant):
+                rest.append(o)
+        if rest is None:
+            r = dominant
+        elif not rest:
+            r = not dominant
+        else:
+            r = And(rest) if gate_type == 'and' else Or(rest)
+    elif gate_type == 'xor':
+        r = None
+        for o in ops:
+            if o is True or o is False:
+                invert ^= o
+            else:
+                r = o if r is None else Xor(r, o)
+        if r is None:
+            r = False
+    elif gate_type == 'mux':
+        # operands are select, then the values for select=0 and select=1
+        s, a, b = ops
+        if s is True or s is False:
+            r = b if s else a
+        elif a is b:
+            r = a
+        else:
+            r = Ite(s, constant(b), constant(a))
+    else:
+        logging.critical('unspecified gate type: {}'.format(gate_type))
+        exit()
+
+    if invert:
+        r = (not r) if (r is True or r is False) else Not(r)
+    return r
+
+
 class FormulaGenerator:
     def __init__(self, orcl_cir, obf_cir):
         self.orcl_cir = orcl_cir
         self.obf_cir = obf_cir
-        self.key_subs = [{}, {}]
-        self.dip_ckt0 = []
-        self.dip_ckt1 = []
         self.dip_ckt0_frame = []
         self.dip_ckt1_frame = []
         self.oracle_ckt_frame = []
 
-        # generate solver formulas
-        gen_wire_formulas(self.orcl_cir)
-        gen_wire_formulas(self.obf_cir)
-
-        # create symbols for primary outputs and next state wires
-        orcl_wires = self.orcl_cir.wire_objs
-        obf_wires = self.obf_cir.wire_objs
+        # every frame of a circuit copy is an instance of the gate template of the circuit
+        # instances only differ in their symbol tables, these are kept per (copy, frame)
+        self.obf_template = CircuitTemplate(self.obf_cir)
+        self.orcl_template = CircuitTemplate(self.orcl_cir)
+        self.obf_tables = [[], []]
+        self.orcl_tables = []
 
-        for w in self.orcl_cir.output_wires:
-            orcl_wires[w].formula = Iff(Symbol(w), orcl_wires[w].formula)
+        # wires outside of the key fanout (dffs included) are equal in both copies, since the states of the
+        # copies always start equal: copy 1 takes them from the symbol table of copy 0 at the same frame and
+        # only the key dependent gates are encoded twice
+        self.shared = set(w for w, v in self.obf_template.var.items() if v in self.obf_template.shared)
+        self.key_gates = [g for g in self.obf_template.gates if g[1] not in self.obf_template.shared]
 
-        for w in set(orcl_cir.next_state_wires):
-            if w in orcl_cir.input_wires:
-                # TODO: test for the next states that are connecting to the inputs
-                print(w)
-                orcl_wires[w] = Wire(w, Wire.INPUT, [])
-                orcl_wires[w].formula = Symbol(w)
-            else:
-                orcl_wires[w].formula = Iff(Symbol(w), orcl_wires[w].formula)
+        # key inequality circuit
+        key_xors = []
+        for w in self.obf_cir.key_wires:
+            key_xors.append(Xor(Symbol('{}_0'.format(w)), Symbol('{}_1'.format(w))))
+        self.key_inequality_ckt = Or(key_xors)
 
-        for w in self.obf_cir.output_wires:
-            obf_wires[w].formula = Iff(Symbol(w), obf_wires[w].formula)
+    def symbol_table(self, template, frame, prev, suffix, keys, inputs=None, outputs=None, shared=None):
+        # values of the template variables at a frame: inputs are named w@frame, keys w{keys}, states take
+        # the next state values of the previous frame (prev), outputs and next states are named w{suffix}@frame
+        # inputs and outputs can be bound to constants, the other wires are left to the gate formulas
+        # shared wires take their values from the table of copy 0 (shared), they have no port constraints
+        # returns the table and the constraints of the ports that are not driven by gates
+        circuit = template.circuit
+        var = template.var
+        postfix = '@{}'.format(frame)
+        m = [None] * (template.n_vars + 1)
+        for i, w in enumerate(circuit.input_wires):
+            m[var[w]] = inputs[i] if inputs else Symbol(w + postfix)
+        for w in circuit.key_wires:
+            m[var[w]] = Symbol(w + keys)
+        for w, p in zip(circuit.state_wires, prev):
+            m[var[w]] = p
+        if shared is not None:
+            for i in template.shared:
+                m[i] = shared[i]
 
-        for w in set(obf_cir.next_state_wires):
-            if w not in obf_cir.output_wires:
-                if w in obf_cir.input_wires:
-                    obf_wires[w] = Wire(w, Wire.INPUT, [])
-                    obf_wires[w].formula = Symbol(w)
-                else:
-                    obf_wires[w].formula = Iff(Symbol(w), obf_wires[w].formula)
+        c = []
+        ports = [(w, outputs[i] if outputs else Symbol(w + suffix + postfix)) for i, w in enumerate(circuit.output_wires)]
+        ports += [(w, Symbol(w + suffix + postfix)) for w in circuit.next_state_wires]
+        for w, x in ports:
+            if shared is not None and w in self.shared:
+                continue
+            elif m[var[w]] is None:
+                m[var[w]] = x
+            else:
+                c.append(Iff(constant(x), constant(m[var[w]])))
+        return m, c
 
-        # create key substitution dictionary
-        for w in self.obf_cir.key_wires:
-            self.key_subs[0][Symbol(w)] = Symbol(w + '_0')
-            self.key_subs[1][Symbol(w)] = Symbol(w + '_1')
+    def frame_ckt(self, template, tables, suffix, keys=None, inputs=None, outputs=None, shared=None):
+        # constraints of the next frame of an unrolled circuit copy, tables holds the symbol tables of its frames
+        # shared holds the tables of copy 0 of the obfuscated circuit when tables belong to copy 1
+        frame = len(tables)
+        circuit = template.circuit
+        if frame == 0:
+            # initial states are assumed to be zero
+            tables.append(None)
+            return [Not(Symbol(w + suffix + '@0')) for w in circuit.next_state_wires
+                    if shared is None or w not in self.shared]
 
-        # generate formulas for two copies of obfuscated circuit
-        for w in self.obf_cir.output_wires:
-            self.dip_ckt0.append(substitute(obf_wires[w].formula, self.key_subs[0]))
-            self.dip_ckt1.append(substitute(obf_wires[w].formula, self.key_subs[1]))
+        if frame == 1:
+            prev = [Symbol(w + suffix + '@0') for w in circuit.next_state_wires]
+        else:
+            prev = template.lits(tables[frame - 1], circuit.next_state_wires)
+        m, c = self.symbol_table(template, frame, prev, suffix, keys, inputs, outputs,
+                                 None if shared is None else shared[frame])
+        tables.append(m)
 
-        # converted to set to ignore duplicate next_state_wires
-        for w in self.obf_cir.next_state_wires:
-            self.dip_ckt0.append(substitute(obf_wires[w].formula, self.key_subs[0]))
-            self.dip_ckt1.append(substitute(obf_wires[w].formula, self.key_subs[1]))
+        # internal wires are inlined, gates that drive ports become constraints
+        for gate_type, out, ops in template.gates if shared is None else self.key_gates:
+            f = gate_formula(gate_type, [m[o] for o in ops])
+            x = m[out]
+            if x is None:
+                m[out] = f
+            elif x is True or x is False:
+                if f is True or f is False:
+                    if f is not x:
+                        c.append(FALSE())
+                else:
+                    c.append(f if x else Not(f))
+            else:
+                c.append(Iff(x, constant(f)))
+        return c
 
-        # key inequality circuit
-        key_xors = []
-        for w in self.obf_cir.key_wires:
-            key_xors.append(Xor(Symbol('{}_0'.format(w)), Symbol('{}_1'.format(w))))
-        self.key_inequality_ckt = Or(key_xors)
+    def dip_checker(self, iteration, dis, dis_out):
+        # two copies of the obfuscated circuit with the dis as inputs and the oracle responses as outputs
+        # dis and dis_out are lists of TRUE()/FALSE() per frame, the other wires are named w_copy_iteration@frame
+        c = []
+        tables = [[], []]
+        for copy in range(2):
+            suffix = '_{}_{}'.format(copy, iteration)
+            keys = '_{}'.format(copy)
+            shared = tables[0] if copy else None
+            c += self.frame_ckt(self.obf_template, tables[copy], suffix, shared=shared)
+            for d in range(len(dis)):
+                inputs = [b is TRUE() for b in dis[d]]
+                outputs = [b is TRUE() for b in dis_out[d]]
+                c += self.frame_ckt(self.obf_template, tables[copy], suffix, keys, inputs, outputs, shared)
+        return c
 
     def ce_assumption(self, frame):
         c0 = []
-        # set states of the two copies of the circuit as equal
-        for i in range(len(self.obf_cir.next_state_wires)):
-            c0.append(Iff(Symbol(self.obf_cir.next_state_wires[i] + '_0@0'),
-                          Symbol(self.obf_cir.next_state_wires[i] + '_1@0')))
+        # set states of the two copies of the circuit as equal, shared states are equal by construction
+        for w in self.obf_cir.next_state_wires:
+            if w not in self.shared:
+                c0.append(Iff(Symbol(w + '_0@0'), Symbol(w + '_1@0')))
 
         output_xors = []
-        for w in self.obf_cir.output_wires:
-            output_xors.append(Xor(Symbol(w + '_0@{}'.format(frame)), Symbol(w + '_1@{}'.format(frame))))
-        for w in self.obf_cir.next_state_wires:
-            output_xors.append(Xor(Symbol(w + '_0@{}'.format(frame)), Symbol(w + '_1@{}'.format(frame))))
+        for w in self.obf_cir.output_wires + self.obf_cir.next_state_wires:
+            if w not in self.shared:
+                output_xors.append(Xor(Symbol(w + '_0@{}'.format(frame)), Symbol(w + '_1@{}'.format(frame))))
         return And([Or(output_xors)] + c0)
 
     def dip_gen_assumption(self, frame, initial=None, hd=1):
@@ -116,10 +222,12 @@ class FormulaGenerator:
                 c0.append(Not(Symbol(self.obf_cir.next_state_wires[i] + '_0@0')))
                 c1.append(Not(Symbol(self.obf_cir.next_state_wires[i] + '_1@0')))
 
+        # shared outputs are equal in both copies
         output_xors = []
         if frame > 0:
             for w in self.obf_cir.output_wires:
-                output_xors.append(Xor(Symbol(w + '_0@{}'.format(frame)), Symbol(w + '_1@{}'.format(frame))))
+                if w not in self.shared:
+                    output_xors.append(Xor(Symbol(w + '_0@{}'.format(frame)), Symbol(w + '_1@{}'.format(frame))))
         if hd > 1:
             # TODO: hd>1 is not tested with recent changes
             p = Ite(output_xors[0], BVOne(10), BVZero(10))
@@ -129,125 +237,21 @@ class FormulaGenerator:
                 p = BVAdd(t, p)
             return simplify(BVUGT(p, BV(hd, 10)))
         else:
-            if output_xors:
+            if frame > 0:
                 return And([Or(output_xors)] + c0 + c1)
             else:
                 return And(c0 + c1)
 
-    def subs_list(self, depth, copy):
-        subs = {}
-        depth = str(depth)
-        c = '_{}@'.format(copy)
-        for w in self.obf_cir.input_wires:
-            subs[Symbol(w)] = Symbol(w + '@' + depth)
-        for w in self.obf_cir.output_wires:
-            subs[Symbol(w)] = Symbol(w + c + depth)
-        for w in self.obf_cir.state_wires:
-            subs[Symbol(w)] = Symbol(w + c + depth)
-        for w in self.obf_cir.next_state_wires:
-            subs[Symbol(w)] = Symbol(w + c + depth)
-        return subs
-
     def obf_ckt_at_frame(self, frame):
         # check if it was produced before
-        if len(self.dip_ckt0_frame) <= frame:
-            c0 = []
-            c1 = []
-
-            subs0 = self.subs_list(frame, '0')
-            subs1 = self.subs_list(frame, '1')
-
-            # set initial state for the first copy
-            if frame == 0:
-                for i in range(len(self.obf_cir.next_state_wires)):
-                    # set initial states
-                    c0.append(Not(Symbol(self.obf_cir.next_state_wires[i] + '_0@0')))
-                    c1.append(Not(Symbol(self.obf_cir.next_state_wires[i] + '_1@0')))
-            else:
-                for i in range(len(self.dip_ckt0)):
-                    c0.append(substitute(self.dip_ckt0[i], subs0))
-                    c1.append(substitute(self.dip_ckt1[i], subs1))
-
-                for i in range(len(self.obf_cir.state_wires)):
-                    # state of each frame should be equal with the next state of previous frame
-                    c0.append(Iff(Symbol(self.obf_cir.state_wires[i] + '_0@' + str(frame)),
-                                  Symbol(self.obf_cir.next_state_wires[i] + '_0@' + str(frame-1))))
-                    c1.append(Iff(Symbol(self.obf_cir.state_wires[i] + '_1@' + str(frame)),
-                                  Symbol(self.obf_cir.next_state_wires[i] + '_1@' + str(frame-1))))
-
-            self.dip_ckt0_frame.append(c0)
-            self.dip_ckt1_frame.append(c1)
+        while len(self.dip_ckt0_frame) <= frame:
+            self.dip_ckt0_frame.append(self.frame_ckt(self.obf_template, self.obf_tables[0], '_0', '_0'))
+            self.dip_ckt1_frame.append(self.frame_ckt(self.obf_template, self.obf_tables[1], '_1', '_1',
+                                                      shared=self.obf_tables[0]))
         return self.dip_ckt0_frame[frame], self.dip_ckt1_frame[frame]
 
     def oracle_ckt_at_frame(self, frame):
         # check if it was produced before
-        if len(self.oracle_ckt_frame) <= frame:
-            subs = {}
-            postfix = '@{}'.format(frame)
-            for w in self.orcl_cir.input_wires:
-                subs[Symbol(w)] = Symbol(w + postfix)
-            for w in self.orcl_cir.output_wires:
-                subs[Symbol(w)] = Symbol(w + postfix)
-            for w in self.orcl_cir.state_wires:
-                subs[Symbol(w)] = Symbol(w + postfix)
-            for w in self.orcl_cir.next_state_wires:
-                subs[Symbol(w)] = Symbol(w + postfix)
-
-            c = []
-            if frame == 0:
-                for w in self.orcl_cir.next_state_wires:
-                    # initial states are assumed to be zero
-                    c.append(Not(Symbol(w + '@0')))
-            else:
-                for w in self.orcl_cir.output_wires:
-                    c.append(substitute(self.orcl_cir.wire_objs[w].formula, subs))
-                for w in self.orcl_cir.next_state_wires:
-                    c.append(substitute(self.orcl_cir.wire_objs[w].formula, subs))
-                for i in range(len(self.orcl_cir.state_wires)):
-                    # state of each frame should be equal with the next state of previous frame
-                    c.append(Iff(Symbol(self.orcl_cir.state_wires[i] + '@' + str(frame)),
-                                 Symbol(self.orcl_cir.next_state_wires[i] + '@' + str(frame-1))))
-            self.oracle_ckt_frame.append(c)
+        while len(self.oracle_ckt_frame) <= frame:
+            self.oracle_ckt_frame.append(self.frame_ckt(self.orcl_template, self.orcl_tables, ''))
         return self.oracle_ckt_frame[frame]
-
-
-def gen_wire_formulas(circuit):
-    wires = circuit.wire_objs
-    for w in circuit.sorted_wires:
-        wire = wires[w]
-        lst = []
-        r = None
-        for op in wire.operands:
-            if op in (circuit.input_wires + circuit.key_wires):
-                lst.append(Symbol(op))
-            else:
-                lst.append(wires[op].formula)
-        if wire.type == Wire.DFF:
-            r = Symbol(wire.name)
-        elif wire.type == 'not':
-            r = Not(lst[0])
-        elif wire.type == 'buf':
-            r = lst[0]
-        elif wire.type == 'and':
-            r = And(lst)
-        elif wire.type == 'nand':
-            r = And(lst)
-            r = Not(r)
-        elif wire.type == 'or':
-            r = Or(lst)
-        elif wire.type == 'nor':
-            r = Or(lst)
-            r = Not(r)
-        elif wire.type == 'xor':
-            assert (len(lst) == 2)
-            r = Xor(lst[0], lst[1])
-            # r = And(Or(lst[0], lst[1]), Not(And(lst[0], lst[1])))
-        elif wire.type == 'xnor':
-            assert (len(lst) == 2)
-            r = Xor(lst[0], lst[1])
-            # r = And(Or(lst[0], lst[1]), Not(And(lst[0], lst[1])))
-            r = Not(r)
-        else:
-            logging.critical('unspecified gate type: {}'.format(wire.type))
-            exit()
-        wire.formula = r
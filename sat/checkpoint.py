@@ -0,0 +1,85 @@
+import logging
+import os
+import struct
+import zlib
+
+# file layout, little endian:
+#   header: magic, version, #inputs, #outputs, #keys, iteration, unroll depth, boundary, highest depth, #dis
+#   circuit name: length (uint16) and utf-8 bytes
+#   every dis: depth (uint32), then the input bits and the output bits of all frames, packed 8 per byte
+#   crc32 of everything before it (uint32)
+MAGIC = b'RANECKPT'
+VERSION = 1
+HEADER = struct.Struct('<8sHIIIIIIII')
+
+
+def pack_bits(bits):
+    data = bytearray((len(bits) + 7) // 8)
+    for i, b in enumerate(bits):
+        if b:
+            data[i >> 3] |= 1 << (i & 7)
+    return bytes(data)
+
+
+def unpack_bits(data, count):
+    return [bool(data[i >> 3] >> (i & 7) & 1) for i in range(count)]
+
+
+def save_checkpoint(path, circuit, state):
+    # state: iteration, unroll_depth, boundary, highest_depth and dis, a list of (input frames, output frames)
+    # with frames as lists of booleans; the file is replaced atomically, a crash leaves the last checkpoint
+    n_inputs = len(circuit.input_wires)
+    n_outputs = len(circuit.output_wires)
+    name = circuit.name.encode()
+    chunks = [HEADER.pack(MAGIC, VERSION, n_inputs, n_outputs, len(circuit.key_wires), state['iteration'],
+                          state['unroll_depth'], state['boundary'], state['highest_depth'], len(state['dis'])),
+              struct.pack('<H', len(name)), name]
+    for dis, dis_out in state['dis']:
+        chunks.append(struct.pack('<I', len(dis)))
+        chunks.append(pack_bits([b for frame in dis for b in frame]))
+        chunks.append(pack_bits([b for frame in dis_out for b in frame]))
+    data = b''.join(chunks)
+    data += struct.pack('<I', zlib.crc32(data))
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path, circuit):
+    # the state written by save_checkpoint, None if the file is damaged or belongs to another circuit
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size + 4 or struct.unpack_from('<I', data, len(data) - 4)[0] != zlib.crc32(data[:-4]):
+        logging.critical('checkpoint {} is damaged'.format(path))
+        return None
+    magic, version, n_inputs, n_outputs, n_keys, iteration, unroll_depth, boundary, highest_depth, n_dis = \
+        HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        logging.critical('{} is not a checkpoint of this version'.format(path))
+        return None
+    pos = HEADER.size
+    length = struct.unpack_from('<H', data, pos)[0]
+    name = data[pos + 2:pos + 2 + length].decode()
+    pos += 2 + length
+    if (name, n_inputs, n_outputs, n_keys) != (circuit.name, len(circuit.input_wires), len(circuit.output_wires),
+                                               len(circuit.key_wires)):
+        logging.critical('checkpoint {} belongs to another circuit ({})'.format(path, name))
+        return None
+
+    dis = []
+    for i in range(n_dis):
+        depth = struct.unpack_from('<I', data, pos)[0]
+        pos += 4
+        frames = []
+        for width in (n_inputs, n_outputs):
+            size = (depth * width + 7) // 8
+            bits = unpack_bits(data[pos:pos + size], depth * width)
+            pos += size
+            frames.append([bits[d * width:(d + 1) * width] for d in range(depth)])
+        dis.append(tuple(frames))
+    return {'iteration': iteration, 'unroll_depth': unroll_depth, 'boundary': boundary,
+            'highest_depth': highest_depth, 'dis': dis}
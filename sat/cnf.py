@@ -0,0 +1,175 @@
+import logging
+from common.circuit import Wire
+from common.profiler import profiler
+
+
+def gate_clauses(gate_type, out, ops, new_var, clauses):
+    # appends the tseitin clauses of out = gate_type(ops), literals are non-zero integers
+    # new_var() returns a fresh variable for the intermediate results of multi-input xors
+    if gate_type in (Wire.DFF, Wire.INPUT):
+        # state and input variables are free
+        return
+    elif gate_type in ('nand', 'nor', 'xnor'):
+        gate_type = gate_type[1:] if gate_type != 'xnor' else 'xor'
+        out = -out
+
+    if gate_type == 'buf':
+        clauses.append([-out, ops[0]])
+        clauses.append([out, -ops[0]])
+    elif gate_type == 'not':
+        clauses.append([-out, -ops[0]])
+        clauses.append([out, ops[0]])
+    elif gate_type == 'and':
+        for a in ops:
+            clauses.append([-out, a])
+        clauses.append([out] + [-a for a in ops])
+    elif gate_type == 'or':
+        for a in ops:
+            clauses.append([out, -a])
+        clauses.append([-out] + list(ops))
+    elif gate_type == 'xor':
+        a = ops[0]
+        for i in range(1, len(ops)):
+            b = ops[i]
+            r = out if i == len(ops) - 1 else new_var()
+            clauses.append([-r, a, b])
+            clauses.append([-r, -a, -b])
+            clauses.append([r, -a, b])
+            clauses.append([r, a, -b])
+            a = r
+    elif gate_type == 'mux':
+        # operands are select, then the values for select=0 and select=1
+        s, a, b = ops
+        clauses.append([s, -a, out])
+        clauses.append([s, a, -out])
+        clauses.append([-s, -b, out])
+        clauses.append([-s, b, -out])
+        clauses.append([-a, -b, out])
+        clauses.append([a, b, -out])
+    else:
+        logging.critical('gate type {} is not supported by the cnf encoder'.format(gate_type))
+        exit()
+
+
+class CircuitTemplate:
+    # tseitin clauses of a circuit over local variables 1..n_vars, every wire gets one variable (Wire.lit)
+    # inputs, keys and dffs are free variables, instances map them to solver literals or constants
+    def __init__(self, circuit):
+        self.circuit = circuit
+        self.var = {}
+        for w in circuit.input_wires + circuit.key_wires + circuit.sorted_wires:
+            self.var[w] = len(self.var) + 1
+        self.n_vars = len(self.var)
+
+        # wires outside of the key fanout can be shared by instances that only differ in their keys
+        cones = circuit.cones()
+        dependent = set(cones.wire_names(cones.key_fanout()))
+        self.shared = set(self.var[w] for w in self.var if w not in dependent)
+
+        # gates as (type, output variable, operand variables) in topological order, and their clauses
+        # key_clauses are the clauses of the gates in the key fanout
+        wires = circuit.wire_objs
+        self.gates = []
+        self.clauses = []
+        self.key_clauses = []
+        for w in circuit.sorted_wires:
+            wire = wires[w]
+            wire.lit = self.var[w]
+            ops = [self.var[o] for o in wire.operands]
+            first_clause = len(self.clauses)
+            first_var = self.n_vars
+            gate_clauses(wire.type, wire.lit, ops, self.new_var, self.clauses)
+            if wire.type not in (Wire.DFF, Wire.INPUT):
+                self.gates.append((wire.type, wire.lit, ops))
+            if wire.lit in self.shared:
+                # intermediate variables of multi-input xors belong to their gate
+                self.shared.update(range(first_var + 1, self.n_vars + 1))
+            else:
+                self.key_clauses += self.clauses[first_clause:]
+
+    def new_var(self):
+        self.n_vars += 1
+        return self.n_vars
+
+    def instantiate(self, binding, new_var, shared=None):
+        # binding maps wire names to solver literals or True/False, unbound variables get fresh solver variables
+        # shared is the literal map of an instance with the same inputs (and outputs, if they are bound), its
+        # wires outside of the key fanout are reused and only the clauses of the key dependent gates are added
+        # clauses satisfied by a constant are dropped and false literals are removed
+        # returns the clauses of the instance and its literal map
+        m = [None] * (self.n_vars + 1)
+        for w, v in binding.items():
+            m[self.var[w]] = v
+        if shared is not None:
+            for i in self.shared:
+                m[i] = shared[i]
+        for i in range(1, self.n_vars + 1):
+            if m[i] is None:
+                m[i] = new_var()
+
+        clauses = []
+        for c in self.clauses if shared is None else self.key_clauses:
+            lits = []
+            for l in c:
+                v = m[l] if l > 0 else m[-l]
+                if v is True or v is False:
+                    if v == (l > 0):
+                        break
+                else:
+                    lits.append(v if l > 0 else -v)
+            else:
+                clauses.append(lits)
+        return clauses, m
+
+    def lits(self, m, names):
+        # literals (or constants) of the given wires in an instance
+        return [m[self.var[w]] for w in names]
+
+
+def sat_available():
+    # true if python-sat is installed
+    try:
+        import pysat.solvers
+    except ImportError:
+        return False
+    return True
+
+
+class SatSolver:
+    # incremental sat solver with assumptions, pysat is only needed by the cnf engine
+    def __init__(self, name):
+        try:
+            from pysat.solvers import Solver, NoSuchSolverError
+        except ImportError:
+            logging.critical('the cnf engine needs python-sat (pip install python-sat)')
+            exit()
+        try:
+            self.solver = Solver(name=name)
+        except NoSuchSolverError:
+            logging.critical('unknown sat solver: {}'.format(name))
+            exit()
+        self.n_vars = 0
+        self.model = None
+
+    def new_var(self):
+        self.n_vars += 1
+        return self.n_vars
+
+    def add_clauses(self, clauses):
+        self.solver.append_formula(clauses)
+        profiler.count('clauses', len(clauses))
+
+    def solve(self, assumptions=()):
+        if self.solver.solve(assumptions=assumptions):
+            self.model = self.solver.get_model()
+            return True
+        self.model = None
+        return False
+
+    def value(self, lit):
+        # value of a literal in the last model, variables that do not appear in any clause are false
+        if lit is True or lit is False:
+            return lit
+        v = abs(lit)
+        r = v <= len(self.model) and self.model[v - 1] > 0
+        return r if lit > 0 else not r
@@ -1,9 +1,21 @@
 import argparse
 import logging
-from pysmt.shortcuts import Solver, And, Iff, TRUE, FALSE, Not, substitute, simplify, Symbol, Xor, Or
-from common.circuit import sort_circuits
+import multiprocessing
+from copy import copy
+from multiprocessing.connection import wait
+from pysmt.shortcuts import Solver, And, Iff, TRUE, FALSE, Not, substitute, Symbol, Xor, Or
+from common.circuit import Circuit, sort_circuits
+from common.strash import strash
 from common.utils import logo, resource_usage
-from file.bench import bench2circuit
+from file.bench import load_circuit
+from file.binary import EXTENSION
+from sat.oracle import get_oracle
+from sat.cnf import CircuitTemplate, SatSolver, gate_clauses, sat_available
+from sim.keyeval import KeyEvaluator, validate_key
+from common.profiler import profiler, solver_conflicts
+
+# failing random queries of an error estimate that are added to the attack (approximate mode, -a)
+FAILING = 8
 
 
 class FormulaGenerator:
@@ -24,14 +36,22 @@ class FormulaGenerator:
             self.key_subs[0][Symbol(w)] = Symbol(w + '_0')
             self.key_subs[1][Symbol(w)] = Symbol(w + '_1')
 
+        # outputs outside of the key fanout are equal in both copies and their value only depends on the dip,
+        # they are left out of the miter and of the dip checkers
+        # key independent subformulas are the same pysmt nodes in both copies, so they are encoded once
+        cones = self.obf_cir.cones()
+        dependent = set(cones.wire_names(cones.key_fanout()))
+        self.key_outputs = [i for i, w in enumerate(self.obf_cir.output_wires) if w in dependent]
+
         # generate formulas for two copies of obfuscated circuit
         ckt1 = []
         ckt2 = []
-        for w in self.obf_cir.output_wires:
+        for i in self.key_outputs:
+            w = self.obf_cir.output_wires[i]
             ckt1.append(substitute(obf_wires[w].formula, self.key_subs[0]))
             ckt2.append(substitute(obf_wires[w].formula, self.key_subs[1]))
         output_xors = []
-        for i in range(len(self.obf_cir.output_wires)):
+        for i in range(len(ckt1)):
             output_xors.append(Xor(ckt1[i], ckt2[i]))
         self.dip_gen_ckt = Or(output_xors)
 
@@ -47,12 +67,21 @@ class FormulaGenerator:
             output_xors.append(Xor(key_symbols1[i], key_symbols2[i]))
         self.key_inequality_ckt = Or(output_xors)
 
-        # dip checker circuit
-        self.dip_chk1 = []
-        self.dip_chk2 = []
-        for w in self.obf_cir.output_wires:
-            self.dip_chk1.append(substitute(obf_wires[w].formula, self.key_subs[0]))
-            self.dip_chk2.append(substitute(obf_wires[w].formula, self.key_subs[1]))
+        # dip checker circuit, for the outputs in key_outputs
+        self.dip_chk1 = ckt1
+        self.dip_chk2 = ckt2
+
+    def oracle_ckt_at_frame(self, frame):
+        # the oracle is combinational, inputs and outputs of the single frame are named w@1
+        if frame == 0:
+            return []
+        subs = {}
+        for w in self.orcl_cir.input_wires:
+            subs[Symbol(w)] = Symbol(w + '@{}'.format(frame))
+        c = []
+        for w in self.orcl_cir.output_wires:
+            c.append(Iff(Symbol(w + '@{}'.format(frame)), substitute(self.orcl_cir.wire_objs[w].formula, subs)))
+        return c
 
     def gen_wire_formulas(self, circuit):
         wires = circuit.wire_objs
@@ -101,12 +130,27 @@ class CombAttack:
         self.obf_ast = None
         self.oracle_cir = None
         self.obf_cir = None
+        self.iteration = 0
+        self.key = None
+        self.error_rate = None
+        self.partitions = None
+        self.evaluator = None
 
     def perform(self):
-        if '.bench' in args.b:
+        if self.args.f:
+            profiler.open(self.args.f)
+        try:
+            self.attack()
+        finally:
+            profiler.summary()
+            profiler.dump()
+
+    def attack(self):
+        if '.bench' in self.args.b or self.args.b.endswith(EXTENSION):
             logging.warning("reading bench inputs")
-            self.obf_cir = bench2circuit(args.o)
-            self.oracle_cir = bench2circuit(args.b)
+            with profiler.span('parse'):
+                self.obf_cir = load_circuit(self.args.o)
+                self.oracle_cir = load_circuit(self.args.b)
         else:
             logging.critical('disabled!')
             exit
@@ -117,20 +161,293 @@ class CombAttack:
             # self.oracle_cir = self.oracle_ast.get_circuit(check_correctness=False, correct_order=False)
             # self.obf_cir = self.obf_ast.get_circuit(check_correctness=False, correct_order=False)
 
+        if self.args.x:
+            with profiler.span('strash'):
+                strash(self.oracle_cir)
+                strash(self.obf_cir)
+
         # TODO: these three lines are added for .v format and has not been thoroughly tested
-        self.oracle_cir.create_ce_circuit()
-        self.obf_cir.create_ce_circuit()
-        sort_circuits(self.oracle_cir, self.obf_cir)
+        with profiler.span('levelize'):
+            self.oracle_cir.create_ce_circuit()
+            self.obf_cir.create_ce_circuit()
+            sort_circuits(self.oracle_cir, self.obf_cir)
+
+        if self.args.a:
+            if self.args.j:
+                logging.critical('the approximate mode needs the whole circuit, it cannot be used with -j')
+                exit()
+            self.evaluator = KeyEvaluator(self.oracle_cir, self.obf_cir)
+
+        if self.args.e == 'cnf' and not sat_available():
+            logging.warning('python-sat is not installed, using the smt engine')
+            self.args.e = 'smt'
+
+        if self.args.e == 'smt':
+            if self.args.j:
+                logging.critical('the partitioned attack needs the cnf engine')
+                exit()
+            self.comb_attack()
+        elif self.args.e == 'cnf':
+            self.cnf_attack()
+        else:
+            logging.critical('unknown engine: {}'.format(self.args.e))
+            exit()
+
+    def cnf_attack(self):
+        if self.obf_cir.state_wires:
+            logging.critical('the combinational attack does not support dffs')
+            exit()
+        if self.args.j:
+            self.partitioned_attack()
+            return
 
-        self.comb_attack()
+        with profiler.span('formula'):
+            oracle = self.cnf_oracle()
+        bits, self.iteration = self.dip_loop(self.obf_cir, oracle, '')
+        if bits is None:
+            logging.critical('key solver returned UNSAT')
+            return
+        self.key = ''.join('1' if bits[w] else '0' for w in self.obf_cir.key_wires)
+        print("key=%s" % self.key)
+        self.validate()
+
+    def validate(self):
+        # error rate of the key on args.v random patterns, the oracle is simulated
+        if self.args.v:
+            with profiler.span('validate'):
+                self.error_rate = validate_key(self.oracle_cir, self.obf_cir, self.key, self.args.v)
+
+    def estimate(self, key, iteration):
+        # approximate mode: error rate of the current key on args.m random patterns and up to FAILING of the
+        # patterns it gets wrong, which are added to the attack like dips
+        with profiler.span('estimate'):
+            result = self.evaluator.evaluate([key], self.args.m, max_failing=FAILING)[0]
+        logging.warning('estimated error rate {:.6f} after {} iterations'.format(result['error_rate'], iteration))
+        profiler.count('random_queries', len(result['failing']))
+        return result['error_rate'], [sequence[0] for sequence in result['failing']]
+
+    def cnf_oracle(self):
+        # the solver oracle still uses pysmt formulas, with any installed smt solver
+        frame_ckt = FormulaGenerator(self.oracle_cir, self.obf_cir).oracle_ckt_at_frame if self.args.q == 'solver' else None
+        return get_oracle(self.args.q, self.oracle_cir, frame_ckt, None)
+
+    def dip_loop(self, circuit, oracle, label):
+        # miter and dip checkers are instances of one tseitin template of the obfuscated circuit
+        # clauses go straight into a single incremental solver, the miter is enabled by an activation literal
+        # circuit is the obfuscated circuit or the fanin cones of some of its outputs (see partitioned_attack),
+        # inputs outside of the cones are 0 in the oracle queries
+        # returns the values of the key wires of circuit (None if there is no key) and the number of iterations
+        solver = SatSolver(self.args.s or 'glucose4')
+        with profiler.span('formula'):
+            template = CircuitTemplate(circuit)
+        input_wires = circuit.input_wires
+        output_wires = circuit.output_wires
+        in_pos = dict((w, i) for i, w in enumerate(self.obf_cir.input_wires))
+        in_pos = [in_pos[w] for w in input_wires]
+        out_pos = dict((w, i) for i, w in enumerate(self.obf_cir.output_wires))
+        out_pos = [out_pos[w] for w in output_wires]
+
+        inputs = {w: solver.new_var() for w in input_wires}
+        keys = [{w: solver.new_var() for w in circuit.key_wires} for _ in range(2)]
+        # the second copy of the miter and of every dip checker pair shares the wires outside of the key fanout
+        key_gates = sum(1 for g in template.gates if g[1] not in template.shared)
+        logging.warning('{}{} of {} gates depend on the key'.format(label, key_gates, len(template.gates)))
+        outputs = []
+        with profiler.span('constraints'):
+            m = None
+            for k in keys:
+                binding = dict(inputs)
+                binding.update(k)
+                clauses, m = template.instantiate(binding, solver.new_var, m)
+                solver.add_clauses(clauses)
+                outputs.append(template.lits(m, output_wires))
+
+            # act -> at least one output of the two copies differs, shared outputs never do
+            act = solver.new_var()
+            clauses = []
+            diffs = []
+            for o1, o2 in zip(outputs[0], outputs[1]):
+                if o1 == o2:
+                    continue
+                diffs.append(solver.new_var())
+                gate_clauses('xor', diffs[-1], [o1, o2], solver.new_var, clauses)
+            clauses.append([-act] + diffs)
+            solver.add_clauses(clauses)
+
+        def add_checkers(dips):
+            queries = []
+            for dip in dips:
+                query = [False] * len(self.obf_cir.input_wires)
+                for i, b in zip(in_pos, dip):
+                    query[i] = b
+                queries.append([query])
+            with profiler.span('oracle'):
+                responses = oracle.query(queries)
+
+            for dip, response in zip(dips, responses):
+                dip_out = [response[0][i] for i in out_pos]
+                logging.info(dip_out)
+
+                # both key copies should produce the oracle outputs for the dip
+                with profiler.span('constraints'):
+                    m = None
+                    for k in keys:
+                        binding = dict(zip(input_wires, dip))
+                        binding.update(k)
+                        binding.update(zip(output_wires, dip_out))
+                        clauses, m = template.instantiate(binding, solver.new_var, m)
+                        solver.add_clauses(clauses)
+
+        # up to args.n dips per round, each one is blocked (under act) before the next one is drawn
+        # the oracle answers all dips of a round in one query and all their checkers go in before the next round
+        iteration = 0
+        next_estimate = self.args.a
+        while 1:
+            dips = []
+            with profiler.span('dip_solve'):
+                while len(dips) < self.args.n and solver.solve([act]):
+                    dips.append([solver.value(inputs[w]) for w in input_wires])
+                    if len(dips) < self.args.n:
+                        solver.add_clauses([[-act] + [-inputs[w] if b else inputs[w]
+                                                      for w, b in zip(input_wires, dips[-1])]])
+            if not dips:
+                break
+            logging.info(dips)
+            add_checkers(dips)
+
+            iteration += len(dips)
+            logging.warning('{}iteration: {}'.format(label, iteration))
+            profiler.next_iteration(dips=len(dips), conflicts=solver_conflicts(solver.solver))
+
+            if self.args.a and iteration >= next_estimate:
+                # approximate mode: any key that agrees with the dips so far, the attack stops if it is good enough
+                next_estimate = iteration + self.args.a
+                with profiler.span('key'):
+                    if not solver.solve():
+                        break
+                bits = dict((w, solver.value(keys[0][w])) for w in circuit.key_wires)
+                self.error_rate, failing = self.estimate([bits[w] for w in circuit.key_wires], iteration)
+                if self.error_rate <= self.args.r:
+                    logging.warning('{}approximate key after {} iterations'.format(label, iteration))
+                    return bits, iteration
+                add_checkers(failing)
+        # the estimate of the last key does not hold for the exact key
+        self.error_rate = None
+
+        logging.warning('{}print keys'.format(label))
+        with profiler.span('key'):
+            found = solver.solve()
+        if not found:
+            return None, iteration
+        return dict((w, solver.value(keys[0][w])) for w in circuit.key_wires), iteration
+
+    def key_partitions(self):
+        # groups of outputs whose fanin cones share key inputs, as (key bitset, outputs) of the cone index
+        # outputs that do not depend on the key are left out
+        cones = self.obf_cir.cones()
+        groups = []
+        for o in self.obf_cir.output_wires:
+            keys = cones.support(o) & cones.key_mask
+            if not keys:
+                continue
+            # the key sets of the groups are disjoint, every group that shares a key with o is merged
+            merged = [keys, [o]]
+            rest = []
+            for g in groups:
+                if g[0] & keys:
+                    merged[0] |= g[0]
+                    merged[1] += g[1]
+                else:
+                    rest.append(g)
+            groups = rest + [merged]
+        order = dict((w, i) for i, w in enumerate(self.obf_cir.output_wires))
+        for g in groups:
+            g[1].sort(key=lambda w: order[w])
+        groups.sort(key=lambda g: -bin(g[0]).count('1'))
+        return groups
+
+    def cone_circuit(self, outputs):
+        # the fanin cones of outputs as a circuit of their own, with copies of the wire objects of obf_cir since
+        # their fanouts and levels are those of the cone
+        cones = self.obf_cir.cones()
+        bits = 0
+        for o in outputs:
+            bits |= cones.fanin(o)
+        names = set(cones.wire_names(bits))
+        wires = self.obf_cir.wire_objs
+        circuit = Circuit(self.obf_cir.name)
+        circuit.wire_objs = dict((w, copy(wires[w])) for w in wires if w in names)
+        circuit.input_wires = [w for w in self.obf_cir.input_wires if w in names]
+        circuit.key_wires = [w for w in self.obf_cir.key_wires if w in names]
+        circuit.output_wires = list(outputs)
+        circuit.state_wires = []
+        circuit.levelize()
+        return circuit
+
+    def partition_worker(self, part, conn):
+        # runs in a forked process, the circuits of the parent are shared copy on write
+        # the trace file belongs to the parent
+        profiler.path = None
+        circuit = self.cone_circuit(self.partitions[part][1])
+        oracle = self.cnf_oracle()
+        conn.send(self.dip_loop(circuit, oracle, 'partition {}: '.format(part)))
+        conn.close()
+
+    def partitioned_attack(self):
+        # outputs whose fanin cones share no key input are attacked separately, in up to args.j processes
+        # every partition runs its own dip loop on the fanin cones of its outputs, the key bits are merged at the end
+        with profiler.span('partition'):
+            self.partitions = self.key_partitions()
+        sizes = [bin(keys).count('1') for keys, outputs in self.partitions]
+        logging.warning('{} key partitions with {} keys'.format(len(sizes), ' '.join(str(n) for n in sizes)))
+
+        bits = {}
+        waiting = list(range(len(self.partitions)))
+        running = {}
+        with profiler.span('partition_attack'):
+            while waiting or running:
+                while waiting and len(running) < self.args.j:
+                    part = waiting.pop(0)
+                    parent, child = multiprocessing.Pipe(duplex=False)
+                    p = multiprocessing.Process(target=self.partition_worker, args=(part, child), daemon=True)
+                    p.start()
+                    child.close()
+                    running[parent] = (part, p)
+                for conn in wait(list(running)):
+                    part, p = running.pop(conn)
+                    try:
+                        part_bits, iterations = conn.recv()
+                    except EOFError:
+                        # the worker died without an answer, that says nothing about the key
+                        p.join()
+                        for other, q in running.values():
+                            q.terminate()
+                        raise RuntimeError('partition {} worker crashed with exit code {}'.format(part, p.exitcode))
+                    p.join()
+                    self.iteration += iterations
+                    if part_bits is None:
+                        logging.critical('key solver of partition {} returned UNSAT'.format(part))
+                        for other, p in running.values():
+                            p.terminate()
+                        return
+                    bits.update(part_bits)
+
+        for w in self.obf_cir.key_wires:
+            if w not in bits:
+                logging.warning('{} does not affect any output'.format(w))
+        self.key = ''.join('1' if bits.get(w) else '0' for w in self.obf_cir.key_wires)
+        logging.warning('iterations: {}'.format(self.iteration))
+        print("key=%s" % self.key)
+        self.validate()
 
     def comb_attack(self):
         # dis generator
-        solver_name = 'btor'
+        solver_name = self.args.s or 'btor'
         solver_obf = Solver(name=solver_name)
         solver_key = Solver(name=solver_name)
-        solver_oracle = Solver(name=solver_name)
-        attack_formulas = FormulaGenerator(self.oracle_cir, self.obf_cir)
+        with profiler.span('formula'):
+            attack_formulas = FormulaGenerator(self.oracle_cir, self.obf_cir)
+            oracle = get_oracle(self.args.q, self.oracle_cir, attack_formulas.oracle_ckt_at_frame, solver_name)
 
         f = attack_formulas.dip_gen_ckt
         # f = simplify(f)
@@ -140,63 +457,89 @@ class CombAttack:
         # f = simplify(f)
         solver_obf.add_assertion(f)
 
-        iteration = 0
-        while 1:
-            # query dip generator
-            if solver_obf.solve():
-                dip_formula = []
-                dip_boolean = []
-                for l in self.obf_cir.input_wires:
-                    t = Symbol(l)
-                    if solver_obf.get_py_value(t):
-                        dip_formula.append(t)
-                        dip_boolean.append(TRUE())
-                    else:
-                        dip_formula.append(Not(t))
-                        dip_boolean.append(FALSE())
-                logging.info(dip_formula)
-
-                # query oracle
-                dip_out = []
-                for l in self.oracle_cir.output_wires:
-                    t = self.oracle_cir.wire_objs[l].formula
-                    solver_oracle.reset_assertions()
-                    solver_oracle.add_assertion(t)
-                    if solver_oracle.solve(dip_formula):
-                        dip_out.append(TRUE())
-                    else:
-                        dip_out.append(FALSE())
+        def add_checkers(dips):
+            # query oracle
+            with profiler.span('oracle'):
+                responses = oracle.query([[dip] for dip in dips])
+
+            for dip, response in zip(dips, responses):
+                dip_boolean = [TRUE() if b else FALSE() for b in dip]
+                dip_out = [TRUE() if b else FALSE() for b in response[0]]
                 logging.info(dip_out)
 
                 # add dip checker
-                f = []
-                for i in range(len(attack_formulas.dip_chk1)):
-                    f.append(And(Iff(dip_out[i], attack_formulas.dip_chk1[i]),
-                                 Iff(dip_out[i], attack_formulas.dip_chk2[i])))
-                f = And(f)
-
-                subs = {}
-                for i in range(len(self.obf_cir.input_wires)):
-                    subs[Symbol(self.obf_cir.input_wires[i])] = dip_boolean[i]
-
-                # f = simplify(f)
-                f = substitute(f, subs)
-                solver_obf.add_assertion(f)
-                solver_key.add_assertion(f)
-
-                iteration += 1
-                logging.warning('iteration: {}'.format(iteration))
+                with profiler.span('formula'):
+                    f = []
+                    for i, o in enumerate(attack_formulas.key_outputs):
+                        f.append(And(Iff(dip_out[o], attack_formulas.dip_chk1[i]),
+                                     Iff(dip_out[o], attack_formulas.dip_chk2[i])))
+                    f = And(f)
+
+                    subs = {}
+                    for i in range(len(self.obf_cir.input_wires)):
+                        subs[Symbol(self.obf_cir.input_wires[i])] = dip_boolean[i]
+
+                    # f = simplify(f)
+                    f = substitute(f, subs)
+                with profiler.span('constraints'):
+                    solver_obf.add_assertion(f)
+                    solver_key.add_assertion(f)
+                profiler.count('assertions', 2)
+
+        def key_value():
+            key = ''
+            for i in range(len(self.obf_cir.key_wires)):
+                k = 'keyinput{}_0'.format(i)
+                if solver_key.get_py_value(Symbol(k)):
+                    key += '1'
+                else:
+                    key += '0'
+            return key
+
+        next_estimate = self.args.a
+        while 1:
+            # query dip generator, up to args.n dips per round
+            # the blocking clauses can stay, a dip is no dip anymore once its checker is added
+            dips = []
+            with profiler.span('dip_solve'):
+                while len(dips) < self.args.n and solver_obf.solve():
+                    dips.append([solver_obf.get_py_value(Symbol(l)) for l in self.obf_cir.input_wires])
+                    if len(dips) < self.args.n:
+                        solver_obf.add_assertion(Or([Not(Symbol(l)) if b else Symbol(l)
+                                                     for l, b in zip(self.obf_cir.input_wires, dips[-1])]))
+            if dips:
+                logging.info(dips)
+                add_checkers(dips)
+
+                self.iteration += len(dips)
+                logging.warning('iteration: {}'.format(self.iteration))
+                profiler.next_iteration(dips=len(dips), conflicts=solver_conflicts(solver_obf))
+
+                if self.args.a and self.iteration >= next_estimate:
+                    # approximate mode: any key that agrees with the dips so far, the attack stops if it is good enough
+                    next_estimate = self.iteration + self.args.a
+                    with profiler.span('key'):
+                        found = solver_key.solve()
+                    if found:
+                        key = key_value()
+                        self.error_rate, failing = self.estimate(key, self.iteration)
+                        if self.error_rate <= self.args.r:
+                            logging.warning('approximate key after {} iterations'.format(self.iteration))
+                            self.key = key
+                            print("key=%s" % key)
+                            self.validate()
+                            return
+                        add_checkers(failing)
             else:
+                # the estimate of the last key does not hold for the exact key
+                self.error_rate = None
                 logging.warning('print keys')
-                if solver_key.solve():
-                    key = ''
-                    for i in range(len(self.obf_cir.key_wires)):
-                        k = 'keyinput{}_0'.format(i)
-                        if solver_key.get_py_value(Symbol(k)):
-                            key += '1'
-                        else:
-                            key += '0'
-                    print("key=%s" % key)
+                with profiler.span('key'):
+                    found = solver_key.solve()
+                if found:
+                    self.key = key_value()
+                    print("key=%s" % self.key)
+                    self.validate()
                 else:
                     logging.critical('key solver returned UNSAT')
                 return
@@ -208,6 +551,26 @@ if __name__ == "__main__":
     parser.add_argument("-p", action="store", default=0, type=int, help="print info=1 and debug=2, default warning=0")
     parser.add_argument("-b", action="store", required=True, type=str, help="original benchmark path")
     parser.add_argument("-o", action="store", required=True, type=str, help="obfuscated benchmark path")
+    parser.add_argument("-q", action="store", default='sim', type=str, help="oracle backend: sim, solver, default=sim")
+    parser.add_argument("-e", action="store", default='cnf', type=str, help="attack engine: cnf, smt, default=cnf")
+    parser.add_argument("-s", action="store", default=None, type=str,
+                        help="solver name, default=glucose4 for cnf and btor for smt")
+    parser.add_argument("-f", action="store", default=None, type=str, help="write a timing trace to this json/csv file")
+    parser.add_argument("-j", action="store", default=None, type=int,
+                        help="attack the independent key partitions of the outputs separately in this many processes (cnf)")
+    parser.add_argument("-n", action="store", default=1, type=int,
+                        help="dips drawn per solver round and answered by one oracle query, default=1")
+    parser.add_argument("-v", action="store", default=0, type=int,
+                        help="check the key on this many random patterns against the oracle, default=0 (off)")
+    parser.add_argument("-a", action="store", default=0, type=int,
+                        help="approximate mode: estimate the error rate of the current key every this many "
+                             "iterations and stop once it is low enough, default=0 (exact attack)")
+    parser.add_argument("-r", action="store", default=0.01, type=float,
+                        help="error rate at which the approximate mode stops, default=0.01")
+    parser.add_argument("-m", action="store", default=1024, type=int,
+                        help="random patterns of every error estimate, default=1024")
+    parser.add_argument("-x", action="store_true",
+                        help="structural hashing and constant propagation of both circuits before they are encoded")
     args = parser.parse_args()
 
     if args.p == 0:
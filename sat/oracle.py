@@ -0,0 +1,61 @@
+import logging
+import pysmt.shortcuts as pysmt
+
+
+class SimOracle:
+    # answers oracle queries with the bit-parallel simulator
+    def __init__(self, circuit):
+        from sim.simulator import Simulator
+        self.simulator = Simulator(circuit)
+
+    def query(self, sequences):
+        return self.simulator.simulate(sequences)
+
+
+class SolverOracle:
+    # answers oracle queries by solving the unrolled oracle circuit
+    # frame_ckt(frame) returns the oracle constraints of that frame, inputs and outputs are named w@frame
+    # the unrolling stays in the solver and only grows, input sequences are passed as assumptions
+    def __init__(self, circuit, frame_ckt, solver_name):
+        self.circuit = circuit
+        self.frame_ckt = frame_ckt
+        self.solver = pysmt.Solver(name=solver_name)
+        self.depth = 0
+        self.input_symbols = [None]
+        self.output_symbols = [None]
+        for c in self.frame_ckt(0):
+            self.solver.add_assertion(c)
+
+    def unroll(self, depth):
+        # adds the frames up to depth
+        while self.depth < depth:
+            self.depth += 1
+            for c in self.frame_ckt(self.depth):
+                self.solver.add_assertion(c)
+            self.input_symbols.append([pysmt.Symbol(w + '@{}'.format(self.depth)) for w in self.circuit.input_wires])
+            self.output_symbols.append([pysmt.Symbol(w + '@{}'.format(self.depth)) for w in self.circuit.output_wires])
+
+    def query(self, sequences):
+        results = []
+        for sequence in sequences:
+            self.unroll(len(sequence))
+            assumptions = []
+            for d in range(1, len(sequence) + 1):
+                for s, b in zip(self.input_symbols[d], sequence[d - 1]):
+                    assumptions.append(s if b else pysmt.Not(s))
+            if not self.solver.solve(assumptions):
+                logging.critical('something is wrong in oracle query')
+                exit()
+            results.append([[self.solver.get_py_value(s) for s in self.output_symbols[d]]
+                            for d in range(1, len(sequence) + 1)])
+        return results
+
+
+def get_oracle(name, circuit, frame_ckt, solver_name):
+    if name == 'sim':
+        return SimOracle(circuit)
+    elif name == 'solver':
+        return SolverOracle(circuit, frame_ckt, solver_name)
+    else:
+        logging.critical('unknown oracle backend: {}'.format(name))
+        exit()
@@ -0,0 +1,194 @@
+import fcntl
+import io
+import json
+import logging
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+import pysmt.shortcuts as pysmt
+from pysmt.smtlib.script import smtlibscript_from_formula
+from common.profiler import profiler
+
+
+def to_smtlib(formula):
+    f = io.StringIO()
+    smtlibscript_from_formula(formula).serialize(f, daggify=True)
+    return f.getvalue()
+
+
+def solver_worker(name, conn):
+    # one replica of the portfolio, assertions and queries arrive as smt-lib scripts
+    # answers carry the id of their query, so answers to queries that another replica won can be dropped
+    from pysmt.smtlib.parser import SmtLibParser
+    parser = SmtLibParser()
+    solver = pysmt.Solver(name=name)
+    while 1:
+        cmd, data = conn.recv()
+        if cmd == 'assert':
+            for script in data:
+                solver.add_assertion(parser.get_script(io.StringIO(script)).get_last_formula())
+        elif cmd == 'solve':
+            qid, script = data
+            conn.send((qid, solver.is_sat(parser.get_script(io.StringIO(script)).get_last_formula())))
+        elif cmd == 'values':
+            conn.send([solver.get_py_value(pysmt.Symbol(n)) for n in data])
+        elif cmd == 'exit':
+            return
+
+
+class Portfolio:
+    # races every satisfiability query over several pysmt solvers in separate processes
+    # the first answer is taken, the other replicas keep their state and finish the query before the next one,
+    # their late answers are dropped; a replica that is still busy with a query after restart seconds is
+    # restarted and replays all assertions, a replica that dies is left out
+    def __init__(self, names, restart=300):
+        available = pysmt.get_env().factory.all_solvers()
+        self.names = [n for n in names if n in available]
+        for n in names:
+            if n not in available:
+                logging.warning('solver {} is not installed, removed from the portfolio'.format(n))
+        if not self.names:
+            logging.critical('none of the portfolio solvers are installed: {}'.format(', '.join(names)))
+            exit()
+
+        self.restart = restart
+        self.log = []
+        self.pending = []
+        self.workers = {}
+        # start times of the queries each replica has not answered yet
+        self.running = {}
+        self.query_id = 0
+        self.winner = None
+        self.wins = dict((n, 0) for n in self.names)
+        for n in self.names:
+            self.spawn(n)
+
+    def spawn(self, name):
+        parent, child = multiprocessing.Pipe()
+        p = multiprocessing.Process(target=solver_worker, args=(name, child), daemon=True)
+        p.start()
+        child.close()
+        if self.log:
+            parent.send(('assert', self.log))
+        self.workers[name] = (p, parent)
+        self.running[name] = []
+
+    def stop(self, name):
+        p, conn = self.workers.pop(name)
+        del self.running[name]
+        p.terminate()
+        p.join()
+
+    def send(self, name, message):
+        # to all replicas if name is None, the replicas that died are left out
+        for n in [name] if name else list(self.workers):
+            try:
+                self.workers[n][1].send(message)
+            except (EnvironmentError, EOFError):
+                self.lost(n)
+
+    def lost(self, name):
+        logging.warning('solver {} died, removed from the portfolio'.format(name))
+        self.stop(name)
+        if not self.workers:
+            logging.critical('all portfolio solvers died')
+            exit()
+
+    def add_assertion(self, formula):
+        self.pending.append(formula)
+
+    def flush(self):
+        if self.pending:
+            script = to_smtlib(pysmt.And(self.pending))
+            self.pending = []
+            self.log.append(script)
+            self.send(None, ('assert', [script]))
+
+    def is_sat(self, formula):
+        self.flush()
+        for n in list(self.workers):
+            if self.running[n] and time.time() - self.running[n][0] > self.restart:
+                logging.warning('{} is busy for more than {}s, restarting it'.format(n, self.restart))
+                self.stop(n)
+                self.spawn(n)
+
+        self.query_id += 1
+        query = (self.query_id, to_smtlib(formula))
+        start = time.time()
+        for n in self.workers:
+            self.running[n].append(start)
+        self.send(None, ('solve', query))
+
+        result = None
+        while result is None:
+            conns = dict((conn, n) for n, (p, conn) in self.workers.items())
+            for conn in wait(list(conns)):
+                n = conns[conn]
+                try:
+                    qid, answer = conn.recv()
+                except EOFError:
+                    self.lost(n)
+                    continue
+                self.running[n].pop(0)
+                if qid == self.query_id and result is None:
+                    self.winner = n
+                    result = (answer,)
+        self.wins[self.winner] += 1
+        profiler.count('race_s', time.time() - start)
+        logging.debug('{} answered first'.format(self.winner))
+        return result[0]
+
+    def solve(self):
+        return self.is_sat(pysmt.TRUE())
+
+    def get_values(self, formulas):
+        # values of boolean symbols in the model of the last winner
+        conn = self.workers[self.winner][1]
+        conn.send(('values', [f.symbol_name() for f in formulas]))
+        values = conn.recv()
+        return dict((f, pysmt.Bool(v)) for f, v in zip(formulas, values))
+
+    def get_py_value(self, formula):
+        return self.get_values([formula])[formula].constant_value()
+
+    def best(self):
+        return max(self.names, key=lambda n: self.wins[n])
+
+    def close(self):
+        for n in list(self.workers):
+            self.stop(n)
+
+
+def load_winners(path):
+    if path and os.path.isfile(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except ValueError:
+            logging.warning('{} is not a portfolio winners file'.format(path))
+    return {}
+
+
+def best_solver(path, circuit):
+    # solver that won most of the queries of the last portfolio run on the circuit, None if it was not raced
+    entry = load_winners(path).get(circuit)
+    if entry:
+        return entry['best']
+    return None
+
+
+def record_winner(path, circuit, wins):
+    # wins maps solver (or engine) names to the number of queries they answered first
+    if not path or not wins:
+        return
+    # parallel runs take turns on the file, which is replaced atomically
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        winners = load_winners(path)
+        winners[circuit] = {'best': max(wins, key=lambda n: wins[n]), 'wins': wins}
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(winners, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+    logging.warning('{} won the portfolio on {}'.format(winners[circuit]['best'], circuit))
@@ -1,12 +1,20 @@
 import argparse
 import logging
 import multiprocessing
+import os
 import time
 import pysmt.shortcuts as pysmt
 from common.circuit import sort_circuits
-from file.bench import bench2circuit
-from sat.attack_comps import FormulaGenerator, get_formulas
+from common.strash import strash
+from file.bench import load_circuit
+from file.binary import EXTENSION
+from sat.attack_comps import FormulaGenerator
+from sat.checkpoint import save_checkpoint, load_checkpoint
+from sat.oracle import get_oracle
+from sat.portfolio import Portfolio, best_solver, record_winner
+from sim.keyeval import validate_key
 from common.utils import logo, execution_time
+from common.profiler import profiler, solver_conflicts
 
 
 def main(config):
@@ -16,7 +24,21 @@ def main(config):
     parser.add_argument("-b", action="store", required=True, type=str, help="original benchmark path")
     parser.add_argument("-o", action="store", required=True, type=str, help="obfuscated benchmark path")
     parser.add_argument("-t", action="store", default=7200, type=int, help="timeout in seconds, default=7200")
-    parser.add_argument("-s", action="store", required=False, type=str, help="solver: btor, msat, z3, yices, picosat, cvc4")
+    parser.add_argument("-s", action="store", required=False, type=str,
+                        help="solver: btor, msat, z3, yices, picosat, cvc4, or a comma separated list to race them")
+    parser.add_argument("-q", action="store", required=False, type=str, help="oracle backend: sim, solver")
+    parser.add_argument("-f", action="store", required=False, type=str, help="write a timing trace to this json/csv file")
+    parser.add_argument("-n", action="store", required=False, type=int,
+                        help="dis drawn per solver round and answered by one oracle query")
+    parser.add_argument("-c", action="store", required=False, type=str,
+                        help="checkpoint file, the attack resumes from it if it exists")
+    parser.add_argument("-v", action="store", required=False, type=int,
+                        help="check the key on this many random sequences against the oracle")
+    parser.add_argument("-w", action="store", required=False, type=str,
+                        help="portfolio winners file, the winner of a raced run is recorded in it and used when no "
+                             "solver is given")
+    parser.add_argument("-x", action="store_true",
+                        help="structural hashing and constant propagation of both circuits before they are encoded")
     args = parser.parse_args()
 
     if args.p == 0:
@@ -26,8 +48,26 @@ def main(config):
     elif args.p == 2:
         logging.getLogger().setLevel(level=logging.DEBUG)
 
+    if args.w:
+        config.portfolio_db = args.w
     if args.s:
         config.solver = args.s
+    else:
+        # solver that won the last portfolio run on this circuit
+        best = best_solver(config.portfolio_db, args.o[args.o.rfind("/")+1:args.o.rfind(".")])
+        if best:
+            logging.warning('using {}, the winner of the last portfolio run'.format(best))
+            config.solver = best
+    if args.q:
+        config.oracle = args.q
+    if args.n:
+        config.batch = args.n
+    if args.c:
+        config.checkpoint = args.c
+    if args.v:
+        config.validate = args.v
+    if args.x:
+        config.strash = True
 
     timeout = args.t
     start = time.time()
@@ -61,17 +101,37 @@ class PyAttack:
 
         self.unroll_depth = 1
         self.highest_depth = 0
+        self.key = None
+        self.error_rate = None
         self.iteration = 0
         self.solver_obf = None
         self.solver_key = None
-        self.solver_oracle = None
+        self.oracle = None
         self.attack_formulas = None
+        # dis and oracle responses as booleans, for checkpoints
+        self.dis_history = []
+        self.last_checkpoint = time.time()
 
     def perform(self):
-        # process inputs
-        if '.bench' in self.args.b:
-            self.obf_cir = bench2circuit(self.args.o)
-            self.oracle_cir = bench2circuit(self.args.b)
+        if self.args.f:
+            profiler.open(self.args.f)
+        try:
+            return self.attack()
+        finally:
+            if isinstance(self.solver_obf, Portfolio):
+                record_winner(self.config.portfolio_db, self.obf_cir.name, self.solver_obf.wins)
+                self.solver_obf.close()
+            profiler.summary()
+            profiler.dump()
+
+    def attack(self):
+        # process inputs, circuits can also be given by the caller (e.g. gate level netlists of the formal flow)
+        if self.obf_cir is not None:
+            pass
+        elif '.bench' in self.args.b or self.args.b.endswith(EXTENSION):
+            with profiler.span('parse'):
+                self.obf_cir = load_circuit(self.args.o)
+                self.oracle_cir = load_circuit(self.args.b)
         else:
             logging.critical('verilog input is disabled! use main_formal')
             exit()
@@ -81,51 +141,71 @@ class PyAttack:
         #     self.oracle_cir = self.oracle_ast.get_circuit(check_correctness=False, correct_order=False)
         #     self.obf_cir = self.obf_ast.get_circuit(check_correctness=False, correct_order=False)
 
-        self.oracle_cir.create_ce_circuit()
-        self.obf_cir.create_ce_circuit()
-        sort_circuits(self.oracle_cir, self.obf_cir)
+        if self.config.strash:
+            with profiler.span('strash'):
+                strash(self.oracle_cir)
+                strash(self.obf_cir)
+
+        with profiler.span('levelize'):
+            self.oracle_cir.create_ce_circuit()
+            self.obf_cir.create_ce_circuit()
+            sort_circuits(self.oracle_cir, self.obf_cir)
 
         # perform attack
-        self.solver_obf = pysmt.Solver(name=self.solver_name)
+        if ',' in self.solver_name:
+            # dip generation queries are raced over all solvers, the rest uses the first available one
+            self.solver_obf = Portfolio(self.solver_name.split(','))
+            self.solver_name = self.solver_obf.names[0]
+        else:
+            self.solver_obf = pysmt.Solver(name=self.solver_name)
         self.solver_key = pysmt.Solver(name=self.solver_name)
-        self.solver_oracle = pysmt.Solver(name=self.solver_name)
 
         logging.warning('initial value for boundary={}, step={}, stop={}'.format(self.boundary, self.step, self.stop))
-        logging.warning('solver={}'.format(self.solver_name))
+        logging.warning('solver={}, oracle={}'.format(self.config.solver, self.config.oracle))
 
-        self.attack_formulas = FormulaGenerator(self.oracle_cir, self.obf_cir)
+        with profiler.span('formula'):
+            self.attack_formulas = FormulaGenerator(self.oracle_cir, self.obf_cir)
+            self.oracle = get_oracle(self.config.oracle, self.oracle_cir, self.attack_formulas.oracle_ckt_at_frame,
+                                     self.solver_name)
 
         # add k0 != k1
         self.solver_obf.add_assertion(self.attack_formulas.key_inequality_ckt)
 
+        if self.config.checkpoint and os.path.isfile(self.config.checkpoint):
+            self.resume()
+
         # assumptions for inequality of dip generator outputs
-        assumptions = self.attack_formulas.dip_gen_assumption(1)
+        assumptions = self.attack_formulas.dip_gen_assumption(self.unroll_depth)
 
-        # get initial states and the first copy of the circuit
-        for i in range(2):
-            c0, c1 = self.attack_formulas.obf_ckt_at_frame(i)
-            for j in range(len(c0)):
-                self.solver_obf.add_assertion(c0[j])
-                self.solver_obf.add_assertion(c1[j])
+        # get initial states and the copies of the circuit up to the unroll depth
+        for i in range(self.unroll_depth + 1):
+            self.add_frame(i)
 
         while 1:
+            self.checkpoint()
             # query dip generator
-            if self.solver_obf.is_sat(assumptions):
-                dis_boolean = self.query_dip_generator()
-
-                dis_formula = []
-                for i in range(1, len(dis_boolean) + 1):
-                    dis_formula.append(get_formulas(self.obf_cir.input_wires, dis_boolean[i-1], '@{}'.format(i)))
-                logging.info(dis_formula)
-
-                dis_out = self.query_oracle(dis_formula)
-                self.add_dip_checker(dis_boolean, dis_out)
+            with profiler.span('dip_solve'):
+                found = self.solver_obf.is_sat(assumptions)
+            if found:
+                batch = self.query_dis_batch(assumptions)
+                logging.info(batch)
+
+                with profiler.span('oracle'):
+                    outputs = self.query_oracle(batch)
+                for dis_boolean, dis_out in zip(batch, outputs):
+                    self.add_dip_checker(dis_boolean, dis_out)
+                    self.iteration += 1
+                    self.dis_history.append(([[b is pysmt.TRUE() for b in frame] for frame in dis_boolean],
+                                             [[b is pysmt.TRUE() for b in frame] for frame in dis_out]))
 
-                self.iteration += 1
                 logging.warning('iteration={}, depth={}'.format(self.iteration, self.unroll_depth))
                 self.highest_depth = self.unroll_depth
+                profiler.next_iteration(depth=self.unroll_depth, dips=len(batch),
+                                        conflicts=solver_conflicts(self.solver_obf))
             else:
-                if (self.solver_obf.is_sat(pysmt.TRUE()) or self.iteration == 0) and self.unroll_depth < self.stop:
+                with profiler.span('uc_check'):
+                    agreeing = self.solver_obf.is_sat(pysmt.TRUE())
+                if (agreeing or self.iteration == 0) and self.unroll_depth < self.stop:
                     # two agreeing keys are found, but no dip can be found
                     # also it should keep unrolling the circuit until at least one dip is found
                     #  then it can decide on uc success
@@ -145,11 +225,7 @@ class PyAttack:
                         # increase unroll depth
                         self.unroll_depth += 1
                         assumptions = self.attack_formulas.dip_gen_assumption(self.unroll_depth)
-
-                        c0, c1 = self.attack_formulas.obf_ckt_at_frame(self.unroll_depth)
-                        for i in range(len(c0)):
-                            self.solver_obf.add_assertion(c0[i])
-                            self.solver_obf.add_assertion(c1[i])
+                        self.add_frame(self.unroll_depth)
                         logging.warning('increasing unroll depth to {}'.format(self.unroll_depth))
                 elif self.unroll_depth >= self.stop:
                     logging.warning('stopped at {}'.format(self.stop))
@@ -161,87 +237,109 @@ class PyAttack:
                     self.print_keys()
                     return True
 
-    def query_dip_generator(self):
-        dis_boolean = []
+    def checkpoint(self):
+        # writes the attack state every config.checkpoint_interval seconds
+        if not self.config.checkpoint or time.time() - self.last_checkpoint < self.config.checkpoint_interval:
+            return
+        with profiler.span('checkpoint'):
+            save_checkpoint(self.config.checkpoint, self.obf_cir,
+                            {'iteration': self.iteration, 'unroll_depth': self.unroll_depth,
+                             'boundary': self.boundary, 'highest_depth': self.highest_depth,
+                             'dis': self.dis_history})
+        self.last_checkpoint = time.time()
+        logging.info('checkpoint written to {}'.format(self.config.checkpoint))
+
+    def resume(self):
+        # restores the state of a checkpoint, the dip checkers of all dis are replayed as one assertion
+        state = load_checkpoint(self.config.checkpoint, self.obf_cir)
+        if state is None:
+            exit()
+        self.iteration = state['iteration']
+        self.unroll_depth = state['unroll_depth']
+        self.boundary = state['boundary']
+        self.highest_depth = state['highest_depth']
+        self.dis_history = state['dis']
+
+        with profiler.span('resume'):
+            c = []
+            for i, (dis, responses) in enumerate(self.dis_history):
+                dis_boolean = [[pysmt.TRUE() if b else pysmt.FALSE() for b in frame] for frame in dis]
+                dis_out = [[pysmt.TRUE() if b else pysmt.FALSE() for b in frame] for frame in responses]
+                c += self.attack_formulas.dip_checker(i, dis_boolean, dis_out)
+            self.solver_obf.add_assertion(pysmt.And(c))
+            self.solver_key.add_assertion(pysmt.And(c))
+        profiler.count('assertions', len(c))
+        logging.warning('resumed from {}: iteration={}, depth={}, boundary={}'.format(
+            self.config.checkpoint, self.iteration, self.unroll_depth, self.boundary))
 
-        for d in range(1, self.unroll_depth + 1):
-            dip_boolean = []
-            for w in self.obf_cir.input_wires:
-                f = pysmt.Symbol(w + '@{}'.format(d))
-                if self.solver_obf.get_py_value(f):
-                    dip_boolean.append(pysmt.TRUE())
-                else:
-                    dip_boolean.append(pysmt.FALSE())
-            dis_boolean.append(dip_boolean)
+    def query_dip_generator(self):
+        # all input values are read in one call, it is a round trip to a worker in portfolio mode
+        symbols = [[pysmt.Symbol(w + '@{}'.format(d)) for w in self.obf_cir.input_wires]
+                   for d in range(1, self.unroll_depth + 1)]
+        values = self.solver_obf.get_values([f for frame in symbols for f in frame])
 
+        dis_boolean = []
+        for frame in symbols:
+            dis_boolean.append([pysmt.TRUE() if values[f].is_true() else pysmt.FALSE() for f in frame])
         return dis_boolean
 
-    def query_oracle(self, dis_formula):
-        self.solver_oracle.reset_assertions()
-        c0 = self.attack_formulas.oracle_ckt_at_frame(0)
-        for i in range(len(c0)):
-            self.solver_oracle.add_assertion(c0[i])
-
-        dis_out = []
-        for d in range(1, self.unroll_depth + 1):
-            c0 = self.attack_formulas.oracle_ckt_at_frame(d)
-            for i in range(len(c0)):
-                self.solver_oracle.add_assertion(c0[i])
-
-            self.solver_oracle.add_assertion(pysmt.And(dis_formula[d - 1]))
-            if not self.solver_oracle.is_sat(pysmt.TRUE()):
-                logging.critical('something is wrong in oracle query')
-                exit()
-            else:
-                dip_out = []
-                # for w in self.oracle_cir.output_wires:
-                for w in self.obf_cir.output_wires:
-                    f = pysmt.Symbol(w + '@{}'.format(d))
-                    dip_out.append(self.solver_oracle.get_value(f))
-                dis_out.append(dip_out)
-        logging.info(dis_out)
-        return dis_out
+    def query_dis_batch(self, assumptions):
+        # the dis of the last model and up to config.batch - 1 more of the same depth, each dis is blocked
+        # before the next one is drawn; the blocking clauses only hold under an activation symbol of this round,
+        # since a blocked dis can still be the prefix of a longer dis
+        batch = [self.query_dip_generator()]
+        act = pysmt.FreshSymbol()
+        while len(batch) < self.config.batch:
+            block = []
+            for d, dip_boolean in enumerate(batch[-1]):
+                for w, b in zip(self.obf_cir.input_wires, dip_boolean):
+                    f = pysmt.Symbol(w + '@{}'.format(d + 1))
+                    block.append(pysmt.Not(f) if b is pysmt.TRUE() else f)
+            self.solver_obf.add_assertion(pysmt.Implies(act, pysmt.Or(block)))
+            with profiler.span('dip_solve'):
+                if not self.solver_obf.is_sat(pysmt.And(assumptions, act)):
+                    break
+            batch.append(self.query_dip_generator())
+        return batch
+
+    def query_oracle(self, batch):
+        # all sequences of a batch go to the oracle in one query
+        sequences = [[[b is pysmt.TRUE() for b in dip_boolean] for dip_boolean in dis_boolean] for dis_boolean in batch]
+        outputs = self.oracle.query(sequences)
+
+        batch_out = []
+        for sequence in outputs:
+            batch_out.append([[pysmt.TRUE() if b else pysmt.FALSE() for b in dip_out] for dip_out in sequence])
+        logging.info(batch_out)
+        return batch_out
+
+    def add_frame(self, frame):
+        # adds both copies of the obfuscated circuit at a frame to the dip generator
+        with profiler.span('formula'):
+            c0, c1 = self.attack_formulas.obf_ckt_at_frame(frame)
+        with profiler.span('constraints'):
+            # copy 1 has no constraints for the wires it shares with copy 0
+            for f in c0 + c1:
+                self.solver_obf.add_assertion(f)
+        profiler.count('assertions', len(c0) + len(c1))
 
     def add_dip_checker(self, dis_boolean, dis_out):
-        for d in range(self.unroll_depth + 1):
-            c0, c1 = self.attack_formulas.obf_ckt_at_frame(d)
-            subs = {}
-            c2 = []
-
-            if d > 0:
-                dip_out = dis_out[d - 1]
-                for i in range(len(self.obf_cir.output_wires)):
-                    subs[pysmt.Symbol(self.obf_cir.output_wires[i] + '_0@{}'.format(d))] = dip_out[i]
-                    subs[pysmt.Symbol(self.obf_cir.output_wires[i] + '_1@{}'.format(d))] = dip_out[i]
-
-                dip_boolean = dis_boolean[d - 1]
-                for i in range(len(self.obf_cir.input_wires)):
-                    subs[pysmt.Symbol(self.obf_cir.input_wires[i] + '@{}'.format(d))] = dip_boolean[i]
-
-                for i in range(len(self.obf_cir.next_state_wires)):
-                    subs[pysmt.Symbol(self.obf_cir.next_state_wires[i] + '_0@{}'.format(d - 1))] = pysmt.Symbol(self.obf_cir.next_state_wires[i] + '_0_{}@{}'.format(self.iteration, d - 1))
-                    subs[pysmt.Symbol(self.obf_cir.next_state_wires[i] + '_1@{}'.format(d - 1))] = pysmt.Symbol(self.obf_cir.next_state_wires[i] + '_1_{}@{}'.format(self.iteration, d - 1))
-                    subs[pysmt.Symbol(self.obf_cir.next_state_wires[i] + '_0@{}'.format(d))] = pysmt.Symbol(self.obf_cir.next_state_wires[i] + '_0_{}@{}'.format(self.iteration, d))
-                    subs[pysmt.Symbol(self.obf_cir.next_state_wires[i] + '_1@{}'.format(d))] = pysmt.Symbol(self.obf_cir.next_state_wires[i] + '_1_{}@{}'.format(self.iteration, d))
-                    subs[pysmt.Symbol(self.obf_cir.state_wires[i] + '_0@{}'.format(d))] = pysmt.Symbol(self.obf_cir.state_wires[i] + '_0_{}@{}'.format(self.iteration, d))
-                    subs[pysmt.Symbol(self.obf_cir.state_wires[i] + '_1@{}'.format(d))] = pysmt.Symbol(self.obf_cir.state_wires[i] + '_1_{}@{}'.format(self.iteration, d))
-            else:
-                for i in range(len(self.obf_cir.next_state_wires)):
-                    subs[pysmt.Symbol(self.obf_cir.next_state_wires[i] + '_0@{}'.format(d))] = pysmt.Symbol(self.obf_cir.next_state_wires[i] + '_0_{}@{}'.format(self.iteration, d))
-                    subs[pysmt.Symbol(self.obf_cir.next_state_wires[i] + '_1@{}'.format(d))] = pysmt.Symbol(self.obf_cir.next_state_wires[i] + '_1_{}@{}'.format(self.iteration, d))
-
-            c = pysmt.substitute(pysmt.And(c0 + c1 + c2), subs)
-            self.solver_obf.add_assertion(c)
-            self.solver_key.add_assertion(c)
+        with profiler.span('formula'):
+            c = self.attack_formulas.dip_checker(self.iteration, dis_boolean, dis_out)
+        with profiler.span('constraints'):
+            self.solver_obf.add_assertion(pysmt.And(c))
+            self.solver_key.add_assertion(pysmt.And(c))
+        profiler.count('assertions', len(c))
 
     def ce_check(self):
-        c0, c1 = self.attack_formulas.obf_ckt_at_frame(1)
-        for i in range(len(c0)):
-            self.solver_key.add_assertion(c0[i])
-            self.solver_key.add_assertion(c1[i])
-
-        assumptions = self.attack_formulas.ce_assumption(1)
-        if self.solver_key.is_sat(assumptions):
+        with profiler.span('ce_check'):
+            c0, c1 = self.attack_formulas.obf_ckt_at_frame(1)
+            for f in c0 + c1:
+                self.solver_key.add_assertion(f)
+
+            assumptions = self.attack_formulas.ce_assumption(1)
+            ce_failed = self.solver_key.is_sat(assumptions)
+        if ce_failed:
             logging.warning('ce failed')
             return False
         else:
@@ -255,22 +353,28 @@ class PyAttack:
         return False
 
     def print_keys(self):
-        # logging.warning('print keys')
-        # add initial states
-        c0, c1 = self.attack_formulas.obf_ckt_at_frame(0)
-        for i in range(len(c0)):
-            self.solver_key.add_assertion(c0[i])
-            self.solver_key.add_assertion(c1[i])
-        if self.solver_key.solve():
-            key = ''
-            for w in self.obf_cir.key_wires:
-                k = w + '_0'
-                if self.solver_key.get_py_value(pysmt.Symbol(k)):
-                    key += '1'
-                else:
-                    key += '0'
-            logging.warning('iterations={}, highest depth={}'.format(self.iteration, self.highest_depth))
-            # logging.warning("key=%s" % key[::-1])
-            logging.warning("key=%s" % key)
-        else:
-            logging.warning('something is wrong! could not find a correct key')
+        with profiler.span('key'):
+            # logging.warning('print keys')
+            # add initial states
+            c0, c1 = self.attack_formulas.obf_ckt_at_frame(0)
+            for f in c0 + c1:
+                self.solver_key.add_assertion(f)
+            if self.solver_key.solve():
+                key = ''
+                for w in self.obf_cir.key_wires:
+                    k = w + '_0'
+                    if self.solver_key.get_py_value(pysmt.Symbol(k)):
+                        key += '1'
+                    else:
+                        key += '0'
+                self.key = key
+                logging.warning('iterations={}, highest depth={}'.format(self.iteration, self.highest_depth))
+                # logging.warning("key=%s" % key[::-1])
+                logging.warning("key=%s" % key)
+            else:
+                logging.warning('something is wrong! could not find a correct key')
+        if self.key and self.config.validate:
+            # random sequences as long as the unrolling
+            with profiler.span('validate'):
+                self.error_rate = validate_key(self.oracle_cir, self.obf_cir, self.key, self.config.validate,
+                                               self.unroll_depth)
@@ -0,0 +1,155 @@
+import argparse
+import logging
+import numpy as np
+from common.circuit import sort_circuits
+from common.utils import logo
+from sim.simulator import Simulator, WORD_BITS, ALL_ONES
+
+# words of one signal array of the simulator (slots x keys x pattern words), larger key sets are split
+MAX_WORDS = 1 << 24
+
+
+def popcount(words):
+    # number of set bits of uint64 words, summed over the last axis
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    return np.unpackbits(words.view(np.uint8), axis=-1).sum(axis=-1, dtype=np.int64)
+
+
+def key_bits(key):
+    # key strings as printed by the attacks ('0110') or lists of booleans, in the order of the key wires
+    return [c == '1' for c in key] if isinstance(key, str) else [bool(b) for b in key]
+
+
+class KeyEvaluator:
+    # compares candidate keys of the obfuscated circuit with the oracle on random input patterns
+    # all keys are simulated at once: signals are (keys, words) arrays with 64 patterns per uint64 word,
+    # the oracle is simulated once per pattern set; sequential circuits start from the all-zero state
+    def __init__(self, oracle_cir, obf_cir, seed=None):
+        self.oracle_cir = oracle_cir
+        self.obf_cir = obf_cir
+        self.oracle = Simulator(oracle_cir)
+        self.obf = Simulator(obf_cir)
+        self.rng = np.random.default_rng(seed)
+
+    def random_inputs(self, n_patterns, depth=1):
+        # input words of each frame, the bits past n_patterns are 0
+        n_words = max(1, (n_patterns + WORD_BITS - 1) // WORD_BITS)
+        frames = []
+        for d in range(depth):
+            words = self.rng.integers(0, 1 << 64, size=(len(self.oracle_cir.input_wires), n_words),
+                                      dtype=np.uint64, endpoint=False)
+            words &= self.valid_mask(n_patterns, n_words)
+            frames.append(words)
+        return frames
+
+    @staticmethod
+    def valid_mask(n_patterns, n_words):
+        mask = np.full(n_words, ALL_ONES, dtype=np.uint64)
+        if n_patterns % WORD_BITS:
+            mask[-1] = np.uint64((1 << (n_patterns % WORD_BITS)) - 1)
+        return mask
+
+    def evaluate(self, keys, n_patterns=4096, depth=1, max_failing=0, frames=None):
+        # error rate (share of patterns with a wrong output in any frame) and hamming distance (wrong output bits
+        # per pattern) of every key, with up to max_failing input sequences that the key gets wrong
+        # frames are the input words of random_inputs, new random patterns are drawn if none are given
+        if frames is None:
+            frames = self.random_inputs(n_patterns, depth)
+        else:
+            depth = len(frames)
+        n_words = frames[0].shape[1]
+        valid = self.valid_mask(n_patterns, n_words)
+
+        expected = []
+        state = None
+        for inputs in frames:
+            outputs, state = self.oracle.evaluate(inputs, None, state)
+            expected.append(outputs)
+
+        bits = np.array([key_bits(k) for k in keys], dtype=bool).reshape(len(keys), len(self.obf_cir.key_wires))
+        chunk = max(1, MAX_WORDS // max(1, self.obf.n_slots * n_words))
+        results = []
+        for start in range(0, len(keys), chunk):
+            # (n_keys, keys of the chunk, 1), broadcast over the pattern words
+            key_words = np.where(bits[start:start + chunk].T, ALL_ONES, np.uint64(0))[:, :, None]
+            wrong = np.zeros((key_words.shape[1], n_words), dtype=np.uint64)
+            hamming = np.zeros(key_words.shape[1], dtype=np.int64)
+            state = None
+            for inputs, oracle_out in zip(frames, expected):
+                outputs, state = self.obf.evaluate(inputs[:, None, :], key_words, state)
+                diff = (outputs ^ oracle_out[:, None, :]) & valid
+                wrong |= np.bitwise_or.reduce(diff, axis=0)
+                hamming += popcount(diff.transpose(1, 0, 2).reshape(diff.shape[1], -1))
+            errors = popcount(wrong)
+            for k in range(len(errors)):
+                result = {'error_rate': int(errors[k]) / n_patterns, 'hamming': int(hamming[k]) / n_patterns,
+                          'failing': []}
+                if max_failing and errors[k]:
+                    result['failing'] = self.failing(frames, wrong[k], max_failing)
+                results.append(result)
+        return results
+
+    def failing(self, frames, wrong, limit):
+        # input sequences of the first patterns set in the wrong words
+        ids = np.flatnonzero(np.unpackbits(wrong.view(np.uint8), bitorder='little'))[:limit]
+        sequences = []
+        for j in ids:
+            word, bit = divmod(int(j), WORD_BITS)
+            sequences.append([((inputs[:, word] >> np.uint64(bit)) & np.uint64(1)).astype(bool).tolist()
+                              for inputs in frames])
+        return sequences
+
+    def filter(self, keys, n_patterns=4096, depth=1, threshold=0.0):
+        # keys with an error rate of at most threshold, all keys are checked on the same patterns
+        results = self.evaluate(keys, n_patterns, depth)
+        return [k for k, r in zip(keys, results) if r['error_rate'] <= threshold]
+
+
+def validate_key(oracle_cir, obf_cir, key, n_patterns, depth=1):
+    # error rate of a key found by an attack, logged and returned
+    result = KeyEvaluator(oracle_cir, obf_cir).evaluate([key], n_patterns, depth)[0]
+    logging.warning('key error rate {:.6f}, hamming distance {:.4f} on {} random patterns'.format(
+        result['error_rate'], result['hamming'], n_patterns))
+    return result['error_rate']
+
+
+if __name__ == "__main__":
+    logo()
+    parser = argparse.ArgumentParser(description='Error rates of candidate keys on random patterns')
+    parser.add_argument("-p", action="store", default=0, type=int, help="print info=1 and debug=2, default warning=0")
+    parser.add_argument("-b", action="store", required=True, type=str, help="original benchmark path")
+    parser.add_argument("-o", action="store", required=True, type=str, help="obfuscated benchmark path")
+    parser.add_argument("-k", action="store", required=True, type=str,
+                        help="comma separated keys, or a file with one key per line")
+    parser.add_argument("-n", action="store", default=4096, type=int, help="random patterns, default=4096")
+    parser.add_argument("-d", action="store", default=1, type=int, help="frames of every pattern, default=1")
+    parser.add_argument("-r", action="store", default=None, type=int, help="random seed")
+    args = parser.parse_args()
+
+    if args.p == 0:
+        logging.getLogger().setLevel(level=logging.WARNING)
+    elif args.p == 1:
+        logging.getLogger().setLevel(level=logging.INFO)
+    elif args.p == 2:
+        logging.getLogger().setLevel(level=logging.DEBUG)
+
+    from file.bench import load_circuit
+    oracle_cir = load_circuit(args.b)
+    obf_cir = load_circuit(args.o)
+    oracle_cir.create_ce_circuit()
+    obf_cir.create_ce_circuit()
+    sort_circuits(oracle_cir, obf_cir)
+
+    if ',' in args.k or all(c in '01' for c in args.k):
+        candidates = args.k.split(',')
+    else:
+        with open(args.k) as f:
+            candidates = [line.strip() for line in f if line.strip()]
+    for k in candidates:
+        if len(k) != len(obf_cir.key_wires) or any(c not in '01' for c in k):
+            logging.critical('{} is not a key of {} bits'.format(k, len(obf_cir.key_wires)))
+            exit()
+
+    evaluator = KeyEvaluator(oracle_cir, obf_cir, args.r)
+    for k, r in zip(candidates, evaluator.evaluate(candidates, args.n, args.d)):
+        print('{} error_rate={:.6f} hamming={:.4f}'.format(k, r['error_rate'], r['hamming']))
@@ -0,0 +1,117 @@
+import logging
+import numpy as np
+from common.circuit import Wire
+
+WORD_BITS = 64
+ALL_ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def pack_patterns(patterns, width):
+    # packs a list of boolean patterns into uint64 words, pattern j goes to bit j%64 of word j//64
+    n_words = max(1, (len(patterns) + WORD_BITS - 1) // WORD_BITS)
+    bits = np.zeros((width, n_words * WORD_BITS), dtype=np.uint8)
+    if patterns:
+        bits[:, :len(patterns)] = np.array(patterns, dtype=np.uint8).reshape(len(patterns), width).T
+    return np.packbits(bits, axis=1, bitorder='little').view(np.uint64)
+
+
+def unpack_patterns(words, count):
+    # inverse of pack_patterns, returns a list of boolean patterns
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    bits = np.unpackbits(words.view(np.uint8), axis=1, bitorder='little')[:, :count]
+    return bits.T.astype(bool).tolist()
+
+
+class Simulator:
+    # levelized bit-parallel simulator, each signal holds 64 patterns per uint64 word
+    def __init__(self, circuit):
+        self.circuit = circuit
+        wires = circuit.wire_objs
+
+        # slots: inputs, keys, then wires in topological order
+        self.slots = {}
+        for w in circuit.input_wires + circuit.key_wires + circuit.sorted_wires:
+            self.slots[w] = len(self.slots)
+        self.n_slots = len(self.slots)
+
+        self.input_slots = np.array([self.slots[w] for w in circuit.input_wires], dtype=np.intp)
+        self.key_slots = np.array([self.slots[w] for w in circuit.key_wires], dtype=np.intp)
+        self.output_slots = np.array([self.slots[w] for w in circuit.output_wires], dtype=np.intp)
+        self.state_slots = np.array([self.slots[w] for w in circuit.state_wires], dtype=np.intp)
+        self.next_state_slots = np.array([self.slots[w] for w in circuit.next_state_wires], dtype=np.intp)
+
+        # group gates of each level by type and number of operands
+        levels = {}
+        for w in circuit.sorted_wires:
+            wire = wires[w]
+            if wire.type == Wire.DFF:
+                continue
+            elif wire.type not in ('not', 'buf', 'and', 'nand', 'or', 'nor', 'xor', 'xnor', 'mux'):
+                logging.critical('gate type {} is not supported by the simulator'.format(wire.type))
+                exit()
+            key = (wire.type, len(wire.operands))
+            levels.setdefault(wire.logic_level, {}).setdefault(key, []).append(w)
+
+        self.schedule = []
+        for level in sorted(levels):
+            for (gate_type, _), group in levels[level].items():
+                outs = np.array([self.slots[w] for w in group], dtype=np.intp)
+                ops = np.array([[self.slots[o] for o in wires[w].operands] for w in group], dtype=np.intp)
+                self.schedule.append((gate_type, outs, ops))
+
+    def evaluate(self, inputs, keys=None, state=None):
+        # inputs: (n_inputs, ...) words, keys: (n_keys, ...) words, state: (n_states, ...) words
+        # returns output and next state words
+        inputs = np.asarray(inputs, dtype=np.uint64)
+        shape = np.broadcast_shapes(inputs.shape[1:],
+                                    () if keys is None else np.shape(keys)[1:],
+                                    () if state is None else np.shape(state)[1:])
+        values = np.zeros((self.n_slots,) + shape, dtype=np.uint64)
+        values[self.input_slots] = inputs
+        if keys is not None and len(self.key_slots):
+            values[self.key_slots] = keys
+        if state is not None and len(self.state_slots):
+            values[self.state_slots] = state
+
+        for gate_type, outs, ops in self.schedule:
+            if gate_type == 'buf':
+                values[outs] = values[ops[:, 0]]
+            elif gate_type == 'not':
+                values[outs] = ~values[ops[:, 0]]
+            elif gate_type == 'mux':
+                s = values[ops[:, 0]]
+                values[outs] = (~s & values[ops[:, 1]]) | (s & values[ops[:, 2]])
+            else:
+                v = values[ops]
+                if gate_type in ('and', 'nand'):
+                    r = np.bitwise_and.reduce(v, axis=1)
+                elif gate_type in ('or', 'nor'):
+                    r = np.bitwise_or.reduce(v, axis=1)
+                else:
+                    r = np.bitwise_xor.reduce(v, axis=1)
+                if gate_type in ('nand', 'nor', 'xnor'):
+                    r = ~r
+                values[outs] = r
+        return values[self.output_slots], values[self.next_state_slots]
+
+    def simulate(self, sequences, keys=None):
+        # sequences: list of input sequences, each one a list of frames (lists of booleans)
+        # all circuits start from the all-zero state, returns output sequences with the same shape
+        if not sequences:
+            return []
+        depth = max(len(s) for s in sequences)
+        n_inputs = len(self.input_slots)
+
+        key_words = None
+        if keys is not None:
+            key_words = np.where(np.array(keys, dtype=bool), ALL_ONES, np.uint64(0))[:, None]
+
+        state = None
+        frames = []
+        for d in range(depth):
+            patterns = [s[d] if d < len(s) else [False] * n_inputs for s in sequences]
+            inputs = pack_patterns(patterns, n_inputs)
+            outputs, state = self.evaluate(inputs, key_words, state)
+            frames.append(unpack_patterns(outputs, len(sequences)))
+
+        return [[frames[d][i] for d in range(len(s))] for i, s in enumerate(sequences)]
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# tests run against the tree and never read or write the netlist cache
+os.environ.pop('RANE_CACHE', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
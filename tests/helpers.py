@@ -0,0 +1,35 @@
+import os
+import random
+from common.circuit import sort_circuits
+from file.bench import bench2circuit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH = os.path.join(ROOT, 'benchmarks', 'bench')
+
+
+def bench(*path):
+    return os.path.join(BENCH, *path)
+
+
+def bench_key(path):
+    # the correct key of a locked benchmark, from its first line ('# key=...')
+    with open(path) as f:
+        return f.readline().split('key=')[1].strip()
+
+
+def load_pair(original, obfuscated=None):
+    # levelized oracle (and obfuscated) circuits with the same input and output order
+    oracle_cir = bench2circuit(original)
+    oracle_cir.create_ce_circuit()
+    if obfuscated is None:
+        return oracle_cir
+    obf_cir = bench2circuit(obfuscated)
+    obf_cir.create_ce_circuit()
+    sort_circuits(oracle_cir, obf_cir)
+    return oracle_cir, obf_cir
+
+
+def random_sequences(circuit, count, depth, seed=0):
+    rng = random.Random(seed)
+    n = len(circuit.input_wires)
+    return [[[rng.random() < 0.5 for i in range(n)] for d in range(depth)] for s in range(count)]
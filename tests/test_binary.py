@@ -0,0 +1,95 @@
+import os
+import pytest
+from file import cache
+from file.bench import bench2netlist, load_circuit
+from file.binary import HEADER, netlist_arrays, read_binary, write_binary
+from helpers import bench
+
+
+def netlist_wires(netlist):
+    wires = netlist.to_wires()
+    return dict((w, (wires[w].type, list(wires[w].operands))) for w in wires)
+
+
+def test_binary_round_trip(tmp_path):
+    path = str(tmp_path / 's27.rnl')
+    netlist = bench2netlist(bench('original', 's27.bench'))
+    netlist.levelize()
+    write_binary(path, netlist)
+    loaded = read_binary(path)
+    assert netlist_wires(loaded) == netlist_wires(netlist)
+    for name in ('inputs', 'outputs', 'keys', 'order', 'level'):
+        assert list(getattr(loaded, name)) == list(getattr(netlist, name))
+
+    # the numpy arrays are read-only views of the mapped file
+    arrays = netlist_arrays(loaded)
+    assert not arrays['gate_out'].flags.owndata and not arrays['gate_out'].flags.writeable
+    assert list(arrays['fanin']) == list(netlist.fanin)
+
+    circuit = load_circuit(path)
+    assert circuit.output_wires == load_circuit(bench('original', 's27.bench')).output_wires
+
+
+def test_binary_rejects_other_files(tmp_path):
+    assert read_binary(bench('original', 's27.bench')) is None
+    assert read_binary(str(tmp_path / 'missing.rnl')) is None
+
+
+def test_binary_rejects_truncated_files(tmp_path):
+    path = str(tmp_path / 's27.rnl')
+    netlist = bench2netlist(bench('original', 's27.bench'))
+    netlist.levelize()
+    write_binary(path, netlist)
+    with open(path, 'rb') as f:
+        data = f.read()
+    # the last section is followed by up to 7 padding bytes
+    for size in (HEADER.size, HEADER.size + 8, len(data) // 2, len(data) - 8):
+        with open(path, 'wb') as f:
+            f.write(data[:size])
+        assert read_binary(path) is None, size
+
+
+def damage(netlist, name):
+    # edits that leave the file readable but point outside of its names or gates
+    n = len(netlist.names)
+    if name == 'fanin':
+        netlist.fanin[3] = n
+    elif name == 'gate_out':
+        netlist.gate_out[0] = -1
+    elif name == 'fanin_ptr':
+        netlist.fanin_ptr[2], netlist.fanin_ptr[3] = netlist.fanin_ptr[3], netlist.fanin_ptr[2]
+    elif name == 'inputs':
+        netlist.inputs[0] = n + 100
+    elif name == 'gate_type':
+        netlist.gate_type[0] = 100
+    elif name == 'order':
+        netlist.order[0] = len(netlist.gate_out)
+
+
+@pytest.mark.parametrize('name', ['fanin', 'gate_out', 'fanin_ptr', 'inputs', 'gate_type', 'order', 'names'])
+def test_binary_rejects_damaged_arrays(tmp_path, name):
+    path = str(tmp_path / 's27.rnl')
+    netlist = bench2netlist(bench('original', 's27.bench'))
+    netlist.levelize()
+    damage(netlist, name)
+    write_binary(path, netlist)
+    if name == 'names':
+        # the header counts one more name than the file has
+        with open(path, 'r+b') as f:
+            header = list(HEADER.unpack(f.read(HEADER.size)))
+            header[3] += 1
+            f.seek(0)
+            f.write(HEADER.pack(*header))
+    assert read_binary(path) is None
+
+
+def test_cache_reparses_damaged_files(tmp_path, monkeypatch):
+    # a damaged cache file is a miss, the source is parsed again and the cache file replaced
+    monkeypatch.setattr(cache, 'CACHE_PATH', str(tmp_path))
+    path = bench('original', 's27.bench')
+    netlist = cache.cached_netlist(path, 'bench', bench2netlist)
+    cached = cache.cache_file(path, 'bench')
+    with open(cached, 'r+b') as f:
+        f.truncate(os.path.getsize(cached) // 2)
+    assert netlist_wires(cache.cached_netlist(path, 'bench', bench2netlist)) == netlist_wires(netlist)
+    assert netlist_wires(read_binary(cached)) == netlist_wires(netlist)
@@ -0,0 +1,30 @@
+from helpers import bench, load_pair
+from sat.checkpoint import load_checkpoint, save_checkpoint
+
+
+def checkpoint_state(circuit):
+    n_in = len(circuit.input_wires)
+    n_out = len(circuit.output_wires)
+    dis = [([[bool((i + d + j) % 3) for j in range(n_in)] for d in range(depth)],
+            [[bool((i * d + j) % 2) for j in range(n_out)] for d in range(depth)])
+           for i, depth in enumerate([1, 3, 2])]
+    return {'iteration': 3, 'unroll_depth': 3, 'boundary': 20, 'highest_depth': 3, 'dis': dis}
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / 'attack.ckpt')
+    oracle_cir, obf_cir = load_pair(bench('original', 's1423.bench'), bench('rnd', 's1423_5.bench'))
+    state = checkpoint_state(obf_cir)
+    save_checkpoint(path, obf_cir, state)
+    assert load_checkpoint(path, obf_cir) == state
+
+    # a checkpoint of another circuit is refused
+    assert load_checkpoint(path, load_pair(bench('original', 's27.bench'))) is None
+
+    # so is a damaged one
+    with open(path, 'r+b') as f:
+        f.seek(40)
+        b = f.read(1)
+        f.seek(40)
+        f.write(bytes([b[0] ^ 1]))
+    assert load_checkpoint(path, obf_cir) is None
@@ -0,0 +1,123 @@
+import os
+import random
+import pytest
+from common.circuit import Circuit, Wire
+from common.netlist import netlist2circuit
+from file.bench import bench2circuit, bench2netlist
+from file.verilog import read_verilog_wires, verilog2circuit
+from helpers import ROOT, bench
+
+
+def check_levels(circuit):
+    # gates come after their operands and a gate is one level above its deepest operand, dffs and inputs are 0
+    wires = circuit.wire_objs
+    assert sorted(circuit.sorted_wires) == sorted(wires)
+    position = dict((w, i) for i, w in enumerate(circuit.sorted_wires))
+    for w in circuit.sorted_wires:
+        wire = wires[w]
+        if wire.type == Wire.DFF:
+            assert wire.logic_level == 0
+            continue
+        operands = [o for o in wire.operands if o in wires]
+        assert all(position[o] < position[w] for o in operands)
+        assert wire.logic_level == 1 + max([wires[o].logic_level for o in operands] + [0])
+    assert circuit.max_level == max(wires[w].logic_level for w in wires)
+
+
+@pytest.mark.parametrize('name', ['c432', 's27', 's1423'])
+def test_levelize(name):
+    circuit = bench2circuit(bench('original', name + '.bench'))
+    circuit.create_ce_circuit()
+    check_levels(circuit)
+
+
+def test_levelize_after_edits():
+    # the order of a levelized netlist is used until its wires are handed out, in place edits are levelized again
+    path = bench('original', 'c432.bench')
+    netlist = bench2netlist(path)
+    netlist.levelize()
+    circuit = netlist2circuit(netlist, path)
+    circuit.levelize()
+    check_levels(circuit)
+
+    # an early gate reads the last one, which does not depend on it
+    wires = circuit.wire_objs
+    last = circuit.sorted_wires[-1]
+    cone = set()
+    stack = [last]
+    while stack:
+        w = stack.pop()
+        if w in wires and w not in cone:
+            cone.add(w)
+            stack.extend(wires[w].operands)
+    first = next(w for w in circuit.sorted_wires if w not in cone)
+    wires[first].operands.append(last)
+    circuit.levelize()
+    check_levels(circuit)
+    assert circuit.sorted_wires.index(last) < circuit.sorted_wires.index(first)
+
+
+def test_levelize_finds_loops():
+    circuit = bench2circuit(bench('original', 'c432.bench'))
+    a, b = list(circuit.wire_objs)[-2:]
+    circuit.wire_objs[a] = Wire(a, 'and', [b, circuit.input_wires[0]])
+    circuit.wire_objs[b] = Wire(b, 'or', [a, circuit.input_wires[1]])
+    with pytest.raises(SystemExit):
+        circuit.levelize()
+
+
+def fanout_state(circuit):
+    # the fanout index and the fanout counts of the wires, readers in any order
+    index = dict((w, sorted(r)) for w, r in circuit.fanout_index.items() if r)
+    counts = dict((w, (sorted(circuit.wire_objs[w].fanouts), circuit.wire_objs[w].fanout)) for w in circuit.wire_objs)
+    return index, counts
+
+
+def rebuilt_state(circuit):
+    # a copy of the circuit with a fanout index built from scratch
+    fresh = Circuit(circuit.name)
+    fresh.wire_objs = dict((w, Wire(w, v.type, list(v.operands))) for w, v in circuit.wire_objs.items())
+    fresh.build_fanout_index()
+    return fanout_state(fresh)
+
+
+@pytest.mark.parametrize('path', [bench('original', 's27.bench'),
+                                  os.path.join(ROOT, 'benchmarks', 'verilog', 'original', 's27.v')])
+def test_fanouts_after_parsing(path):
+    # the fanout counts are known as soon as the wires are, without a call to fan_outs
+    if path.endswith('.bench'):
+        circuit = bench2circuit(path)
+    else:
+        circuit = verilog2circuit(path)
+        circuit.wire_objs = read_verilog_wires(path, 'generic')
+    wires = circuit.wire_objs
+    readers = dict((w, set()) for w in wires)
+    for w in wires:
+        for o in wires[w].operands:
+            if o in readers:
+                readers[o].add(w)
+    assert dict((w, wires[w].fanout) for w in wires) == dict((w, len(readers[w])) for w in wires)
+    assert any(wires[w].fanout for w in wires)
+
+
+def test_fanout_index_edits():
+    # add, replace, remove and rename wires and compare the kept index with a rebuilt one after every edit
+    rng = random.Random(0)
+    circuit = bench2circuit(bench('original', 'c432.bench'))
+    circuit.build_fanout_index()
+    for i in range(300):
+        names = list(circuit.wire_objs)
+        drivers = names + circuit.input_wires
+        op = rng.randrange(4)
+        if op == 0:
+            circuit.add_wire(Wire('new{}'.format(i), 'and', rng.sample(drivers, 2)))
+        elif op == 1:
+            # replaces the wire and its operands, readers stay
+            circuit.add_wire(Wire(rng.choice(names), 'or', [rng.choice(drivers), rng.choice(drivers)]))
+        elif op == 2:
+            unread = [w for w in names if not circuit.fan_outs(w)]
+            if unread:
+                circuit.remove_wire(rng.choice(unread))
+        else:
+            circuit.rename_wire(rng.choice(names), 'renamed{}'.format(i))
+        assert fanout_state(circuit) == rebuilt_state(circuit), i
@@ -0,0 +1,53 @@
+import random
+import pytest
+from helpers import bench, load_pair, random_sequences
+from sim.simulator import Simulator
+
+pytest.importorskip('pysat')
+from sat.cnf import CircuitTemplate, SatSolver
+
+
+def outputs(solver, template, m, circuit):
+    return [solver.value(l) for l in template.lits(m, circuit.output_wires)]
+
+
+@pytest.mark.parametrize('name', ['c432_enc05', 'c880_enc25'])
+def test_template_matches_simulator(name):
+    oracle_cir, obf_cir = load_pair(bench('original', name.split('_')[0] + '.bench'), bench('dac12', name + '.bench'))
+    template = CircuitTemplate(obf_cir)
+    simulator = Simulator(obf_cir)
+    rng = random.Random(0)
+    for pattern in random_sequences(obf_cir, 20, 1):
+        keys = [[rng.random() < 0.5 for w in obf_cir.key_wires] for i in range(2)]
+        solver = SatSolver('glucose4')
+        # two instances with different keys, the second one shares the key independent wires of the first
+        m = None
+        instances = []
+        for key in keys:
+            binding = dict(zip(obf_cir.input_wires, pattern[0]))
+            binding.update(zip(obf_cir.key_wires, key))
+            clauses, m = template.instantiate(binding, solver.new_var, m)
+            solver.add_clauses(clauses)
+            instances.append(m)
+        assert solver.solve()
+        for key, m in zip(keys, instances):
+            assert outputs(solver, template, m, obf_cir) == simulator.simulate([pattern], key)[0][0]
+
+
+def test_bound_outputs_constrain_the_key():
+    # an instance with its outputs bound to the oracle response only allows keys that produce it
+    oracle_cir, obf_cir = load_pair(bench('original', 'c432.bench'), bench('dac12', 'c432_enc05.bench'))
+    template = CircuitTemplate(obf_cir)
+    solver = SatSolver('glucose4')
+    keys = dict((w, solver.new_var()) for w in obf_cir.key_wires)
+    patterns = random_sequences(obf_cir, 30, 1)
+    responses = Simulator(oracle_cir).simulate(patterns)
+    for pattern, response in zip(patterns, responses):
+        binding = dict(zip(obf_cir.input_wires, pattern[0]))
+        binding.update(keys)
+        binding.update(zip(obf_cir.output_wires, response[0]))
+        clauses, m = template.instantiate(binding, solver.new_var)
+        solver.add_clauses(clauses)
+    assert solver.solve()
+    key = [solver.value(keys[w]) for w in obf_cir.key_wires]
+    assert Simulator(obf_cir).simulate(patterns, key) == responses
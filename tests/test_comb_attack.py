@@ -0,0 +1,83 @@
+from argparse import Namespace
+import pysmt.shortcuts as pysmt
+import pytest
+from helpers import bench, bench_key, load_pair, random_sequences
+
+pytest.importorskip('pysat')
+pytest.importorskip('numpy')
+from sat.comb_attack import CombAttack
+from sim.simulator import Simulator
+
+
+def comb_args(original, obfuscated, **options):
+    # the flags of sat/comb_attack.py with their defaults
+    args = Namespace(p=0, b=original, o=obfuscated, q='sim', e='cnf', s=None, f=None, j=None, n=1, v=0, a=0,
+                     r=0.01, m=1024, x=False)
+    for k, v in options.items():
+        setattr(args, k, v)
+    return args
+
+
+def run(original, obfuscated, **options):
+    attacker = CombAttack(comb_args(original, obfuscated, **options))
+    attacker.perform()
+    return attacker
+
+
+def write_partitioned(tmp_path, groups):
+    # groups of outputs that share no key input: o{i} = (a{i} ^ b{i}) & c{i}, p{i} = !((a{i} | c{i}) & b{i})
+    # and q{i} = (a{i} ^ b{i}) & (a{i} | c{i}), t{i} and u{i} are locked by a xor and a xnor key gate,
+    # so the correct key is 01 per group
+    inputs = []
+    original = []
+    locked = []
+    for i in range(groups):
+        inputs += ['a{}'.format(i), 'b{}'.format(i), 'c{}'.format(i)]
+        original += ['t{0} = XOR(a{0}, b{0})'.format(i), 'u{0} = OR(a{0}, c{0})'.format(i),
+                     'o{0} = AND(t{0}, c{0})'.format(i), 'p{0} = NAND(u{0}, b{0})'.format(i),
+                     'q{0} = AND(t{0}, u{0})'.format(i)]
+        locked += ['t{0} = XOR(a{0}, b{0})'.format(i), 'tk{0} = XOR(t{0}, keyinput{1})'.format(i, 2 * i),
+                   'u{0} = OR(a{0}, c{0})'.format(i), 'uk{0} = XNOR(u{0}, keyinput{1})'.format(i, 2 * i + 1),
+                   'o{0} = AND(tk{0}, c{0})'.format(i), 'p{0} = NAND(uk{0}, b{0})'.format(i),
+                   'q{0} = AND(tk{0}, uk{0})'.format(i)]
+    outputs = ['OUTPUT({}{})'.format(o, i) for i in range(groups) for o in 'opq']
+    keys = ['INPUT(keyinput{})'.format(i) for i in range(2 * groups)]
+    paths = []
+    for name, gates, extra in (('orig', original, []), ('locked', locked, keys)):
+        path = str(tmp_path / (name + '.bench'))
+        with open(path, 'w') as f:
+            f.write('\n'.join(['INPUT({})'.format(w) for w in inputs] + extra + outputs + gates) + '\n')
+        paths.append(path)
+    return paths[0], paths[1], '01' * groups
+
+
+def test_partitioned_attack(tmp_path):
+    original, obfuscated, key = write_partitioned(tmp_path, 3)
+    whole = run(original, obfuscated)
+    partitioned = run(original, obfuscated, j=2)
+    assert [p[1] for p in partitioned.partitions] == [['o0', 'p0', 'q0'], ['o1', 'p1', 'q1'], ['o2', 'p2', 'q2']]
+    assert whole.key == partitioned.key == key
+
+
+def test_partitioned_attack_on_bench():
+    # a single partition, the dip loop runs in a worker process
+    original = bench('original', 'c432.bench')
+    obfuscated = bench('dac12', 'c432_enc05.bench')
+    assert run(original, obfuscated, j=2).key == run(original, obfuscated).key == bench_key(obfuscated)
+
+
+@pytest.mark.parametrize('engine', ['cnf', 'smt'])
+def test_batched_attack(engine):
+    # c880_enc05 has several correct keys, so the keys of both runs are checked against the oracle
+    original = bench('original', 'c880.bench')
+    obfuscated = bench('dac12', 'c880_enc05.bench')
+    if engine == 'smt' and 'z3' not in pysmt.get_env().factory.all_solvers():
+        pytest.skip('z3 is not installed')
+    solver = 'z3' if engine == 'smt' else None
+    single = run(original, obfuscated, e=engine, s=solver)
+    batched = run(original, obfuscated, e=engine, s=solver, n=4)
+    oracle_cir, obf_cir = load_pair(original, obfuscated)
+    sequences = random_sequences(oracle_cir, 4096, 1)
+    responses = Simulator(oracle_cir).simulate(sequences)
+    for key in (single.key, batched.key):
+        assert Simulator(obf_cir).simulate(sequences, [c == '1' for c in key]) == responses
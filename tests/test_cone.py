@@ -0,0 +1,48 @@
+import pytest
+from common.circuit import Wire
+from file.bench import bench2circuit
+from helpers import bench, load_pair
+
+
+def test_max_dep_after_parsing():
+    # max_dep levelizes the circuit on demand, like it needed nothing before the cone index
+    circuit = bench2circuit(bench('original', 'c432.bench'))
+    depths = dict((w, circuit.max_dep(w)) for w in circuit.output_wires)
+    circuit.levelize()
+    assert depths == dict((w, circuit.wire_objs[w].logic_level) for w in circuit.output_wires)
+    assert circuit.max_dep(circuit.input_wires[0]) == 0
+
+
+def reference_cone(circuit, wire):
+    # wires and sources reachable backwards from wire, dffs end the search unless they are the wire itself
+    cone = set()
+    stack = [wire]
+    while stack:
+        w = stack.pop()
+        if w in cone:
+            continue
+        cone.add(w)
+        if w in circuit.wire_objs and (w == wire or circuit.wire_objs[w].type != Wire.DFF):
+            stack.extend(circuit.wire_objs[w].operands)
+    return cone
+
+
+@pytest.mark.parametrize('name', ['c432', 's27', 's1423'])
+def test_cone_index(name):
+    circuit = load_pair(bench('original', name + '.bench'))
+    cones = circuit.cones()
+    sources = set(circuit.input_wires) | set(circuit.state_wires)
+    for w in circuit.wire_objs:
+        cone = reference_cone(circuit, w)
+        assert set(cones.wire_names(cones.fanin(w))) == cone
+        if circuit.wire_objs[w].type != Wire.DFF:
+            assert set(cones.wire_names(cones.support(w))) == cone & sources
+        assert cones.depth(w) == circuit.wire_objs[w].logic_level
+
+    # without dffs the fanin cone is the one of get_fanin_cone and fanout cones are the reverse of fanin cones
+    if not circuit.state_wires:
+        for w in circuit.output_wires:
+            assert set(cones.wire_names(cones.fanin(w))) == set(circuit.get_fanin_cone(w))
+        for v in circuit.input_wires:
+            assert set(cones.wire_names(cones.fanout(v))) == \
+                set(w for w in circuit.wire_objs if v in reference_cone(circuit, w)) | {v}
@@ -0,0 +1,83 @@
+import itertools
+import random
+import re
+import pytest
+
+nx = pytest.importorskip('networkx')
+from graph.cycle import acyclic_constraints, cyclic_components
+
+
+def holds(definitions, conditions, values):
+    # evaluates the verilog wires and conditions for the given key values
+    env = dict(values)
+
+    def py(expr):
+        return re.sub(r'!', ' not ', expr.replace('&&', ' and ').replace('||', ' or '))
+    for d in definitions:
+        name, expr = re.match(r'wire (\S+) = (.*);', d).groups()
+        env[name] = eval(py(expr), {}, env)
+    return all(eval(py(c), {}, env) for c in conditions)
+
+
+def check(edges, keyed):
+    # the constraints should hold exactly for the keys that leave the enabled graph acyclic
+    G = nx.DiGraph(edges)
+    definitions = []
+    conditions = []
+    for i, scc in enumerate(cyclic_components(G)):
+        d, c = acyclic_constraints(G, scc, lambda u, w: keyed.get((u, w)), 'p{}'.format(i))
+        definitions += d
+        conditions += c
+    keys = sorted(set(keyed.values()))
+    for bits in itertools.product([False, True], repeat=len(keys)):
+        values = dict(zip(keys, bits))
+        H = nx.DiGraph()
+        H.add_nodes_from(G)
+        H.add_edges_from(e for e in edges if e not in keyed or values[keyed[e]])
+        assert holds(definitions, conditions, values) == nx.is_directed_acyclic_graph(H), values
+
+
+def ring(nodes):
+    return [(nodes[i], nodes[(i + 1) % len(nodes)]) for i in range(len(nodes))]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_rings(seed):
+    # rings that share a node, every cycle has one feedback edge
+    rng = random.Random(seed)
+    for t in range(20):
+        rings = [['r{}'.format(r)] + ['n{}_{}'.format(r, i) for i in range(rng.randint(1, 4))]
+                 for r in range(rng.randint(1, 3))]
+        for r in rings[1:]:
+            r[0] = rings[0][0]
+        edges = [e for r in rings for e in ring(r)]
+        keyed = dict((e, 'k{}'.format(i)) for i, e in enumerate(edges) if rng.random() < 0.7)
+        if len(keyed) > 10 or any(not any(e in keyed for e in ring(r)) for r in rings):
+            continue
+        check(edges, keyed)
+
+
+def test_components():
+    G = nx.DiGraph(ring('abc') + ring('de') + [('c', 'd'), ('f', 'f'), ('g', 'h')])
+    assert cyclic_components(G) == [{'a', 'b', 'c'}, {'d', 'e'}, {'f'}]
+
+
+def test_cycle_through_two_feedback_edges():
+    # a -> c -> b -> a is only found if cycles through several dfs back edges are ruled out
+    edges = [(u, w) for u in 'abc' for w in 'abc' if u != w]
+    check(edges, dict((e, 'k{}'.format(i)) for i, e in enumerate(edges)))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_graphs(seed):
+    rng = random.Random(seed)
+    for t in range(40):
+        nodes = ['n{}'.format(i) for i in range(rng.randint(3, 5))]
+        edges = [(u, w) for u in nodes for w in nodes if u != w and rng.random() < 0.5]
+        keyed = dict((e, 'k{}'.format(i)) for i, e in enumerate(edges) if rng.random() < 0.8)
+        if len(keyed) > 10:
+            continue
+        # cycles that no key can break are only reported
+        if not nx.is_directed_acyclic_graph(nx.DiGraph([e for e in edges if e not in keyed])):
+            continue
+        check(edges, keyed)
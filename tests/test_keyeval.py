@@ -0,0 +1,26 @@
+from helpers import bench, bench_key, load_pair
+from sim.keyeval import KeyEvaluator
+from sim.simulator import Simulator
+
+
+def test_key_evaluator():
+    oracle_cir, obf_cir = load_pair(bench('original', 'c432.bench'), bench('dac12', 'c432_enc05.bench'))
+    key = bench_key(bench('dac12', 'c432_enc05.bench'))
+    wrong = ''.join('1' if c == '0' else '0' for c in key)
+    results = KeyEvaluator(oracle_cir, obf_cir, seed=1).evaluate([key, wrong], 1000, max_failing=4)
+    assert results[0]['error_rate'] == 0 and results[0]['hamming'] == 0 and results[0]['failing'] == []
+    assert results[1]['error_rate'] > 0 and results[1]['hamming'] >= results[1]['error_rate']
+
+    # the failing patterns are really answered wrong by the key
+    failing = results[1]['failing']
+    assert failing
+    bits = [c == '1' for c in wrong]
+    assert all(a != b for a, b in zip(Simulator(obf_cir).simulate(failing, bits),
+                                      Simulator(oracle_cir).simulate(failing)))
+
+
+def test_key_evaluator_sequential():
+    oracle_cir, obf_cir = load_pair(bench('original', 's1423.bench'), bench('rnd', 's1423_5.bench'))
+    results = KeyEvaluator(oracle_cir, obf_cir, seed=1).evaluate(['10011', '01100'], 500, depth=5)
+    assert results[0]['error_rate'] == 0
+    assert results[1]['error_rate'] > 0
@@ -0,0 +1,54 @@
+import json
+import multiprocessing
+import pysmt.shortcuts as pysmt
+import pytest
+from sat.portfolio import Portfolio, best_solver, load_winners, record_winner
+
+
+def writer(path, worker, rounds):
+    for r in range(rounds):
+        record_winner(path, 'c{}_{}'.format(worker, r % 5), {'z3': r, 'btor': worker})
+
+
+def test_concurrent_winners(tmp_path):
+    # every record of every writer survives and the file stays valid json
+    path = str(tmp_path / 'winners.json')
+    workers = [multiprocessing.Process(target=writer, args=(path, i, 40)) for i in range(6)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+        assert p.exitcode == 0
+    with open(path) as f:
+        winners = json.load(f)
+    assert sorted(winners) == sorted('c{}_{}'.format(i, r) for i in range(6) for r in range(5))
+    for i in range(6):
+        # the last record of circuit r of a writer is from round 35 + r, z3 answered more queries than btor
+        for r in range(5):
+            entry = winners['c{}_{}'.format(i, r)]
+            assert entry['wins'] == {'z3': 35 + r, 'btor': i}
+            assert entry['best'] == best_solver(path, 'c{}_{}'.format(i, r)) == 'z3'
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_winners_off(tmp_path):
+    record_winner(None, 'c432', {'z3': 1})
+    assert best_solver(None, 'c432') is None
+    path = str(tmp_path / 'winners.json')
+    record_winner(path, 'c432', {})
+    assert load_winners(path) == {}
+
+
+@pytest.mark.skipif('z3' not in pysmt.get_env().factory.all_solvers(), reason='z3 is not installed')
+def test_portfolio_answers():
+    portfolio = Portfolio(['z3', 'not_a_solver'])
+    try:
+        assert portfolio.names == ['z3']
+        a, b = pysmt.Symbol('a'), pysmt.Symbol('b')
+        portfolio.add_assertion(pysmt.Xor(a, b))
+        assert portfolio.is_sat(a)
+        assert portfolio.get_py_value(b) is False
+        assert not portfolio.is_sat(pysmt.And(a, b))
+        assert portfolio.wins == {'z3': 2}
+    finally:
+        portfolio.close()
@@ -0,0 +1,27 @@
+from argparse import Namespace
+import pysmt.shortcuts as pysmt
+import pytest
+from helpers import bench
+from main_sat import Config
+from sat.seq_attack import PyAttack
+
+pytest.importorskip('numpy')
+needs_z3 = pytest.mark.skipif('z3' not in pysmt.get_env().factory.all_solvers(), reason='z3 is not installed')
+
+
+def run(original, obfuscated, **options):
+    config = type('Config', (Config,), dict({'solver': 'z3'}, **options))
+    attacker = PyAttack(Namespace(p=0, b=original, o=obfuscated, t=600, f=None), config)
+    attacker.perform()
+    return attacker
+
+
+@needs_z3
+def test_batched_attack():
+    # several dis per round give the same key as one dis per round
+    original = bench('original', 's1423.bench')
+    obfuscated = bench('rnd', 's1423_5.bench')
+    single = run(original, obfuscated)
+    batched = run(original, obfuscated, batch=3)
+    assert batched.key == single.key == '10011'
+    assert batched.iteration >= single.iteration
@@ -0,0 +1,38 @@
+import pysmt.shortcuts as pysmt
+import pytest
+from helpers import bench, bench_key, load_pair, random_sequences
+from sat.oracle import SolverOracle
+from sim.simulator import Simulator, pack_patterns, unpack_patterns
+
+needs_z3 = pytest.mark.skipif('z3' not in pysmt.get_env().factory.all_solvers(), reason='z3 is not installed')
+
+
+def test_pack_unpack():
+    patterns = random_sequences(type('C', (), {'input_wires': range(7)}), 100, 1)
+    patterns = [s[0] for s in patterns]
+    assert unpack_patterns(pack_patterns(patterns, 7), 100) == patterns
+
+
+@needs_z3
+def test_combinational_matches_solver_oracle():
+    from sat.comb_attack import FormulaGenerator
+    oracle_cir, obf_cir = load_pair(bench('original', 'c432.bench'), bench('dac12', 'c432_enc05.bench'))
+    solver = SolverOracle(oracle_cir, FormulaGenerator(oracle_cir, obf_cir).oracle_ckt_at_frame, 'z3')
+    sequences = random_sequences(oracle_cir, 40, 1)
+    assert Simulator(oracle_cir).simulate(sequences) == solver.query(sequences)
+
+
+@needs_z3
+def test_sequential_matches_solver_oracle():
+    from sat.attack_comps import FormulaGenerator
+    oracle_cir, obf_cir = load_pair(bench('original', 's1423.bench'), bench('rnd', 's1423_5.bench'))
+    solver = SolverOracle(oracle_cir, FormulaGenerator(oracle_cir, obf_cir).oracle_ckt_at_frame, 'z3')
+    sequences = random_sequences(oracle_cir, 10, 4)
+    assert Simulator(oracle_cir).simulate(sequences) == solver.query(sequences)
+
+
+def test_correct_key_matches_oracle():
+    oracle_cir, obf_cir = load_pair(bench('original', 'c432.bench'), bench('dac12', 'c432_enc05.bench'))
+    key = [c == '1' for c in bench_key(bench('dac12', 'c432_enc05.bench'))]
+    sequences = random_sequences(oracle_cir, 200, 1)
+    assert Simulator(obf_cir).simulate(sequences, key) == Simulator(oracle_cir).simulate(sequences)
@@ -0,0 +1,44 @@
+import pytest
+from common.circuit import Circuit, Wire
+from common.strash import strash
+from helpers import bench, bench_key, load_pair, random_sequences
+from sim.simulator import Simulator
+
+
+def strashed(path):
+    circuit = load_pair(path)
+    strash(circuit)
+    circuit.create_ce_circuit()
+    return circuit
+
+
+@pytest.mark.parametrize('name, depth', [('c432', 1), ('c880', 1), ('s27', 6), ('s1423', 4)])
+def test_strash_is_equivalent(name, depth):
+    original = load_pair(bench('original', name + '.bench'))
+    circuit = strashed(bench('original', name + '.bench'))
+    assert circuit.input_wires == original.input_wires and circuit.output_wires == original.output_wires
+    sequences = random_sequences(original, 256, depth)
+    assert Simulator(circuit).simulate(sequences) == Simulator(original).simulate(sequences)
+
+
+def test_strash_keeps_the_key():
+    path = bench('dac12', 'c432_enc25.bench')
+    original = load_pair(bench('original', 'c432.bench'))
+    circuit = strashed(path)
+    key = [c == '1' for c in bench_key(path)]
+    sequences = random_sequences(original, 256, 1)
+    assert Simulator(circuit).simulate(sequences, key) == Simulator(original).simulate(sequences)
+
+
+def test_strash_tags():
+    # gates keep their instance name unless strash changes their cell
+    circuit = Circuit('tags')
+    circuit.input_wires = ['a', 'b']
+    circuit.key_wires = []
+    circuit.output_wires = ['y']
+    circuit.wire_objs = {'n1': Wire('n1', 'nand', ['a', 'a']), 'y': Wire('y', 'and', ['n1', 'b'])}
+    circuit.wire_objs['n1'].tag = 'U1'
+    circuit.wire_objs['y'].tag = 'U2'
+    wires = strash(circuit).wire_objs
+    assert (wires['n1'].type, wires['n1'].operands, wires['n1'].tag) == ('not', ['a'], 0)
+    assert wires['y'].tag == 'U2'
@@ -0,0 +1,91 @@
+import os
+import shutil
+import subprocess
+from re import MULTILINE, findall
+import pytest
+from file.verilog import verilog2circuit
+from formal.attack_comps import AttackComponents
+from formal.utils import write_verilog
+from formal.symbiyosys import PREP_PASSES, PREPARED, SymbiInterface
+
+MODULES = ['benchmarks/verilog/original/dff.v', 'benchmarks/verilog/original/s27.v', 'benchmarks/verilog/rnd/s27_2.v']
+
+
+def sections(text):
+    # the lines of every [section] of an sby file
+    result = {}
+    for line in text.splitlines():
+        if line.startswith('['):
+            lines = result[line.strip('[]')] = []
+        elif line:
+            lines.append(line)
+    return result
+
+
+def sby(tmp_path, cache_rtlil, mode):
+    config = type('Config', (), {'engine': 'yices', 'enable_async': False, 'cache_rtlil': cache_rtlil,
+                                 'module_paths': MODULES, 'exe_path': str(tmp_path) + '/',
+                                 'design_path': str(tmp_path) + '/s27/'})
+    solver = SymbiInterface(config, 's27')
+    # the elaborated designs are not built, yosys is not run
+    solver.rtlil = config.design_path + 'designs.il'
+    solver.gen_config(mode, 5)
+    with open(config.exe_path + 's27.sby') as f:
+        return sections(f.read())
+
+
+@pytest.mark.parametrize('mode, top', [('dis', 'uc'), ('ce', 'ce'), ('fk', 'ce'), ('umc', 'umc')])
+def test_verilog_mode(tmp_path, mode, top):
+    s = sby(tmp_path, False, mode)
+    reads = ['read_verilog dff.v', 'read_verilog s27.v', 'read_verilog s27_2.v']
+    files = MODULES + [str(tmp_path) + '/main.sv']
+    if mode == 'ce':
+        reads.append('read_verilog obf_ce.v')
+        files.append(str(tmp_path) + '/obf_ce.v')
+    assert s['script'] == reads + ['read -formal main.sv', 'prep -top ' + top]
+    assert s['files'] == files
+
+
+@pytest.mark.parametrize('mode, top', [('dis', 'uc'), ('ce', 'ce'), ('fk', 'ce'), ('umc', 'umc')])
+def test_rtlil_mode(tmp_path, mode, top):
+    s = sby(tmp_path, True, mode)
+    reads = ['read_rtlil designs.il']
+    files = [str(tmp_path) + '/s27/designs.il', str(tmp_path) + '/main.sv']
+    if mode == 'ce':
+        reads.append('read_verilog obf_ce.v')
+        files.append(str(tmp_path) + '/obf_ce.v')
+    # the verilog designs are not read again and only the modules that are not prepared go through prep
+    prep = ['{} A:{} %n'.format(p, PREPARED) for p in PREP_PASSES]
+    assert s['script'] == reads + ['read -formal main.sv', 'hierarchy -check -top ' + top] + prep
+    assert s['files'] == files
+
+
+@pytest.mark.skipif(shutil.which('yosys') is None, reason='yosys is not installed')
+def test_rtlil_script_runs(tmp_path):
+    # the script of an rtlil mode run is accepted by yosys and only the modules of main.sv are prepared again
+    config = type('Config', (), {'engine': 'yices', 'enable_async': False, 'cache_rtlil': True,
+                                 'module_paths': MODULES, 'exe_path': str(tmp_path) + '/',
+                                 'design_path': str(tmp_path) + '/s27/'})
+    os.makedirs(config.design_path)
+    solver = SymbiInterface(config, 's27')
+    solver.gen_config('dis', 5)
+    org_cir = verilog2circuit(MODULES[1])
+    obf_cir = verilog2circuit(MODULES[2])
+    attack_comps = AttackComponents(org_cir, obf_cir, False, '', '')
+    attack_comps.get_dip_gen([])
+    write_verilog(attack_comps.main, 'main.sv', config.exe_path)
+    with open(config.exe_path + 'main.sv') as f:
+        wrappers = findall(r'^module (\w+)', f.read(), MULTILINE)
+
+    # sby copies the files next to each other
+    shutil.copy(solver.rtlil, config.exe_path)
+    with open(config.exe_path + 's27.sby') as f:
+        script = '; '.join(sections(f.read())['script'])
+    script += '; check -assert; tee -q -o modules.txt select -list-mod; tee -q -o new.txt select -list-mod A:{} %n'
+    subprocess.check_call(['yosys', '-q', '-p', script.format(PREPARED)], cwd=config.exe_path,
+                          stdout=subprocess.DEVNULL)
+    with open(config.exe_path + 'modules.txt') as f:
+        modules = f.read().split()
+    with open(config.exe_path + 'new.txt') as f:
+        assert sorted(f.read().split()) == sorted(m for m in modules if m in wrappers)
+    assert {'uc', 'dff', 's27_obf'} <= set(modules)
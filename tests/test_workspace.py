@@ -0,0 +1,53 @@
+import os
+from argparse import Namespace
+import pytest
+
+pytest.importorskip('pyverilog')
+from formal.seq_attack_formal import SeqAttack
+
+
+def attacker(tmp_path, scratch=None, keep_failed=False):
+    config = type('Config', (), {'exe_path': str(tmp_path) + '/', 'scratch_path': scratch,
+                                 'keep_failed': keep_failed})
+    attack = SeqAttack(Namespace(f=None), config)
+    attack.obf_cir = type('Circuit', (), {'name': 's27_obf'})
+    attack.create_workspace()
+    return attack
+
+
+def test_concurrent_workspaces(tmp_path):
+    # runs on the same design share the design folder and work in folders of their own
+    a = attacker(tmp_path)
+    b = attacker(tmp_path)
+    assert a.config.design_path == b.config.design_path == str(tmp_path) + '/s27_obf/'
+    assert a.workspace != b.workspace
+    assert os.path.dirname(a.workspace.rstrip('/')) + '/' == a.config.design_path
+    assert a.config.exe_path == a.workspace and os.path.isdir(a.workspace)
+
+
+def test_scratch_workspace(tmp_path):
+    a = attacker(tmp_path / 'root', scratch=str(tmp_path / 'scratch') + '/')
+    assert a.config.design_path == str(tmp_path / 'root' / 's27_obf') + '/' and os.path.isdir(a.config.design_path)
+    assert os.path.dirname(a.workspace.rstrip('/')) == str(tmp_path / 'scratch' / 's27_obf')
+
+
+@pytest.mark.parametrize('failed, keep_failed, kept', [(False, True, False), (True, True, True), (True, False, False)])
+def test_remove_workspace(tmp_path, failed, keep_failed, kept):
+    a = attacker(tmp_path, keep_failed=keep_failed)
+    with open(a.workspace + 'main.sv', 'w') as f:
+        f.write('')
+    a.remove_workspace(failed)
+    assert os.path.isdir(a.workspace) == kept
+    assert os.path.isdir(a.config.design_path)
+
+
+def test_keep_failed_scratch_workspace(tmp_path):
+    # a failed run in scratch space is moved under the design folder of the root
+    a = attacker(tmp_path / 'root', scratch=str(tmp_path / 'scratch') + '/', keep_failed=True)
+    with open(a.workspace + 'main.sv', 'w') as f:
+        f.write('failed')
+    a.remove_workspace(True)
+    assert not os.path.exists(a.workspace)
+    kept = a.config.design_path + os.path.basename(a.workspace.rstrip('/')) + '/'
+    with open(kept + 'main.sv') as f:
+        assert f.read() == 'failed'